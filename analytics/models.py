@@ -32,6 +32,7 @@ class UserProfile(models.Model):
     registration_ipv6 = models.GenericIPAddressField(_('Registration IPv6'), protocol='IPv6', null=True, blank=True, help_text=_('IPv6 address at registration'))
     last_login_ipv4 = models.GenericIPAddressField(_('Last login IPv4'), protocol='IPv4', null=True, blank=True, help_text=_('IPv4 address at last login'))
     last_login_ipv6 = models.GenericIPAddressField(_('Last login IPv6'), protocol='IPv6', null=True, blank=True, help_text=_('IPv6 address at last login'))
+    updated_at = models.DateTimeField(_('Updated At'), auto_now=True)
 
     class Meta:
         verbose_name = _('User Profile')
@@ -39,6 +40,13 @@ class UserProfile(models.Model):
     
     def __str__(self):
         return _("Profile for %(username)s") % {'username': self.user.username}
+    
+    def save(self, *args, **kwargs):
+        # Cached previews (core.previews) are keyed by updated_at, so partial saves bump it too
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None and 'updated_at' not in update_fields:
+            kwargs['update_fields'] = list(update_fields) + ['updated_at']
+        super().save(*args, **kwargs)
 
 class EmailFooter(models.Model):
     """Email footer template for users."""
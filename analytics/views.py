@@ -11,9 +11,10 @@ from rest_framework.response import Response
 from django.db import models
 
 from .models import UserProfile, EmailFooter
+from campaigns.counters import load_counts
 from campaigns.models import Campaign, EmailEvent
 from subscribers.models import List
-from campaigns.tasks import process_email_click
+from campaigns.ingest import record_click, record_open
 
 
 @login_required
@@ -28,23 +29,25 @@ def analytics_dashboard(request):
     total_subscribers = sum(list_obj.subscribers.count() for list_obj in lists)
     active_subscribers = sum(list_obj.subscribers.filter(is_active=True).count() for list_obj in lists)
     total_campaigns = campaigns.count()
-    total_emails_sent = sum(campaign.sent_count for campaign in campaigns)
-    total_emails_opened = sum(campaign.open_count for campaign in campaigns)
-    total_emails_clicked = sum(campaign.click_count for campaign in campaigns)
+    load_counts(campaigns)
+    total_emails_sent = sum(campaign.counts['sent_count'] for campaign in campaigns)
+    total_emails_opened = sum(campaign.counts['open_count'] for campaign in campaigns)
+    total_emails_clicked = sum(campaign.counts['click_count'] for campaign in campaigns)
     
     # Calculate open and click rates
     open_rate = (total_emails_opened / total_emails_sent * 100) if total_emails_sent > 0 else 0
     click_rate = (total_emails_clicked / total_emails_sent * 100) if total_emails_sent > 0 else 0
     
     # Get recent campaign activity
-    recent_campaigns = Campaign.objects.filter(user=request.user).order_by('-created_at')[:5]
+    recent_campaigns = list(Campaign.objects.filter(user=request.user).order_by('-created_at')[:5])
+    load_counts(recent_campaigns)
     recent_campaign_data = [
         {
             'id': str(campaign.id),
             'name': campaign.name,
-            'sent': campaign.sent_count,
-            'opened': campaign.open_count,
-            'clicked': campaign.click_count,
+            'sent': campaign.counts['sent_count'],
+            'opened': campaign.counts['open_count'],
+            'clicked': campaign.counts['click_count'],
             'open_rate': campaign.open_rate,
             'click_rate': campaign.click_rate,
         }
@@ -221,12 +224,12 @@ def campaign_analytics(request, campaign_id):
         'campaign': {
             'id': str(campaign.id),
             'name': campaign.name,
-            'sent': campaign.sent_count,
-            'opened': campaign.open_count,
-            'clicked': campaign.click_count,
-            'bounced': campaign.bounce_count,
-            'unsubscribed': campaign.unsubscribe_count,
-            'complained': campaign.complaint_count,
+            'sent': campaign.counts['sent_count'],
+            'opened': campaign.counts['open_count'],
+            'clicked': campaign.counts['click_count'],
+            'bounced': campaign.counts['bounce_count'],
+            'unsubscribed': campaign.counts['unsubscribe_count'],
+            'complained': campaign.counts['complaint_count'],
             'open_rate': campaign.open_rate,
             'click_rate': campaign.click_rate,
             'delivery_rate': campaign.delivery_rate,
@@ -286,48 +289,11 @@ def track_open(request, tracking_id, encoded_email):
     # This is the old URL format: /analytics/track/open/<uuid>/<email>/
     # Process tracking the same way as message_split_gif but return old-style pixel
     from urllib.parse import unquote
-    import logging
-    logger = logging.getLogger(__name__)
     
     subscriber_email = unquote(encoded_email)
     if subscriber_email:
-        # Always process synchronously (no Celery)
-        try:
-            from campaigns.models import EmailEvent, Campaign
-            # Find the sent event with the same tracking ID
-            sent_event = EmailEvent.objects.get(
-                id=tracking_id, 
-                event_type='sent',
-                subscriber_email=subscriber_email
-            )
-            
-            # Check if open event already exists to avoid duplicates
-            existing_open = EmailEvent.objects.filter(
-                email=sent_event.email,
-                subscriber_email=subscriber_email,
-                event_type='opened'
-            ).exists()
-            
-            if not existing_open:
-                # Create an open event
-                EmailEvent.objects.create(
-                    email=sent_event.email,
-                    subscriber_email=subscriber_email,
-                    event_type='opened'
-                )
-                
-                # Update campaign metrics
-                campaign = sent_event.email.campaign
-                campaign.open_count += 1
-                campaign.save(update_fields=['open_count'])
-                
-                logger.info(f"Recorded open event for {subscriber_email}")
-            else:
-                logger.debug(f"Open event already exists for {subscriber_email}, skipping duplicate")
-        except EmailEvent.DoesNotExist:
-            logger.error(f"No matching sent event found for tracking ID {tracking_id}, email: {subscriber_email}")
-        except Exception as e:
-            logger.error(f"Failed to process email open: {str(e)}", exc_info=True)
+        # Queued for the event writer (campaigns.ingest); no database work here
+        record_open(tracking_id, subscriber_email)
     
     # Return a transparent 1x1 pixel (old format for backwards compatibility)
     transparent_pixel = b'\x47\x49\x46\x38\x39\x61\x01\x00\x01\x00\x80\x00\x00\x00\x00\x00\x00\x00\x00\x21\xF9\x04\x01\x00\x00\x00\x00\x2C\x00\x00\x00\x00\x01\x00\x01\x00\x00\x02\x02\x44\x01\x00\x3B'
@@ -337,8 +303,6 @@ def track_open(request, tracking_id, encoded_email):
 def message_split_gif(request):
     """Serve a decorative separator image that also tracks email opens."""
     from urllib.parse import unquote
-    import logging
-    logger = logging.getLogger(__name__)
     
     # Get tracking parameters from query string (clean URL, no mention of tracking)
     tracking_id = request.GET.get('t')
@@ -347,43 +311,8 @@ def message_split_gif(request):
     if tracking_id and encoded_email:
         subscriber_email = unquote(encoded_email)
         if subscriber_email:
-            # Always process synchronously (no Celery)
-            try:
-                from campaigns.models import EmailEvent, Campaign
-                # Find the sent event with the same tracking ID
-                sent_event = EmailEvent.objects.get(
-                    id=tracking_id, 
-                    event_type='sent',
-                    subscriber_email=subscriber_email
-                )
-                
-                # Check if open event already exists to avoid duplicates
-                existing_open = EmailEvent.objects.filter(
-                    email=sent_event.email,
-                    subscriber_email=subscriber_email,
-                    event_type='opened'
-                ).exists()
-                
-                if not existing_open:
-                    # Create an open event
-                    EmailEvent.objects.create(
-                        email=sent_event.email,
-                        subscriber_email=subscriber_email,
-                        event_type='opened'
-                    )
-                    
-                    # Update campaign metrics
-                    campaign = sent_event.email.campaign
-                    campaign.open_count += 1
-                    campaign.save(update_fields=['open_count'])
-                    
-                    logger.info(f"Recorded open event for {subscriber_email}")
-                else:
-                    logger.debug(f"Open event already exists for {subscriber_email}, skipping duplicate")
-            except EmailEvent.DoesNotExist:
-                logger.error(f"No matching sent event found for tracking ID {tracking_id}, email: {subscriber_email}")
-            except Exception as e:
-                logger.error(f"Failed to process email open: {str(e)}", exc_info=True)
+            # Queued for the event writer (campaigns.ingest); no database work here
+            record_open(tracking_id, subscriber_email)
     
     # Return a decorative separator GIF (2px high, gradient line)
     # This is a visible separator that looks like an HR line, not a tracking pixel
@@ -403,52 +332,50 @@ def message_split_gif(request):
     return HttpResponse(separator_gif, content_type='image/gif')
 
 
+@csrf_exempt
+def track_link_click(request, tracking_id, link_id):
+    """Record a click on a tracked link (/c/<tracking_id>/<link_id>/) and redirect to its destination."""
+    from campaigns.links import link_url, resolve_click
+    from campaigns.tokens import verify_token
+
+    claims = verify_token(tracking_id)
+    if claims is not None:
+        destination_url = link_url(claims.email_id, link_id)
+        if destination_url is None:
+            return HttpResponse("Unknown link", status=404)
+        record_click(claims, claims.subscriber_email, destination_url)
+        return redirect(destination_url)
+
+    # Messages sent before signed tokens carry the bare 'sent' event id
+    sent_event, destination_url = resolve_click(tracking_id, link_id)
+    if sent_event is None:
+        return HttpResponse("Unknown link", status=404)
+
+    record_click(tracking_id, sent_event.subscriber_email, destination_url)
+    return redirect(destination_url)
+
+
 @csrf_exempt
 def track_click(request, tracking_id):
-    """Track link clicks and redirect user to the destination URL."""
-    subscriber_email = request.GET.get('email')
+    """
+    Legacy click tracking (?email=...&url=...) for messages sent before /c/ links.
+
+    Only redirects to links of the message's Email, so the url parameter can't
+    be used to bounce visitors to arbitrary sites.
+    """
+    from campaigns.links import is_known_link
+
     destination_url = request.GET.get('url')
-    
-    if subscriber_email and destination_url:
-        # Use synchronous processing on Windows/DEBUG mode
-        import sys
-        from django.conf import settings
-        if sys.platform == 'win32' and settings.DEBUG:
-            # Process synchronously
-            from campaigns.models import EmailEvent, Campaign
-            try:
-                sent_event = EmailEvent.objects.get(
-                    id=tracking_id,
-                    event_type='sent',
-                    subscriber_email=subscriber_email
-                )
-                
-                # Create click event
-                EmailEvent.objects.create(
-                    email=sent_event.email,
-                    subscriber_email=subscriber_email,
-                    event_type='clicked',
-                    link_clicked=destination_url
-                )
-                
-                # Update campaign metrics
-                campaign = sent_event.email.campaign
-                campaign.click_count += 1
-                campaign.save(update_fields=['click_count'])
-            except EmailEvent.DoesNotExist:
-                pass
-            except Exception:
-                pass
-        else:
-            # Process the click event directly (no Celery)
-            process_email_click(str(tracking_id), subscriber_email, destination_url)
-    
-    # Redirect to the destination URL
-    if destination_url:
-        return redirect(destination_url)
-    else:
+    if not destination_url:
         return HttpResponse("No destination URL provided", status=400)
 
+    sent_event = EmailEvent.objects.select_related('email').filter(id=tracking_id, event_type='sent').first()
+    if sent_event is None or not is_known_link(sent_event.email, destination_url):
+        return HttpResponse("Unknown link", status=404)
+
+    record_click(tracking_id, sent_event.subscriber_email, destination_url)
+    return redirect(destination_url)
+
 
 @login_required
 @api_view(['GET', 'PUT'])
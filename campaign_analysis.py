@@ -138,9 +138,9 @@ def render_html(campaign, by_month, email_rows, out_path):
 """
 
     html = html_template.replace('{CAMPAIGN_NAME}', campaign.name if campaign else '—')
-    html = html.replace('{METRICS_SENT}', str(campaign.sent_count if campaign else 0))
-    html = html.replace('{METRICS_OPENS}', str(campaign.open_count if campaign else 0))
-    html = html.replace('{METRICS_CLICKS}', str(campaign.click_count if campaign else 0))
+    html = html.replace('{METRICS_SENT}', str(campaign.counts['sent_count'] if campaign else 0))
+    html = html.replace('{METRICS_OPENS}', str(campaign.counts['open_count'] if campaign else 0))
+    html = html.replace('{METRICS_CLICKS}', str(campaign.counts['click_count'] if campaign else 0))
 
     html = html.replace('{MONTHS_JSON}', json.dumps(months))
     html = html.replace('{MONTHS_SENT}', json.dumps(sent))
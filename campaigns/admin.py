@@ -1,7 +1,7 @@
 from django.contrib import admin
 from django.utils.html import format_html
 from django.utils.translation import gettext_lazy as _
-from .models import Campaign, Email, EmailEvent, EmailSendRequest, EmailAIAnalysis
+from .models import Campaign, DKIMKey, Email, EmailEvent, EmailLink, EmailSendRequest, EmailAIAnalysis
 
 
 class EmailInline(admin.TabularInline):
@@ -16,10 +16,10 @@ class EmailInline(admin.TabularInline):
 @admin.register(Campaign)
 class CampaignAdmin(admin.ModelAdmin):
     """Admin interface for Campaigns - Email drip campaign sequences."""
-    list_display = ('name', 'user', 'is_active', 'emails_count', 'subscriber_list', 'sent_count', 'open_rate_display', 'click_rate_display', 'created_at')
+    list_display = ('name', 'user', 'is_active', 'emails_count', 'subscriber_list', 'sent_total', 'open_rate_display', 'click_rate_display', 'created_at')
     list_filter = ('is_active', 'created_at', 'user')
     search_fields = ('name', 'description', 'user__username', 'user__email')
-    readonly_fields = ('id', 'created_at', 'updated_at', 'emails_count', 'open_rate_display', 'click_rate_display')
+    readonly_fields = ('id', 'created_at', 'updated_at', 'emails_count', 'sent_total', 'open_rate_display', 'click_rate_display')
     raw_id_fields = ('user', 'subscriber_list')
     date_hierarchy = 'created_at'
     inlines = [EmailInline]
@@ -31,8 +31,12 @@ class CampaignAdmin(admin.ModelAdmin):
         ('Status', {
             'fields': ('is_active',)
         }),
+        ('Scheduling', {
+            'fields': ('send_window_start', 'send_window_end', 'send_window_timezone', 'materialize_sequence'),
+            'classes': ('collapse',)
+        }),
         ('Statistics', {
-            'fields': ('sent_count', 'open_count', 'click_count', 'emails_count', 'open_rate_display', 'click_rate_display'),
+            'fields': ('sent_count', 'open_count', 'click_count', 'sent_total', 'emails_count', 'open_rate_display', 'click_rate_display'),
             'classes': ('collapse',)
         }),
         ('Timestamps', {
@@ -46,6 +50,11 @@ class CampaignAdmin(admin.ModelAdmin):
         return obj.emails.count()
     emails_count.short_description = 'Emails'
     
+    def sent_total(self, obj):
+        """Sent count including the campaign's counter shards."""
+        return obj.counts['sent_count']
+    sent_total.short_description = 'Sent'
+    
     def open_rate_display(self, obj):
         """Display open rate as a percentage with color coding."""
         rate = float(obj.open_rate) if obj.open_rate else 0.0
@@ -71,8 +80,13 @@ class CampaignAdmin(admin.ModelAdmin):
     activate_campaigns.short_description = 'Activate selected campaigns'
     
     def deactivate_campaigns(self, request, queryset):
-        """Deactivate selected campaigns."""
+        """Deactivate selected campaigns and cancel their queued sequence emails."""
+        from .tasks import cancel_materialized_requests
+
+        ids = list(queryset.values_list('pk', flat=True))
         updated = queryset.update(is_active=False)
+        # update() sends no post_save, so the signal handler won't do this
+        cancel_materialized_requests(campaign_ids=ids)
         self.message_user(request, f'{updated} campaign(s) deactivated.')
     deactivate_campaigns.short_description = 'Deactivate selected campaigns'
 
@@ -86,6 +100,18 @@ class EmailEventInline(admin.TabularInline):
     can_delete = False
 
 
+class EmailLinkInline(admin.TabularInline):
+    """Read-only click-tracking link table of an email."""
+    model = EmailLink
+    extra = 0
+    fields = ('link_id', 'url', 'created_at')
+    readonly_fields = ('link_id', 'url', 'created_at')
+    can_delete = False
+
+    def has_add_permission(self, request, obj=None):
+        return False
+
+
 @admin.register(Email)
 class EmailAdmin(admin.ModelAdmin):
     """Admin interface for Emails - Individual emails within campaigns."""
@@ -95,7 +121,7 @@ class EmailAdmin(admin.ModelAdmin):
     readonly_fields = ('id', 'created_at', 'updated_at', 'wait_time_display', 'body_html_preview', 'body_text_preview')
     raw_id_fields = ('campaign', 'footer')
     date_hierarchy = 'created_at'
-    inlines = [EmailEventInline]
+    inlines = [EmailLinkInline, EmailEventInline]
     
     fieldsets = (
         ('Email Information', {
@@ -175,7 +201,7 @@ class EmailEventAdmin(admin.ModelAdmin):
 @admin.register(EmailSendRequest)
 class EmailSendRequestAdmin(admin.ModelAdmin):
     """Admin interface for Email Send Requests - Individual email send queue items."""
-    list_display = ('email', 'subscriber_email', 'status_badge', 'scheduled_for', 'sent_at', 'user', 'created_at')
+    list_display = ('email', 'subscriber_email', 'status_badge', 'scheduled_for', 'sent_at', 'attempts', 'user', 'created_at')
     list_filter = ('status', 'scheduled_for', 'sent_at', 'created_at')
     search_fields = ('subscriber_email', 'email__subject', 'email__campaign__name', 'user__username', 'error_message')
     readonly_fields = ('id', 'created_at', 'updated_at')
@@ -188,7 +214,7 @@ class EmailSendRequestAdmin(admin.ModelAdmin):
             'fields': ('id', 'user', 'campaign', 'email', 'subscriber', 'subscriber_email')
         }),
         ('Status', {
-            'fields': ('status', 'scheduled_for', 'sent_at', 'error_message')
+            'fields': ('status', 'scheduled_for', 'sent_at', 'attempts', 'next_attempt_at', 'error_message')
         }),
         ('Variables', {
             'fields': ('variables',),
@@ -217,11 +243,21 @@ class EmailSendRequestAdmin(admin.ModelAdmin):
     def retry_failed_requests(self, request, queryset):
         """Reset failed requests to pending status."""
         failed = queryset.filter(status='failed')
-        updated = failed.update(status='pending', error_message='')
+        updated = failed.update(status='pending', error_message='', attempts=0, next_attempt_at=None)
         self.message_user(request, f'{updated} failed request(s) reset to pending.')
     retry_failed_requests.short_description = 'Retry failed requests'
 
 
+@admin.register(DKIMKey)
+class DKIMKeyAdmin(admin.ModelAdmin):
+    """Admin interface for DKIM Keys - Per-user and shared signing keys."""
+    list_display = ('__str__', 'user', 'is_active', 'updated_at')
+    list_filter = ('is_active',)
+    search_fields = ('domain', 'selector', 'user__username')
+    readonly_fields = ('created_at', 'updated_at')
+    raw_id_fields = ('user',)
+
+
 @admin.register(EmailAIAnalysis)
 class EmailAIAnalysisAdmin(admin.ModelAdmin):
     """Admin interface for Email AI Analysis - AI-generated content and topic analysis."""
@@ -0,0 +1,256 @@
+"""
+Asynchronous outbound SMTP delivery.
+
+Django's SMTP backend sends one message at a time over one connection, so a
+sender spends most of its time waiting on relay round-trips. The engine here
+keeps a pool of persistent aiosmtplib sessions to the relay on a private
+event loop thread and delivers a batch of messages concurrently, one message
+per free session. campaigns.backends.AsyncSMTPBackend adapts it to Django's
+EmailBackend interface.
+
+aiosmtplib is an optional dependency; it is only imported when the async
+backend is configured.
+"""
+
+import asyncio
+import atexit
+import logging
+import smtplib
+import threading
+
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+
+try:
+    import aiosmtplib
+except ImportError:  # Only needed when EMAIL_BACKEND is the async backend
+    aiosmtplib = None
+
+logger = logging.getLogger(__name__)
+
+
+def _as_smtplib_error(exc):
+    """
+    Translate aiosmtplib errors into their smtplib equivalents, so callers
+    (campaigns.retry, the batch sender) handle both backends the same way.
+    """
+    if aiosmtplib is None or not isinstance(exc, aiosmtplib.SMTPException):
+        return exc
+    if isinstance(exc, aiosmtplib.SMTPRecipientsRefused):
+        return smtplib.SMTPRecipientsRefused({
+            refused.recipient: (refused.code, refused.message.encode('utf-8', 'replace'))
+            for refused in exc.recipients
+        })
+    if isinstance(exc, aiosmtplib.SMTPSenderRefused):
+        return smtplib.SMTPSenderRefused(exc.code, exc.message.encode('utf-8', 'replace'), exc.sender)
+    if isinstance(exc, aiosmtplib.SMTPResponseException):
+        return smtplib.SMTPResponseException(exc.code, exc.message.encode('utf-8', 'replace'))
+    if isinstance(exc, aiosmtplib.SMTPTimeoutError):
+        return TimeoutError(str(exc))
+    if isinstance(exc, aiosmtplib.SMTPConnectError):
+        return smtplib.SMTPServerDisconnected(f"Could not connect to the mail relay: {exc}")
+    if isinstance(exc, aiosmtplib.SMTPServerDisconnected):
+        return smtplib.SMTPServerDisconnected(str(exc))
+    return smtplib.SMTPException(str(exc))
+
+
+class _Session:
+    """One pooled SMTP connection and the number of messages it has carried."""
+
+    def __init__(self, client):
+        self.client = client
+        self.sent = 0
+
+
+class SMTPSessionPool:
+    """
+    Up to ``size`` persistent SMTP sessions to one relay.
+
+    Sessions are opened on demand, reused while idle and replaced after
+    ``max_messages`` messages. All methods run on the engine's event loop.
+    """
+
+    def __init__(self, host, port, username=None, password=None, use_tls=False, use_ssl=False,
+                 timeout=None, size=10, max_messages=100, opportunistic_tls=False, local_hostname=None):
+        self.host = host
+        self.port = port
+        self.username = username or None
+        self.password = password or None
+        self.use_tls = use_tls
+        self.use_ssl = use_ssl
+        self.timeout = timeout
+        self.size = max(int(size), 1)
+        self.max_messages = max(int(max_messages), 1)
+        # MX hosts: STARTTLS when offered, without certificate checks (as MTAs do)
+        self.opportunistic_tls = opportunistic_tls
+        self.local_hostname = local_hostname or None
+        self.opened = 0  # Sessions opened over the pool's lifetime
+        self._idle = []
+        self._slots = asyncio.Semaphore(self.size)
+
+    async def _connect(self):
+        client = aiosmtplib.SMTP(
+            hostname=self.host,
+            port=self.port,
+            username=self.username,
+            password=self.password,
+            use_tls=self.use_ssl,  # aiosmtplib's use_tls is implicit TLS (Django's EMAIL_USE_SSL)
+            start_tls=None if self.opportunistic_tls else bool(self.use_tls),
+            validate_certs=not self.opportunistic_tls,
+            local_hostname=self.local_hostname,
+            timeout=self.timeout,
+        )
+        await client.connect()
+        self.opened += 1
+        return _Session(client)
+
+    async def _acquire(self):
+        await self._slots.acquire()
+        try:
+            while self._idle:
+                session = self._idle.pop()
+                if session.client.is_connected:
+                    return session
+            return await self._connect()
+        except BaseException:
+            self._slots.release()
+            raise
+
+    async def _release(self, session, reuse):
+        try:
+            if reuse and session.client.is_connected and session.sent < self.max_messages:
+                self._idle.append(session)
+            else:
+                await self._quit(session)
+        finally:
+            self._slots.release()
+
+    async def _quit(self, session):
+        try:
+            if session.client.is_connected:
+                await session.client.quit()
+        except Exception:
+            session.client.close()
+
+    async def send(self, sender, recipients, message):
+        """Deliver one message on a pooled session, reconnecting once if the session had dropped."""
+        session = await self._acquire()
+        reuse = True
+        try:
+            try:
+                await session.client.sendmail(sender, recipients, message)
+            except aiosmtplib.SMTPServerDisconnected:
+                # Idle sessions get closed by the relay; retry once on a fresh one
+                session.client.close()
+                session = await self._connect()
+                await session.client.sendmail(sender, recipients, message)
+            session.sent += 1
+        except (aiosmtplib.SMTPResponseException, aiosmtplib.SMTPRecipientsRefused):
+            raise  # The relay refused this message; the session itself is fine
+        except BaseException:
+            reuse = False
+            raise
+        finally:
+            await self._release(session, reuse)
+
+    async def close(self):
+        idle, self._idle = self._idle, []
+        for session in idle:
+            await self._quit(session)
+
+
+class AsyncDeliveryEngine:
+    """Runs an SMTPSessionPool on a private event loop thread; deliver() is called from sync code."""
+
+    def __init__(self, pool):
+        self.pool = pool
+        self._loop = None
+        self._thread = None
+        self._lock = threading.Lock()
+
+    def _ensure_loop(self):
+        with self._lock:
+            if self._loop is None:
+                self._loop = asyncio.new_event_loop()
+                self._thread = threading.Thread(target=self._loop.run_forever, name='async-smtp', daemon=True)
+                self._thread.start()
+            return self._loop
+
+    async def _send(self, sender, recipients, message):
+        await self.pool.send(sender, recipients, message)
+
+    async def _close_pools(self):
+        await self.pool.close()
+
+    async def _deliver_all(self, envelopes):
+        return await asyncio.gather(
+            *(self._send(sender, recipients, message) for sender, recipients, message in envelopes),
+            return_exceptions=True,
+        )
+
+    def deliver(self, envelopes):
+        """
+        Deliver (sender, recipients, message bytes) envelopes concurrently.
+
+        Returns one entry per envelope: None if the relay accepted it, otherwise
+        the (smtplib-style) exception it failed with.
+        """
+        if not envelopes:
+            return []
+        future = asyncio.run_coroutine_threadsafe(self._deliver_all(envelopes), self._ensure_loop())
+        return [_as_smtplib_error(result) if isinstance(result, BaseException) else None for result in future.result()]
+
+    def close(self):
+        """QUIT pooled sessions and stop the loop thread."""
+        with self._lock:
+            loop, thread = self._loop, self._thread
+            self._loop = self._thread = None
+        if loop is None:
+            return
+        try:
+            asyncio.run_coroutine_threadsafe(self._close_pools(), loop).result(timeout=10)
+        except Exception as e:
+            logger.warning(f"Error closing pooled SMTP sessions: {str(e)}")
+        loop.call_soon_threadsafe(loop.stop)
+        thread.join(timeout=10)
+        loop.close()
+
+
+_engines = {}
+_engines_lock = threading.Lock()
+
+
+def register_engine(key, factory):
+    """Process-wide engine for ``key``, built with ``factory()`` on first use."""
+    with _engines_lock:
+        engine = _engines.get(key)
+        if engine is None:
+            engine = _engines[key] = factory()
+        return engine
+
+
+def get_delivery_engine(host, port, username=None, password=None, use_tls=False, use_ssl=False, timeout=None):
+    """Process-wide engine (and session pool) for one relay configuration."""
+    if aiosmtplib is None:
+        raise ImproperlyConfigured("The async SMTP backend requires aiosmtplib (pip install aiosmtplib)")
+
+    def build():
+        pool = SMTPSessionPool(
+            host, port, username, password, use_tls, use_ssl, timeout,
+            size=getattr(settings, 'ASYNC_SMTP_POOL_SIZE', 10),
+            max_messages=getattr(settings, 'ASYNC_SMTP_SESSION_MESSAGES', 100),
+        )
+        logger.info(f"Async SMTP delivery to {host}:{port} with up to {pool.size} sessions")
+        return AsyncDeliveryEngine(pool)
+
+    return register_engine(('relay', host, port, username, password, use_tls, use_ssl, timeout), build)
+
+
+@atexit.register
+def close_delivery_engines():
+    """Close every engine (at exit, and in tests)."""
+    with _engines_lock:
+        engines = list(_engines.values())
+        _engines.clear()
+    for engine in engines:
+        engine.close()
@@ -0,0 +1,101 @@
+"""
+Django email backends.
+
+AsyncSMTPBackend delivers through the pooled asyncio engine in
+campaigns.async_smtp. Enable it with
+
+    EMAIL_BACKEND = 'campaigns.backends.AsyncSMTPBackend'
+
+It reads the same EMAIL_HOST/EMAIL_PORT/EMAIL_HOST_USER/... settings as
+Django's SMTP backend, plus ASYNC_SMTP_POOL_SIZE (concurrent sessions) and
+ASYNC_SMTP_SESSION_MESSAGES (messages per session before it is recycled).
+
+MXDirectBackend skips the relay and delivers straight to each recipient
+domain's MX hosts (campaigns.mx), configured by the MX_DIRECT_* settings.
+"""
+
+from django.conf import settings
+from django.core.mail.backends.base import BaseEmailBackend
+from django.core.mail.message import sanitize_address
+
+from .async_smtp import get_delivery_engine
+from .mx import get_mx_engine
+
+
+class AsyncSMTPBackend(BaseEmailBackend):
+    """
+    EmailBackend whose send_messages() delivers all messages concurrently
+    over a shared pool of persistent SMTP sessions.
+
+    open()/close() don't connect or disconnect: sessions belong to the
+    process-wide engine and are reused by every backend instance.
+    """
+
+    def __init__(self, host=None, port=None, username=None, password=None, use_tls=None,
+                 fail_silently=False, use_ssl=None, timeout=None, **kwargs):
+        super().__init__(fail_silently=fail_silently)
+        self.host = host or settings.EMAIL_HOST
+        self.port = port or settings.EMAIL_PORT
+        self.username = settings.EMAIL_HOST_USER if username is None else username
+        self.password = settings.EMAIL_HOST_PASSWORD if password is None else password
+        self.use_tls = settings.EMAIL_USE_TLS if use_tls is None else use_tls
+        self.use_ssl = getattr(settings, 'EMAIL_USE_SSL', False) if use_ssl is None else use_ssl
+        self.timeout = getattr(settings, 'EMAIL_TIMEOUT', None) if timeout is None else timeout
+        if self.use_ssl and self.use_tls:
+            raise ValueError(
+                "EMAIL_USE_TLS/EMAIL_USE_SSL are mutually exclusive, so only set "
+                "one of those settings to True."
+            )
+        self.engine = None
+
+    def open(self):
+        if self.engine is not None:
+            return False
+        self.engine = get_delivery_engine(
+            self.host, self.port, self.username, self.password, self.use_tls, self.use_ssl, self.timeout,
+        )
+        return True
+
+    def close(self):
+        # Pooled sessions outlive this instance; they are closed at process exit
+        self.engine = None
+
+    def deliver_each(self, email_messages):
+        """
+        Deliver messages concurrently and return one entry per message: None if
+        it was accepted, otherwise the exception it failed with. Used by the
+        batch sender to record each outcome.
+        """
+        self.open()
+        envelopes = []
+        for message in email_messages:
+            encoding = message.encoding or settings.DEFAULT_CHARSET
+            envelopes.append((
+                sanitize_address(message.from_email, encoding),
+                [sanitize_address(addr, encoding) for addr in message.recipients()],
+                message.message().as_bytes(linesep='\r\n'),
+            ))
+        return self.engine.deliver(envelopes)
+
+    def send_messages(self, email_messages):
+        email_messages = [message for message in email_messages if message.recipients()]
+        if not email_messages:
+            return 0
+        errors = self.deliver_each(email_messages)
+        failures = [error for error in errors if error is not None]
+        if failures and not self.fail_silently:
+            raise failures[0]
+        return len(errors) - len(failures)
+
+
+class MXDirectBackend(AsyncSMTPBackend):
+    """
+    AsyncSMTPBackend that delivers to the recipients' MX hosts instead of
+    EMAIL_HOST, keeping a few warm sessions per MX host.
+    """
+
+    def open(self):
+        if self.engine is not None:
+            return False
+        self.engine = get_mx_engine()
+        return True
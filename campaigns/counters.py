@@ -0,0 +1,291 @@
+"""
+Campaign metric counters (sent_count, open_count, ...).
+
+Every increment goes through add_counts(), which applies it as
+``UPDATE ... SET open_count = open_count + n``, never by reading the row and
+saving it back, so concurrent senders and tracking writers can't lose each
+other's increments.
+
+With CAMPAIGN_COUNTER_FLUSH_INTERVAL set, increments are summed per campaign
+in a per-process CounterBuffer instead and written every that many seconds,
+one UPDATE per campaign, which turns a send or open storm into a handful of
+writes. Pending increments are written at exit; after a crash the counters
+can be recomputed from EmailEvent with ``cron.py reconcile_counters``.
+
+With CAMPAIGN_COUNTER_SHARDS set, increments go to one of that many
+CampaignCounterShard rows of the campaign, picked at random, rather than the
+Campaign row, so a big send or an open storm spreads its row locks instead of
+queueing on one. A campaign's counts are then its own fields plus the sum of
+its shards: Campaign.counts (and the rates built on it) reads them through
+load_counts(), which caches the shard sums for CAMPAIGN_COUNTER_CACHE_SECONDS.
+fold_counter_shards() moves the shards back into the Campaign row.
+"""
+
+import atexit
+import logging
+import os
+import random
+import threading
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import IntegrityError, close_old_connections, transaction
+from django.db.models import Count, F, Sum
+
+logger = logging.getLogger(__name__)
+
+# EmailEvent.event_type -> Campaign counter field
+EVENT_COUNTERS = {
+    'sent': 'sent_count',
+    'opened': 'open_count',
+    'clicked': 'click_count',
+    'bounced': 'bounce_count',
+    'unsubscribed': 'unsubscribe_count',
+    'complained': 'complaint_count',
+}
+COUNTER_FIELDS = tuple(EVENT_COUNTERS.values())
+
+
+def _add_to_shard(campaign_id, deltas, shard):
+    from .models import Campaign, CampaignCounterShard
+
+    updates = {field: F(field) + delta for field, delta in deltas.items()}
+    shards = CampaignCounterShard.objects.filter(campaign_id=campaign_id, shard=shard)
+    if shards.update(**updates):
+        return
+    if not Campaign.objects.filter(pk=campaign_id).exists():
+        return
+    try:
+        with transaction.atomic():
+            CampaignCounterShard.objects.create(campaign_id=campaign_id, shard=shard, **deltas)
+    except IntegrityError:
+        # Another writer created the shard first
+        shards.update(**updates)
+
+
+def apply_counts(counts):
+    """Write {campaign_id: {field: delta}} with one UPDATE per campaign (of a random shard, if sharded)."""
+    from .models import Campaign
+
+    shards = getattr(settings, 'CAMPAIGN_COUNTER_SHARDS', 0)
+    for campaign_id, deltas in counts.items():
+        deltas = {field: delta for field, delta in deltas.items() if delta}
+        if not deltas:
+            continue
+        if shards > 0:
+            _add_to_shard(campaign_id, deltas, random.randrange(shards))
+        else:
+            Campaign.objects.filter(pk=campaign_id).update(**{field: F(field) + delta for field, delta in deltas.items()})
+
+
+def _merge(into, counts):
+    for campaign_id, deltas in counts.items():
+        pending = into.setdefault(campaign_id, {})
+        for field, delta in deltas.items():
+            pending[field] = pending.get(field, 0) + delta
+
+
+class CounterBuffer:
+    """Per-process sums of counter increments with a background flusher thread."""
+
+    def __init__(self, interval=None, autostart=True):
+        self.interval = interval or getattr(settings, 'CAMPAIGN_COUNTER_FLUSH_INTERVAL', 0) or 1
+        self.autostart = autostart
+        self._counts = {}
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._thread = None
+        self._pid = None
+
+    def __len__(self):
+        return len(self._counts)
+
+    def add(self, counts):
+        with self._lock:
+            _merge(self._counts, counts)
+        if self.autostart:
+            self._ensure_thread()
+
+    def drain(self):
+        with self._lock:
+            counts, self._counts = self._counts, {}
+        return counts
+
+    def flush(self):
+        """Write the pending increments; returns the number of campaigns updated."""
+        with self._flush_lock:
+            counts = self.drain()
+            try:
+                apply_counts(counts)
+            except Exception as e:
+                # Keep them for the next flush rather than lose them
+                self.add(counts)
+                logger.error(f"Failed to write counters of {len(counts)} campaigns: {str(e)}", exc_info=True)
+                return 0
+        return len(counts)
+
+    def _ensure_thread(self):
+        # A forked worker inherits the object but not the thread
+        if self._pid == os.getpid() and self._thread is not None and self._thread.is_alive():
+            return
+        with self._lock:
+            if self._pid == os.getpid() and self._thread is not None and self._thread.is_alive():
+                return
+            self._pid = os.getpid()
+            self._thread = threading.Thread(target=self._run, name='counter-flusher', daemon=True)
+            self._thread.start()
+
+    def _run(self):
+        stop = threading.Event()
+        while not stop.wait(self.interval):
+            close_old_connections()
+            self.flush()
+
+
+_buffer = None
+_buffer_lock = threading.Lock()
+
+
+def get_counter_buffer():
+    """The process-wide CounterBuffer (flushed at exit as well)."""
+    global _buffer
+    if _buffer is None:
+        with _buffer_lock:
+            if _buffer is None:
+                _buffer = CounterBuffer()
+                atexit.register(_buffer.flush)
+    return _buffer
+
+
+def add_counts(counts):
+    """
+    Add {campaign_id: {field: delta}} to the campaigns' counters, right away
+    or through this process's CounterBuffer when CAMPAIGN_COUNTER_FLUSH_INTERVAL is set.
+    """
+    if getattr(settings, 'CAMPAIGN_COUNTER_FLUSH_INTERVAL', 0):
+        get_counter_buffer().add(counts)
+    else:
+        apply_counts(counts)
+
+
+def count_event(campaign_id, event_type, n=1):
+    """Count ``n`` EmailEvents of ``event_type`` for a campaign (other event types are ignored)."""
+    field = EVENT_COUNTERS.get(event_type)
+    if field is not None and n:
+        add_counts({campaign_id: {field: n}})
+
+
+def flush_counters():
+    """Write this process's pending increments, if any."""
+    if _buffer is None:
+        return 0
+    return _buffer.flush()
+
+
+def _shard_cache_key(campaign_id):
+    return f"campaign-counter-shards:{campaign_id}"
+
+
+def _shard_sums(campaign_ids):
+    from .models import CampaignCounterShard
+
+    sums = {campaign_id: dict.fromkeys(COUNTER_FIELDS, 0) for campaign_id in campaign_ids}
+    rows = (
+        CampaignCounterShard.objects.filter(campaign_id__in=campaign_ids)
+        .values('campaign_id')
+        .annotate(**{f'total_{field}': Sum(field) for field in COUNTER_FIELDS})
+    )
+    for row in rows:
+        sums[row['campaign_id']] = {field: row[f'total_{field}'] or 0 for field in COUNTER_FIELDS}
+    return sums
+
+
+def load_counts(campaigns):
+    """
+    Set the counter totals (Campaign.counts) of several campaigns, with at
+    most one query for the shard sums that aren't cached.
+    """
+    campaigns = [campaign for campaign in campaigns if getattr(campaign, '_counts', None) is None]
+    if not campaigns:
+        return
+    keys = {campaign.pk: _shard_cache_key(campaign.pk) for campaign in campaigns}
+    cached = cache.get_many(list(keys.values()))
+    sums = {campaign_id: cached[key] for campaign_id, key in keys.items() if key in cached}
+    missing = [campaign_id for campaign_id in keys if campaign_id not in sums]
+    if missing:
+        loaded = _shard_sums(missing)
+        cache.set_many(
+            {keys[campaign_id]: shard_sums for campaign_id, shard_sums in loaded.items()},
+            timeout=getattr(settings, 'CAMPAIGN_COUNTER_CACHE_SECONDS', 5),
+        )
+        sums.update(loaded)
+    for campaign in campaigns:
+        shard_sums = sums[campaign.pk]
+        campaign._counts = {field: getattr(campaign, field) + shard_sums[field] for field in COUNTER_FIELDS}
+
+
+def fold_counter_shards(campaign_id):
+    """Move a campaign's shard counts into its Campaign row; returns the number of shards folded."""
+    from .models import Campaign, CampaignCounterShard
+
+    with transaction.atomic():
+        shards = list(CampaignCounterShard.objects.select_for_update().filter(campaign_id=campaign_id))
+        if not shards:
+            return 0
+        updates = {}
+        for field in COUNTER_FIELDS:
+            total = sum(getattr(shard, field) for shard in shards)
+            if total:
+                updates[field] = F(field) + total
+        if updates:
+            Campaign.objects.filter(pk=campaign_id).update(**updates)
+        CampaignCounterShard.objects.filter(pk__in=[shard.pk for shard in shards]).delete()
+    cache.delete(_shard_cache_key(campaign_id))
+    return len(shards)
+
+
+def reconcile_counters(campaign_ids=None):
+    """
+    Recompute campaign counters from their EmailEvent rows and fix the ones
+    that drifted; returns the ids of the campaigns that were corrected.
+
+    Increments still pending in other processes' buffers land on top of the
+    recomputed values, so run it while CAMPAIGN_COUNTER_FLUSH_INTERVAL is off
+    or traffic is quiet.
+    """
+    from .models import Campaign, CampaignCounterShard, EmailEvent
+
+    flush_counters()
+    campaigns = Campaign.objects.all()
+    events = EmailEvent.objects.filter(event_type__in=EVENT_COUNTERS)
+    if campaign_ids is not None:
+        campaigns = campaigns.filter(pk__in=campaign_ids)
+        events = events.filter(email__campaign_id__in=campaign_ids)
+
+    actual = {}
+    for row in events.values('email__campaign_id', 'event_type').annotate(total=Count('id')):
+        actual.setdefault(row['email__campaign_id'], {})[EVENT_COUNTERS[row['event_type']]] = row['total']
+
+    sharded = set(CampaignCounterShard.objects.filter(campaign__in=campaigns).values_list('campaign_id', flat=True))
+    shard_sums = _shard_sums(sharded) if sharded else {}
+
+    corrected = []
+    for row in campaigns.values('id', *COUNTER_FIELDS).iterator():
+        counts = actual.get(row['id'], {})
+        shards = shard_sums.get(row['id'], {})
+        fixes = {
+            field: counts.get(field, 0) for field in COUNTER_FIELDS
+            if row[field] + shards.get(field, 0) != counts.get(field, 0)
+        }
+        if not fixes:
+            continue
+        with transaction.atomic():
+            if row['id'] in sharded:
+                # The recomputed totals replace the shards as well
+                CampaignCounterShard.objects.filter(campaign_id=row['id']).delete()
+                fixes = {field: counts.get(field, 0) for field in COUNTER_FIELDS}
+            Campaign.objects.filter(pk=row['id']).update(**fixes)
+        cache.delete(_shard_cache_key(row['id']))
+        corrected.append(row['id'])
+        logger.info(f"Reconciled counters of campaign {row['id']}: {fixes}")
+    return corrected
@@ -0,0 +1,88 @@
+"""
+In-process memory of recent unique opens.
+
+Prefetching image proxies (Apple Mail Privacy Protection, Gmail's image
+cache) and the separator images fetch a message's pixel many times within
+seconds, and every fetch used to reach the database to find out whether the
+open was already recorded. RecentOpens keeps an exact LRU of the last
+OPEN_DEDUPE_LRU_SIZE (Email, recipient) pairs this process has seen open, and
+a repeat of one of them is dropped in the tracking request before it is
+queued (campaigns.ingest).
+
+Only an exact match drops an open, so a genuine first open is never lost.
+Pairs seen by other processes, or evicted from the LRU, are unknown here; the
+writer still checks the database for every open it is handed, in one query
+per batch.
+"""
+
+import threading
+from collections import OrderedDict
+
+from django.conf import settings
+
+
+class RecentOpens:
+    """Recently opened (Email, recipient) pairs of this process, with hit-rate counters."""
+
+    def __init__(self, lru_size=None):
+        self.lru_size = max(lru_size or getattr(settings, 'OPEN_DEDUPE_LRU_SIZE', 50000), 1)
+        self._lock = threading.Lock()
+        self._recent = OrderedDict()
+        self._lookups = self._hits = 0
+
+    @staticmethod
+    def key(email_id, subscriber_email):
+        return f"{email_id}:{(subscriber_email or '').strip().lower()}"
+
+    def seen(self, email_id, subscriber_email):
+        """True if this process already saw this recipient open this Email."""
+        key = self.key(email_id, subscriber_email)
+        with self._lock:
+            self._lookups += 1
+            if key not in self._recent:
+                return False
+            self._recent.move_to_end(key)
+            self._hits += 1
+            return True
+
+    def add(self, email_id, subscriber_email):
+        key = self.key(email_id, subscriber_email)
+        with self._lock:
+            self._recent[key] = None
+            self._recent.move_to_end(key)
+            while len(self._recent) > self.lru_size:
+                self._recent.popitem(last=False)
+
+    def stats(self, reset=False):
+        """Lookups, dropped repeats (hits) and the hit rate since the last reset."""
+        with self._lock:
+            stats = {
+                'lookups': self._lookups,
+                'hits': self._hits,
+                'hit_rate': self._hits / self._lookups if self._lookups else 0.0,
+                'tracked_pairs': len(self._recent),
+            }
+            if reset:
+                self._lookups = self._hits = 0
+        return stats
+
+
+_recent_opens = None
+_recent_opens_lock = threading.Lock()
+
+
+def get_recent_opens():
+    """The process-wide RecentOpens shared by the tracking endpoints."""
+    global _recent_opens
+    if _recent_opens is None:
+        with _recent_opens_lock:
+            if _recent_opens is None:
+                _recent_opens = RecentOpens()
+    return _recent_opens
+
+
+def reset_recent_opens():
+    """Forget every remembered open (used by tests)."""
+    global _recent_opens
+    with _recent_opens_lock:
+        _recent_opens = None
@@ -0,0 +1,498 @@
+"""
+Claiming and dispatching due EmailSendRequest rows.
+
+Several cron hosts may drain the same queue. A row is claimed by moving it
+from 'pending' to 'queued' atomically (row locks with SKIP LOCKED where the
+database supports it, a compare-and-set UPDATE everywhere else), so each row
+is sent by exactly one process. Rows left 'queued' by a process that died are
+reclaimed once their lease expires.
+
+SendScheduler is the resident alternative to polling from cron: it keeps the
+upcoming scheduled_for times in a min-heap and sleeps until the next one is
+due. New rows reach it through notify_send_request(), which the post_save
+signal calls (in-process directly, across processes via PostgreSQL NOTIFY).
+Whenever it loads its window it also pre-warms the render plans (and, with
+direct MX delivery, the MX answers) of the sends about to go out.
+
+forecast_send_load() counts pending sends per hour ahead; with campaigns that
+materialize whole sequences it covers their future steps too.
+"""
+
+import heapq
+import logging
+import select
+import socket
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from datetime import timedelta, timezone as dt_timezone
+
+from django.conf import settings
+from django.db import connection, connections, transaction
+from django.db.models import Q
+from django.utils import timezone as tz
+
+from .models import EmailSendRequest
+
+logger = logging.getLogger(__name__)
+
+
+def _claim_lease():
+    return timedelta(seconds=getattr(settings, 'SEND_CLAIM_LEASE_SECONDS', 900))
+
+
+def due_requests_filter(now=None):
+    """Pending rows that are due, plus 'queued' rows whose claim has expired."""
+    now = now or tz.now()
+    return Q(scheduled_for__lte=now) & (
+        Q(status='pending') | Q(status='queued', updated_at__lt=now - _claim_lease())
+    )
+
+
+def claim_due_requests(limit=None, now=None, ids=None, due_by=None):
+    """
+    Atomically claim due send requests for this process.
+
+    Returns the claimed EmailSendRequest objects (status 'queued'), oldest first.
+    Rows claimed concurrently by another process are skipped, never returned twice.
+    ``ids`` restricts the claim to those rows (used by SendScheduler), ``due_by``
+    to rows scheduled no later than that. Rows of an inactive campaign or
+    subscriber are cancelled rather than returned.
+
+    The claim is a lease of SEND_CLAIM_LEASE_SECONDS: claim no more than can be
+    sent within it (see claim_round_size()), or the rows still waiting are
+    reclaimed by another process and sent twice.
+    """
+    now = now or tz.now()
+    skip_locked = connection.features.has_select_for_update_skip_locked
+
+    with transaction.atomic():
+        candidates = EmailSendRequest.objects.filter(due_requests_filter(now)).order_by('scheduled_for')
+        if ids is not None:
+            candidates = candidates.filter(id__in=ids)
+        if due_by is not None:
+            candidates = candidates.filter(scheduled_for__lte=due_by)
+        if skip_locked:
+            candidates = candidates.select_for_update(skip_locked=True)
+        if limit:
+            candidates = candidates[:limit]
+        rows = list(candidates.values_list('id', 'status', 'updated_at'))
+
+        if skip_locked:
+            # The rows are locked by us until commit, so a plain UPDATE is safe
+            claimed_ids = [row_id for row_id, _status, _updated_at in rows]
+            EmailSendRequest.objects.filter(id__in=claimed_ids).update(status='queued', updated_at=now)
+        else:
+            # No row locks: only keep rows whose status/updated_at we changed ourselves
+            claimed_ids = [
+                row_id
+                for row_id, status, updated_at in rows
+                if EmailSendRequest.objects.filter(id=row_id, status=status, updated_at=updated_at).update(
+                    status='queued', updated_at=now
+                )
+            ]
+
+    if len(claimed_ids) < len(rows):
+        logger.info(f"Skipped {len(rows) - len(claimed_ids)} send requests claimed by another worker")
+
+    claimed = list(
+        EmailSendRequest.objects.filter(id__in=claimed_ids)
+        .select_related('email', 'campaign', 'user', 'subscriber')
+        .order_by('scheduled_for')
+    )
+    # Bulk deactivations (QuerySet.update) fire no post_save, so their sends are dropped here
+    inactive = [
+        r.id for r in claimed
+        if not r.campaign.is_active or (r.subscriber is not None and not r.subscriber.is_active)
+    ]
+    if inactive:
+        EmailSendRequest.objects.filter(id__in=inactive).update(status='cancelled', updated_at=tz.now())
+        logger.info(f"Cancelled {len(inactive)} send requests of inactive campaigns or subscribers")
+        inactive = set(inactive)
+        claimed = [r for r in claimed if r.id not in inactive]
+    return claimed
+
+
+def claim_round_size(workers=1):
+    """Rows to claim at a time: one send batch per worker, well inside the claim lease."""
+    return max(workers, 1) * max(int(getattr(settings, 'EMAIL_BATCH_SIZE', 100)), 1)
+
+
+def send_due_requests(limit=None, workers=1):
+    """
+    Claim and send due requests in rounds of claim_round_size(workers) until
+    none are left, or ``limit`` have been claimed.
+
+    Only rows due when the call starts are claimed, so rows the throttle or a
+    retry pushes back a few seconds wait for the next run. Returns a dict with
+    the total 'claimed', 'sent', 'failed' and 'throttled' counts.
+    """
+    started = tz.now()
+    round_size = claim_round_size(workers)
+    totals = {'claimed': 0, 'sent': 0, 'failed': 0, 'throttled': 0}
+    while limit is None or totals['claimed'] < limit:
+        size = round_size if limit is None else min(round_size, limit - totals['claimed'])
+        claimed = claim_due_requests(limit=size, due_by=started)
+        if not claimed:
+            break
+        totals['claimed'] += len(claimed)
+        result = dispatch_requests(claimed, workers=workers)
+        for key in ('sent', 'failed', 'throttled'):
+            totals[key] += result[key]
+    return totals
+
+
+def _send_chunk(chunk, batch_size):
+    from .tasks import send_email_batch
+
+    try:
+        return send_email_batch(chunk, batch_size=batch_size)
+    finally:
+        # Worker threads get their own DB connections; don't leak them
+        connections.close_all()
+
+
+def dispatch_requests(requests, workers=1, batch_size=None):
+    """
+    Send claimed requests, fanning chunks of ``batch_size`` out to ``workers`` threads.
+
+    Requests over the per-domain/global send rate are rescheduled instead of
+    sent (see campaigns.throttle). Each thread delivers its chunk over its own
+    SMTP connection. Returns a dict with the total 'sent', 'failed' and
+    'throttled' counts.
+    """
+    from .tasks import send_email_batch
+    from .throttle import get_send_throttle
+
+    requests, deferred = get_send_throttle().admit(requests)
+    batch_size = max(int(batch_size or getattr(settings, 'EMAIL_BATCH_SIZE', 100)), 1)
+    if workers <= 1 or len(requests) <= batch_size:
+        totals = send_email_batch(requests, batch_size=batch_size) if requests else {'sent': 0, 'failed': 0}
+        totals['throttled'] = len(deferred)
+        return totals
+
+    totals = {'sent': 0, 'failed': 0, 'throttled': len(deferred)}
+    chunks = [requests[i:i + batch_size] for i in range(0, len(requests), batch_size)]
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix='send-worker') as executor:
+        futures = {executor.submit(_send_chunk, chunk, batch_size): chunk for chunk in chunks}
+        for future in as_completed(futures):
+            try:
+                result = future.result()
+            except Exception as e:
+                logger.error(f"Send worker failed on a chunk of {len(futures[future])}: {str(e)}", exc_info=True)
+                totals['failed'] += len(futures[future])
+                continue
+            totals['sent'] += result['sent']
+            totals['failed'] += result['failed']
+    return totals
+
+
+# PostgreSQL channel used to tell schedulers in other processes about new rows
+NOTIFY_CHANNEL = 'dripemails_send_requests'
+
+# Notification payload asking schedulers to reload their window
+REFRESH_PAYLOAD = 'refresh'
+
+# The scheduler running in this process, if any (see SendScheduler.run)
+_active_scheduler = None
+
+
+def _notify_payload(send_request):
+    return f"{send_request.id}|{send_request.scheduled_for.timestamp()}"
+
+
+def _parse_notify_payload(payload):
+    """(request id, timestamp) from a NOTIFY payload; raises ValueError if it is malformed."""
+    request_id, ts = payload.split('|', 1)
+    return uuid.UUID(request_id), float(ts)
+
+
+def notify_send_request(send_request):
+    """
+    Tell running schedulers about a new or rescheduled 'pending' request.
+
+    Cheap enough to call from post_save: a heap push when the scheduler lives in
+    this process, and a NOTIFY sent on commit when running on PostgreSQL.
+    """
+    if send_request.status != 'pending' or not send_request.scheduled_for:
+        return
+
+    scheduler = _active_scheduler
+    if scheduler is not None:
+        scheduler.push(send_request.id, send_request.scheduled_for)
+
+    if connection.vendor == 'postgresql' and getattr(settings, 'SEND_SCHEDULER_NOTIFY', True):
+        payload = _notify_payload(send_request)
+
+        def _notify():
+            try:
+                with connection.cursor() as cursor:
+                    cursor.execute('SELECT pg_notify(%s, %s)', [NOTIFY_CHANNEL, payload])
+            except Exception as e:
+                logger.warning(f"Could not notify send scheduler about {send_request.id}: {str(e)}")
+
+        transaction.on_commit(_notify)
+
+
+def notify_bulk_send_requests():
+    """
+    Tell running schedulers to reload their window after rows were bulk-inserted
+    (bulk_create doesn't send post_save, and one NOTIFY beats one per row).
+    """
+    scheduler = _active_scheduler
+    if scheduler is not None:
+        scheduler.request_refresh()
+
+    if connection.vendor == 'postgresql' and getattr(settings, 'SEND_SCHEDULER_NOTIFY', True):
+        def _notify():
+            try:
+                with connection.cursor() as cursor:
+                    cursor.execute('SELECT pg_notify(%s, %s)', [NOTIFY_CHANNEL, REFRESH_PAYLOAD])
+            except Exception as e:
+                logger.warning(f"Could not notify send scheduler about new requests: {str(e)}")
+
+        transaction.on_commit(_notify)
+
+
+# Recipient domains whose MX hosts are resolved ahead per window load
+PREWARM_MX_DOMAINS = 200
+
+
+def forecast_send_load(hours=24, now=None):
+    """
+    Pending sends due in each of the next ``hours`` hours (UTC, overdue ones
+    counted in the first), as [(hour start, count), ...].
+    """
+    from django.db.models import Count
+    from django.db.models.functions import TruncHour
+
+    now = now or tz.now()
+    start = now.astimezone(dt_timezone.utc).replace(minute=0, second=0, microsecond=0)
+    counts = [0] * hours
+    rows = (
+        EmailSendRequest.objects.filter(status='pending', scheduled_for__lt=start + timedelta(hours=hours))
+        .annotate(hour=TruncHour('scheduled_for', tzinfo=dt_timezone.utc))
+        .values('hour')
+        .annotate(count=Count('id'))
+        .order_by()
+    )
+    for row in rows:
+        index = max(int((row['hour'] - start).total_seconds() // 3600), 0)
+        counts[index] += row['count']
+    return [(start + timedelta(hours=i), count) for i, count in enumerate(counts)]
+
+
+def prewarm_sends(email_ids, recipient_domains=()):
+    """
+    Compile the render plans of the Emails about to be sent and, when mail goes
+    direct to MX, resolve their recipient domains, so the first messages of a
+    burst don't pay for either.
+    """
+    from .models import Email
+    from .rendering import get_render_plan
+    from .tasks import _get_site_info
+
+    site_url, site_name, _site_logo = _get_site_info(request=None)
+    for email in Email.objects.filter(id__in=email_ids).select_related('footer', 'campaign__user'):
+        try:
+            get_render_plan(
+                email, site_url=site_url, site_name=site_name, sender_email=email.campaign.user.email,
+                loose=True, normalize_breaks=True, tracked=True,
+            )
+        except Exception as e:
+            logger.warning(f"Could not pre-compile email {email.id}: {str(e)}")
+
+    if recipient_domains and settings.EMAIL_BACKEND == 'campaigns.backends.MXDirectBackend':
+        from .mx import MXLookupError, get_mx_engine
+
+        resolver = get_mx_engine().resolver
+        for domain in list(recipient_domains)[:PREWARM_MX_DOMAINS]:
+            try:
+                resolver.resolve(domain)
+            except MXLookupError:
+                pass  # Cached too; the send records the failure
+
+
+class SendScheduler:
+    """
+    Resident sender that wakes exactly when the next EmailSendRequest is due.
+
+    Only rows due within ``window_seconds`` are held in memory (at most
+    ``window_limit`` of them); the window is reloaded every ``refresh_seconds``
+    to pick up rows nobody notified us about and expired claims.
+    """
+
+    def __init__(self, workers=1, window_seconds=None, window_limit=None, refresh_seconds=None):
+        self.workers = workers
+        self.window_seconds = window_seconds or getattr(settings, 'SEND_SCHEDULER_WINDOW_SECONDS', 600)
+        self.window_limit = window_limit or getattr(settings, 'SEND_SCHEDULER_WINDOW_LIMIT', 5000)
+        self.refresh_seconds = refresh_seconds or getattr(settings, 'SEND_SCHEDULER_REFRESH_SECONDS', 60)
+
+        self._heap = []  # (timestamp, request id)
+        self._queued = {}  # request id -> timestamp of its live heap entry
+        self._lock = threading.Lock()
+        self._window_end = 0.0
+        self._truncated = False
+        self._next_refresh = 0.0
+        self._stopping = False
+        self._listen_conn = None
+        # Self-pipe so push()/stop() from other threads interrupt select()
+        self._wake_r, self._wake_w = socket.socketpair()
+        self._wake_r.setblocking(False)
+        self._wake_w.setblocking(False)
+
+    def push(self, request_id, scheduled_for):
+        """Add or move a request in the heap if it falls inside the loaded window."""
+        ts = scheduled_for.timestamp() if hasattr(scheduled_for, 'timestamp') else float(scheduled_for)
+        with self._lock:
+            if ts > self._window_end:
+                return  # Picked up by a later window load
+            if self._queued.get(request_id) == ts:
+                return
+            self._queued[request_id] = ts
+            heapq.heappush(self._heap, (ts, request_id))
+        self._wake()
+
+    def stop(self):
+        self._stopping = True
+        self._wake()
+
+    def request_refresh(self):
+        """Reload the window on the next loop (e.g. after a bulk insert)."""
+        self._next_refresh = 0.0
+        self._wake()
+
+    def _wake(self):
+        try:
+            self._wake_w.send(b'\0')
+        except (BlockingIOError, OSError):
+            pass  # Already signalled (or shutting down)
+
+    def load_window(self):
+        """Load requests due within the window (and anything overdue) into the heap."""
+        now = tz.now()
+        window_end = now + timedelta(seconds=self.window_seconds)
+        rows = list(
+            EmailSendRequest.objects.filter(
+                Q(status='pending', scheduled_for__lte=window_end) | due_requests_filter(now)
+            )
+            .order_by('scheduled_for')
+            .values_list('id', 'scheduled_for', 'email_id', 'subscriber_email')[:self.window_limit]
+        )
+        self._truncated = len(rows) >= self.window_limit
+        with self._lock:
+            # A truncated window only covers up to its last row
+            self._window_end = (rows[-1][1] if self._truncated else window_end).timestamp()
+            for request_id, scheduled_for, _email_id, _subscriber_email in rows:
+                ts = scheduled_for.timestamp()
+                if self._queued.get(request_id) != ts:
+                    self._queued[request_id] = ts
+                    heapq.heappush(self._heap, (ts, request_id))
+        self._next_refresh = time.time() + self.refresh_seconds
+        logger.info(f"Send scheduler loaded {len(rows)} requests (window {self.window_seconds}s)")
+        if rows:
+            try:
+                prewarm_sends(
+                    {email_id for _id, _ts, email_id, _addr in rows},
+                    {addr.rpartition('@')[2].lower() for _id, _ts, _email_id, addr in rows if '@' in addr},
+                )
+            except Exception as e:
+                logger.warning(f"Send scheduler could not pre-warm upcoming sends: {str(e)}")
+
+    def _pop_due(self, now):
+        ids = []
+        with self._lock:
+            while self._heap and self._heap[0][0] <= now:
+                ts, request_id = heapq.heappop(self._heap)
+                if self._queued.get(request_id) != ts:
+                    continue  # Superseded by a later push for the same row
+                del self._queued[request_id]
+                ids.append(request_id)
+        return ids
+
+    def _next_timeout(self, now):
+        timeout = self._next_refresh - now
+        with self._lock:
+            if self._heap:
+                timeout = min(timeout, self._heap[0][0] - now)
+        return max(timeout, 0)
+
+    def _send(self, ids):
+        # Claimed a round at a time so the last rows don't outlive their lease
+        round_size = claim_round_size(self.workers)
+        for i in range(0, len(ids), round_size):
+            try:
+                claimed = claim_due_requests(ids=ids[i:i + round_size])
+                if claimed:
+                    result = dispatch_requests(claimed, workers=self.workers)
+                    logger.info(
+                        f"Send scheduler sent {result['sent']}, failed {result['failed']}, "
+                        f"throttled {result['throttled']}"
+                    )
+            except Exception as e:
+                logger.error(f"Send scheduler failed to dispatch {len(ids)} requests: {str(e)}", exc_info=True)
+
+    def _listen(self):
+        """LISTEN on the notify channel (psycopg2 only); returns the raw connection or None."""
+        if connection.vendor != 'postgresql' or not getattr(settings, 'SEND_SCHEDULER_NOTIFY', True):
+            return None
+        connection.ensure_connection()
+        raw = connection.connection
+        if raw is self._listen_conn:
+            return raw
+        if not hasattr(raw, 'poll'):
+            logger.warning("Database driver does not support polling notifications; relying on window refreshes")
+            return None
+        with connection.cursor() as cursor:
+            cursor.execute(f'LISTEN {NOTIFY_CHANNEL}')
+        self._listen_conn = raw
+        return raw
+
+    def _wait(self, timeout):
+        try:
+            listen_conn = self._listen()
+        except Exception as e:
+            logger.warning(f"Send scheduler could not LISTEN for notifications: {str(e)}")
+            listen_conn = None
+
+        readable, _, _ = select.select([self._wake_r] + ([listen_conn] if listen_conn else []), [], [], timeout)
+        if self._wake_r in readable:
+            try:
+                while self._wake_r.recv(4096):
+                    pass
+            except (BlockingIOError, OSError):
+                pass
+        if listen_conn is not None and listen_conn in readable:
+            listen_conn.poll()
+            while listen_conn.notifies:
+                note = listen_conn.notifies.pop(0)
+                if note.payload == REFRESH_PAYLOAD:
+                    self._next_refresh = 0.0
+                    continue
+                try:
+                    # Ids are UUIDs, matching the keys load_window() puts in the heap
+                    self.push(*_parse_notify_payload(note.payload))
+                except ValueError:
+                    logger.warning(f"Ignoring malformed send notification: {note.payload!r}")
+
+    def run(self):
+        """Send requests as they come due until stop() is called."""
+        global _active_scheduler
+        _active_scheduler = self
+        logger.info(f"Send scheduler started (workers: {self.workers})")
+        try:
+            while not self._stopping:
+                now = time.time()
+                with self._lock:
+                    drained = not self._heap
+                if now >= self._next_refresh or (drained and self._truncated):
+                    self.load_window()
+                ids = self._pop_due(time.time())
+                if ids:
+                    self._send(ids)
+                    continue
+                self._wait(self._next_timeout(time.time()))
+        finally:
+            _active_scheduler = None
+            logger.info("Send scheduler stopped")
@@ -0,0 +1,412 @@
+"""
+Write-behind ingestion of open and click events.
+
+The tracking endpoints (analytics.views) only call record_open() /
+record_click(), which check the message's signed token (campaigns.tokens),
+drop opens this process has already seen (campaigns.dedupe), append a small
+tuple and return, so a burst of pixel fetches after a big send costs no
+database work inside the requests. Events are written later by
+write_events(): events without a token are matched to their 'sent' events
+with one query, one more finds opens already recorded, the new EmailEvent rows
+go in with bulk_create, and each campaign's counters get one increment
+(campaigns.counters).
+
+EVENT_INGEST_MODE picks where events wait:
+
+- 'memory' (default): a per-process EventBuffer, flushed by a background
+  thread every EVENT_FLUSH_INTERVAL seconds or once EVENT_FLUSH_BATCH events
+  are waiting. At most EVENT_BUFFER_SIZE events are held; beyond that the
+  oldest are dropped.
+- 'spool': one JSON line per event appended to EVENT_SPOOL_PATH, drained by
+  ``cron.py flush_events``. Survives web process restarts. Writers hold a
+  shared flock while appending and the drain renames the file under an
+  exclusive one, so no line lands in a file being drained; one drain runs at
+  a time, and it records how far into a file it got, so a failed drain
+  resumes there instead of writing the earlier events again.
+- 'sync': written inside the request, as before.
+"""
+
+import atexit
+import glob
+import json
+import logging
+import os
+import re
+import threading
+import time
+import uuid
+from collections import deque, namedtuple
+from contextlib import contextmanager
+
+try:
+    import fcntl
+except ImportError:  # Windows: spool files are not locked
+    fcntl = None
+
+from django.conf import settings
+from django.db import close_old_connections
+
+from .counters import add_counts
+from .dedupe import get_recent_opens
+from .tokens import TrackingClaims, looks_like_token, matches_subscriber, verify_token
+
+logger = logging.getLogger(__name__)
+
+OPEN = 'opened'
+CLICK = 'clicked'
+
+# Seconds between the flusher thread's open dedupe stats log lines
+STATS_LOG_INTERVAL = 300
+
+# One tracked hit; ``at`` is a Unix timestamp. Hits from signed tokens also
+# carry the Email and Campaign ids, so writing them needs no 'sent' lookup.
+TrackedEvent = namedtuple(
+    'TrackedEvent', 'kind tracking_id subscriber_email link_url at email_id campaign_id', defaults=(None, None),
+)
+
+
+def _ingest_mode():
+    return getattr(settings, 'EVENT_INGEST_MODE', 'memory')
+
+
+def write_events(events):
+    """
+    Store a batch of TrackedEvents as EmailEvent rows and bump campaign counters.
+
+    Events from signed tokens carry their Email, Campaign and recipient; the
+    rest are matched to their 'sent' event with one query, and dropped if
+    there is none. An open is only stored for the first open of an (Email,
+    recipient). Returns the number of EmailEvent rows created.
+    """
+    from .models import Email, EmailEvent
+
+    if not events:
+        return 0
+
+    lookup_ids = {event.tracking_id for event in events if not (event.email_id and event.subscriber_email)}
+    sent = {}
+    if lookup_ids:
+        sent = {
+            str(event_id): (str(email_id), subscriber_email, str(campaign_id))
+            for event_id, email_id, subscriber_email, campaign_id in EmailEvent.objects.filter(
+                id__in=lookup_ids, event_type='sent'
+            ).values_list('id', 'email_id', 'subscriber_email', 'email__campaign_id')
+        }
+    signed_email_ids = {event.email_id for event in events if event.email_id and event.subscriber_email}
+    if signed_email_ids:
+        # Tokens outlive deleted Emails; drop their events rather than fail the insert
+        existing = {str(email_id) for email_id in Email.objects.filter(id__in=signed_email_ids).values_list('id', flat=True)}
+    else:
+        existing = set()
+
+    resolved = []
+    for event in events:
+        if event.email_id and event.subscriber_email:
+            match = (event.email_id, event.subscriber_email, event.campaign_id) if event.email_id in existing else None
+        else:
+            match = sent.get(event.tracking_id)
+            if match is not None and event.subscriber_email and event.subscriber_email != match[1]:
+                match = None
+        if match is None:
+            logger.error(f"No matching sent event found for tracking ID {event.tracking_id}")
+            continue
+        resolved.append((event, match))
+
+    opened = {(email_id, subscriber_email) for event, (email_id, subscriber_email, _c) in resolved if event.kind == OPEN}
+    if opened:
+        already_opened = {
+            (str(email_id), subscriber_email)
+            for email_id, subscriber_email in EmailEvent.objects.filter(
+                event_type=OPEN,
+                email_id__in={email_id for email_id, _addr in opened},
+                subscriber_email__in={addr for _email_id, addr in opened},
+            ).values_list('email_id', 'subscriber_email')
+        }
+    else:
+        already_opened = set()
+
+    rows = []
+    counts = {}
+    for event, (email_id, subscriber_email, campaign_id) in resolved:
+        if event.kind == OPEN:
+            key = (email_id, subscriber_email)
+            if key in already_opened:
+                continue
+            already_opened.add(key)
+        rows.append(EmailEvent(
+            email_id=email_id,
+            subscriber_email=subscriber_email,
+            event_type=event.kind,
+            link_clicked=event.link_url if event.kind == CLICK else None,
+        ))
+        campaign_counts = counts.setdefault(campaign_id, {'open_count': 0, 'click_count': 0})
+        campaign_counts['open_count' if event.kind == OPEN else 'click_count'] += 1
+
+    # bulk_create skips the post_save metrics signal, so counters are bumped here
+    EmailEvent.objects.bulk_create(rows)
+    if already_opened:
+        recent_opens = get_recent_opens()
+        for email_id, subscriber_email in already_opened:
+            recent_opens.add(email_id, subscriber_email)
+    add_counts(counts)
+    return len(rows)
+
+
+class EventBuffer:
+    """In-memory ring of TrackedEvents with a background flusher thread."""
+
+    def __init__(self, capacity=None, batch_size=None, interval=None, autostart=True):
+        self.capacity = max(capacity or getattr(settings, 'EVENT_BUFFER_SIZE', 100000), 1)
+        self.batch_size = max(batch_size or getattr(settings, 'EVENT_FLUSH_BATCH', 500), 1)
+        self.interval = interval or getattr(settings, 'EVENT_FLUSH_INTERVAL', 2)
+        self.autostart = autostart
+        self.dropped = 0
+        self._events = deque()
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._wake = threading.Event()
+        self._thread = None
+        self._pid = None
+
+    def __len__(self):
+        return len(self._events)
+
+    def append(self, event):
+        with self._lock:
+            if len(self._events) >= self.capacity:
+                self._events.popleft()
+                self.dropped += 1
+            self._events.append(event)
+            waiting = len(self._events)
+        if self.autostart:
+            self._ensure_thread()
+        if waiting >= self.batch_size:
+            self._wake.set()
+
+    def drain(self, limit=None):
+        with self._lock:
+            count = len(self._events) if limit is None else min(limit, len(self._events))
+            return [self._events.popleft() for _ in range(count)]
+
+    def flush(self):
+        """Write everything buffered so far; returns the number of EmailEvent rows created."""
+        created = 0
+        with self._flush_lock:
+            while True:
+                batch = self.drain(self.batch_size)
+                if not batch:
+                    break
+                try:
+                    created += write_events(batch)
+                except Exception as e:
+                    logger.error(f"Failed to write {len(batch)} tracking events: {str(e)}", exc_info=True)
+        if self.dropped:
+            logger.warning(f"Event buffer was full; dropped {self.dropped} tracking events")
+            self.dropped = 0
+        return created
+
+    def _ensure_thread(self):
+        # A forked worker inherits the object but not the thread
+        if self._pid == os.getpid() and self._thread is not None and self._thread.is_alive():
+            return
+        with self._lock:
+            if self._pid == os.getpid() and self._thread is not None and self._thread.is_alive():
+                return
+            self._pid = os.getpid()
+            self._thread = threading.Thread(target=self._run, name='event-flusher', daemon=True)
+            self._thread.start()
+
+    def _run(self):
+        reported = time.monotonic()
+        while True:
+            self._wake.wait(self.interval)
+            self._wake.clear()
+            close_old_connections()
+            self.flush()
+            if time.monotonic() - reported >= STATS_LOG_INTERVAL:
+                reported = time.monotonic()
+                log_open_dedupe_stats()
+
+
+_buffer = None
+_buffer_lock = threading.Lock()
+
+
+def log_open_dedupe_stats():
+    """Log (and reset) this process's repeat-open counters (campaigns.dedupe)."""
+    stats = get_recent_opens().stats(reset=True)
+    if stats['lookups']:
+        logger.info(
+            f"Open dedupe: {stats['hits']}/{stats['lookups']} repeat opens dropped "
+            f"(hit rate {stats['hit_rate']:.1%}, {stats['tracked_pairs']} pairs remembered)"
+        )
+    return stats
+
+
+def get_event_buffer():
+    """The process-wide EventBuffer (flushed at exit as well)."""
+    global _buffer
+    if _buffer is None:
+        with _buffer_lock:
+            if _buffer is None:
+                _buffer = EventBuffer()
+                atexit.register(_buffer.flush)
+    return _buffer
+
+
+def _spool_path():
+    return getattr(settings, 'EVENT_SPOOL_PATH', '') or os.path.join(settings.BASE_DIR, 'logs', 'events.spool')
+
+
+# Spool files renamed by a drain: <EVENT_SPOOL_PATH>.<pid>.<ms>
+_CLAIMED_SPOOL_RE = re.compile(r'\.\d+\.\d+$')
+
+
+@contextmanager
+def _flock(lock_path, exclusive=True, blocking=True):
+    """Hold an flock on ``lock_path``; yields False if ``blocking`` is off and it is taken."""
+    if fcntl is None:
+        yield True
+        return
+    with open(lock_path, 'a') as lock_file:
+        operation = (fcntl.LOCK_EX if exclusive else fcntl.LOCK_SH) | (0 if blocking else fcntl.LOCK_NB)
+        try:
+            fcntl.flock(lock_file, operation)
+            locked = True
+        except BlockingIOError:
+            locked = False
+        # Closing the file releases the lock
+        yield locked
+
+
+def _append_to_spool(event):
+    path = _spool_path()
+    line = json.dumps(event, separators=(',', ':')) + '\n'
+    if not os.path.isdir(os.path.dirname(path)):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+    # Reopened per event under a shared lock: a drain only renames the file
+    # while no writer has it open, so nothing is appended to a renamed file
+    with _flock(f"{path}.lock", exclusive=False), open(path, 'a', encoding='utf-8') as spool:
+        spool.write(line)
+
+
+def _read_offset(offset_path):
+    try:
+        with open(offset_path, encoding='utf-8') as f:
+            return int(f.read() or 0)
+    except (FileNotFoundError, ValueError):
+        return 0
+
+
+def _save_offset(offset_path, offset):
+    with open(f"{offset_path}.tmp", 'w', encoding='utf-8') as f:
+        f.write(str(offset))
+    os.replace(f"{offset_path}.tmp", offset_path)
+
+
+def _drain_spool_file(path, batch_size):
+    # Events before the recorded offset were written by an earlier, failed drain
+    offset_path = f"{path}.offset"
+    position = _read_offset(offset_path)
+    created = 0
+    batch = []
+    with open(path, 'rb') as spool:
+        spool.seek(position)
+        for line in spool:
+            position += len(line)
+            try:
+                batch.append(TrackedEvent(*json.loads(line)))
+            except (ValueError, TypeError):
+                logger.warning(f"Ignoring malformed spooled event: {line!r}")
+                continue
+            if len(batch) >= batch_size:
+                created += write_events(batch)
+                batch = []
+                _save_offset(offset_path, position)
+    created += write_events(batch)
+    os.remove(path)
+    if os.path.exists(offset_path):
+        os.remove(offset_path)
+    return created
+
+
+def drain_spool(batch_size=None):
+    """
+    Write the events appended to the spool file so far; returns the number
+    of EmailEvent rows created. The file is renamed first, so writers start a
+    new one; renamed files left by a failed drain are retried from where it
+    stopped. Returns 0 at once if another process is already draining.
+    """
+    path = _spool_path()
+    if not os.path.isdir(os.path.dirname(path)):
+        return 0
+
+    batch_size = max(batch_size or getattr(settings, 'EVENT_FLUSH_BATCH', 500), 1)
+    with _flock(f"{path}.drain.lock", blocking=False) as locked:
+        if not locked:
+            logger.info("Event spool is being drained by another process; skipping")
+            return 0
+        if os.path.exists(path):
+            with _flock(f"{path}.lock"):
+                os.replace(path, f"{path}.{os.getpid()}.{int(time.time() * 1000)}")
+        claimed = sorted(name for name in glob.glob(glob.escape(path) + '.*') if _CLAIMED_SPOOL_RE.search(name))
+        return sum(_drain_spool_file(name, batch_size) for name in claimed)
+
+
+def flush_events():
+    """Write every event waiting in this process's buffer or the spool file."""
+    if _ingest_mode() == 'spool':
+        return drain_spool()
+    return get_event_buffer().flush()
+
+
+def record_event(kind, tracking, subscriber_email, link_url=None):
+    """
+    Queue a tracked hit. ``tracking`` is the value from the message's URL (a
+    signed token or, for older messages, the bare 'sent' event id) or the
+    TrackingClaims of an already verified token.
+    """
+    subscriber_email = subscriber_email or ''
+    claims = tracking if isinstance(tracking, TrackingClaims) else None
+    if claims is None and looks_like_token(str(tracking)):
+        claims = verify_token(str(tracking))
+        if claims is None or (subscriber_email and not matches_subscriber(claims, subscriber_email)):
+            logger.warning(f"Ignoring {kind} event with an invalid tracking token")
+            return
+    if claims is not None:
+        # The token names the recipient, so clicks need no 'sent' lookup either
+        subscriber_email = claims.subscriber_email or subscriber_email
+        if kind == OPEN and subscriber_email:
+            # Proxies and separator images repeat the same open; drop repeats this process has seen
+            recent_opens = get_recent_opens()
+            if recent_opens.seen(claims.email_id, subscriber_email):
+                return
+            recent_opens.add(claims.email_id, subscriber_email)
+        event = TrackedEvent(
+            kind, claims.tracking_id, subscriber_email, link_url, time.time(), claims.email_id, claims.campaign_id,
+        )
+    else:
+        try:
+            tracking_id = str(uuid.UUID(str(tracking)))
+        except ValueError:
+            logger.error(f"Ignoring {kind} event with malformed tracking ID {tracking!r}")
+            return
+        event = TrackedEvent(kind, tracking_id, subscriber_email, link_url, time.time())
+
+    mode = _ingest_mode()
+    if mode == 'sync':
+        write_events([event])
+    elif mode == 'spool':
+        _append_to_spool(event)
+    else:
+        get_event_buffer().append(event)
+
+
+def record_open(tracking, subscriber_email):
+    """Queue an open of the message identified by ``tracking`` (see record_event)."""
+    record_event(OPEN, tracking, subscriber_email)
+
+
+def record_click(tracking, subscriber_email, link_url):
+    """Queue a click on ``link_url`` in the message identified by ``tracking`` (see record_event)."""
+    record_event(CLICK, tracking, subscriber_email, link_url)
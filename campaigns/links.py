@@ -0,0 +1,134 @@
+"""
+Per-Email link table for click tracking.
+
+Every distinct link of an Email gets a short id in EmailLink the first time
+the Email's render plan is compiled. Tracked messages then link to
+/c/<tracking_id>/<link_id>/: the tracking id identifies the 'sent' EmailEvent
+(and so the Email and the recipient), the link id the destination. The click
+endpoint only redirects to URLs stored here, so it can't be used as an open
+redirect, and messages no longer carry the recipient address and the quoted
+destination in every link.
+
+Newer messages put a signed token (campaigns.tokens) in place of the tracking
+id. It already names the Email, so the endpoint only needs the destination,
+which link_url() keeps in a per-process cache: a link id never changes URL.
+"""
+
+import hashlib
+import logging
+import threading
+import uuid
+from collections import OrderedDict
+
+from django.db import IntegrityError, transaction
+from django.db.models import Max
+
+from .models import EmailEvent, EmailLink
+
+logger = logging.getLogger(__name__)
+
+# Attempts at assigning ids when another process is adding links to the same Email
+_ASSIGN_ATTEMPTS = 3
+
+LINK_CACHE_SIZE = 4096
+
+_link_cache = OrderedDict()
+_link_cache_lock = threading.Lock()
+
+
+def url_hash(url):
+    return hashlib.sha256(url.encode('utf-8')).hexdigest()
+
+
+def link_ids_for(email, urls):
+    """
+    Return {url: link_id} for ``urls`` of ``email``, adding the ones not seen yet.
+
+    Ids are stable: a URL keeps its id for as long as the Email exists, even if
+    it is removed from the template and added back later.
+    """
+    urls = list(dict.fromkeys(urls))
+    if not urls:
+        return {}
+
+    hashes = {url_hash(url): url for url in urls}
+    ids = {}
+    for _attempt in range(_ASSIGN_ATTEMPTS):
+        for digest, link_id in EmailLink.objects.filter(email=email, url_hash__in=hashes).values_list('url_hash', 'link_id'):
+            ids[hashes[digest]] = link_id
+        missing = [url for url in urls if url not in ids]
+        if not missing:
+            return ids
+
+        next_id = (EmailLink.objects.filter(email=email).aggregate(top=Max('link_id'))['top'] or 0) + 1
+        try:
+            with transaction.atomic():
+                EmailLink.objects.bulk_create([
+                    EmailLink(email=email, link_id=next_id + offset, url=url, url_hash=url_hash(url))
+                    for offset, url in enumerate(missing)
+                ])
+        except IntegrityError:
+            # Another process assigned ids for this Email at the same time; reload and retry
+            continue
+
+    missing = [url for url in urls if url not in ids]
+    if missing:
+        logger.warning(f"Could not assign link ids for {len(missing)} links of email {email.pk}; leaving them untracked")
+    return ids
+
+
+def resolve_click(tracking_id, link_id):
+    """
+    Look up a tracked click: returns (sent EmailEvent, destination URL), or
+    (None, None) if the tracking id or link id is unknown.
+    """
+    try:
+        uuid.UUID(str(tracking_id))
+    except ValueError:
+        return None, None
+    sent_event = (
+        EmailEvent.objects.filter(id=tracking_id, event_type='sent')
+        .only('id', 'email_id', 'subscriber_email')
+        .first()
+    )
+    if sent_event is None:
+        return None, None
+    url = EmailLink.objects.filter(email_id=sent_event.email_id, link_id=link_id).values_list('url', flat=True).first()
+    if url is None:
+        return None, None
+    return sent_event, url
+
+
+def link_url(email_id, link_id):
+    """The destination URL of link ``link_id`` of an Email, or None if there is no such link."""
+    key = (str(email_id), link_id)
+    with _link_cache_lock:
+        url = _link_cache.get(key)
+        if url is not None:
+            _link_cache.move_to_end(key)
+            return url
+
+    url = EmailLink.objects.filter(email_id=email_id, link_id=link_id).values_list('url', flat=True).first()
+    if url is None:
+        return None
+    with _link_cache_lock:
+        _link_cache[key] = url
+        while len(_link_cache) > LINK_CACHE_SIZE:
+            _link_cache.popitem(last=False)
+    return url
+
+
+def clear_link_cache():
+    """Drop all cached link URLs (used by tests)."""
+    with _link_cache_lock:
+        _link_cache.clear()
+
+
+def is_known_link(email, url):
+    """True if ``url`` is a link of ``email`` (legacy ?url= click links are checked with this)."""
+    from .tasks import _trackable_links
+
+    if EmailLink.objects.filter(email=email, url_hash=url_hash(url)).exists():
+        return True
+    # Messages sent before the link table existed: accept exactly the hrefs of the template
+    return url in _trackable_links(email.body_html or '')
@@ -0,0 +1,20 @@
+# Generated by Django 5.2.7 on 2026-10-16 20:33
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('campaigns', '0009_campaign_bounce_count_campaign_complaint_count_and_more'),
+        ('subscribers', '0001_initial'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='emailsendrequest',
+            index=models.Index(fields=['status', 'scheduled_for'], name='sendrequest_status_sched_idx'),
+        ),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 5.2.7 on 2026-10-16 20:37
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('campaigns', '0010_emailsendrequest_status_scheduled_index'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='emailsendrequest',
+            name='attempts',
+            field=models.PositiveIntegerField(default=0, verbose_name='Failed Attempts'),
+        ),
+        migrations.AddField(
+            model_name='emailsendrequest',
+            name='next_attempt_at',
+            field=models.DateTimeField(blank=True, null=True, verbose_name='Next Attempt At'),
+        ),
+    ]
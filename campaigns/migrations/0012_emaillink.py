@@ -0,0 +1,31 @@
+# Generated by Django 5.2.7 on 2026-10-16 20:54
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('campaigns', '0011_emailsendrequest_attempts_next_attempt_at'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='EmailLink',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('link_id', models.PositiveIntegerField(verbose_name='Link ID')),
+                ('url', models.TextField(verbose_name='URL')),
+                ('url_hash', models.CharField(help_text='SHA-256 of the URL, for lookups', max_length=64, verbose_name='URL Hash')),
+                ('created_at', models.DateTimeField(auto_now_add=True, verbose_name='Created At')),
+                ('email', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='links', to='campaigns.email', verbose_name='Email')),
+            ],
+            options={
+                'verbose_name': 'Email Link',
+                'verbose_name_plural': 'Email Links',
+                'ordering': ['email', 'link_id'],
+                'constraints': [models.UniqueConstraint(fields=('email', 'link_id'), name='emaillink_email_link_id_uniq'), models.UniqueConstraint(fields=('email', 'url_hash'), name='emaillink_email_url_hash_uniq')],
+            },
+        ),
+    ]
@@ -0,0 +1,34 @@
+# Generated by Django 5.2.7 on 2026-10-16 21:03
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('campaigns', '0012_emaillink'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DKIMKey',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('domain', models.CharField(help_text='Signing domain (d=), normally the From address domain', max_length=253, verbose_name='Domain')),
+                ('selector', models.CharField(help_text='DNS selector (s=): the public key is at <selector>._domainkey.<domain>', max_length=63, verbose_name='Selector')),
+                ('private_key', models.TextField(help_text='PEM-encoded RSA or Ed25519 private key', verbose_name='Private Key')),
+                ('is_active', models.BooleanField(default=True, verbose_name='Is Active')),
+                ('created_at', models.DateTimeField(auto_now_add=True, verbose_name='Created At')),
+                ('updated_at', models.DateTimeField(auto_now=True, verbose_name='Updated At')),
+                ('user', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='dkim_keys', to=settings.AUTH_USER_MODEL, verbose_name='User')),
+            ],
+            options={
+                'verbose_name': 'DKIM Key',
+                'verbose_name_plural': 'DKIM Keys',
+                'ordering': ['domain', 'selector'],
+            },
+        ),
+    ]
@@ -0,0 +1,28 @@
+# Generated by Django 5.2.7 on 2026-10-16 21:10
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('campaigns', '0013_dkimkey'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='campaign',
+            name='send_window_end',
+            field=models.TimeField(blank=True, help_text='May be earlier than the start for windows spanning midnight', null=True, verbose_name='Send Window End'),
+        ),
+        migrations.AddField(
+            model_name='campaign',
+            name='send_window_start',
+            field=models.TimeField(blank=True, null=True, verbose_name='Send Window Start'),
+        ),
+        migrations.AddField(
+            model_name='campaign',
+            name='send_window_timezone',
+            field=models.CharField(choices=[('user', "Sender's time zone"), ('subscriber', "Subscriber's time zone")], default='user', max_length=16, verbose_name='Send Window Time Zone'),
+        ),
+    ]
@@ -0,0 +1,28 @@
+# Generated by Django 5.2.7 on 2026-10-16 21:40
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('campaigns', '0014_send_window'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='campaign',
+            name='materialize_sequence',
+            field=models.BooleanField(default=False, help_text='Queue every email of the sequence when a subscriber is enrolled, instead of one step at a time', verbose_name='Schedule Whole Sequence'),
+        ),
+        migrations.AddField(
+            model_name='emailsendrequest',
+            name='materialized',
+            field=models.BooleanField(default=False, help_text='Queued at enrolment with the rest of its sequence', verbose_name='Materialized'),
+        ),
+        migrations.AlterField(
+            model_name='emailsendrequest',
+            name='status',
+            field=models.CharField(choices=[('pending', 'Pending'), ('queued', 'Queued'), ('sent', 'Sent'), ('failed', 'Failed'), ('cancelled', 'Cancelled')], default='pending', max_length=10, verbose_name='Status'),
+        ),
+    ]
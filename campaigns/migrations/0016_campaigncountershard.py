@@ -0,0 +1,33 @@
+# Generated by Django 5.2.7 on 2026-10-16 23:05
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('campaigns', '0015_materialized_sequences'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CampaignCounterShard',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('shard', models.PositiveSmallIntegerField(verbose_name='Shard')),
+                ('sent_count', models.IntegerField(default=0, verbose_name='Sent Count')),
+                ('open_count', models.IntegerField(default=0, verbose_name='Open Count')),
+                ('click_count', models.IntegerField(default=0, verbose_name='Click Count')),
+                ('bounce_count', models.IntegerField(default=0, verbose_name='Bounce Count')),
+                ('unsubscribe_count', models.IntegerField(default=0, verbose_name='Unsubscribe Count')),
+                ('complaint_count', models.IntegerField(default=0, verbose_name='Complaint Count')),
+                ('campaign', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='counter_shards', to='campaigns.campaign', verbose_name='Campaign')),
+            ],
+            options={
+                'verbose_name': 'Campaign Counter Shard',
+                'verbose_name_plural': 'Campaign Counter Shards',
+                'constraints': [models.UniqueConstraint(fields=('campaign', 'shard'), name='campaigncountershard_campaign_shard_uniq')],
+            },
+        ),
+    ]
@@ -0,0 +1,203 @@
+"""
+Serialization of campaign messages.
+
+Django builds a full email.mime tree for every message and flattens it with
+email.generator, re-folding every header and re-encoding both body parts,
+although a batch of one Email differs between recipients only in To, Date,
+Message-ID, List-Unsubscribe and the personalised parts of the bodies.
+
+MessageSkeleton writes the text/plain + text/html messages built by
+SendContext.build_message() straight to bytes, producing the same bytes
+email.generator would (given the same Date, Message-ID and boundary). It
+keeps, per Email, the folded headers that are the same for every recipient
+and the quoted-printable encoding of each body line, so only lines that
+differ per recipient are encoded again. Other messages (attachments, other
+charsets) go through Django as before.
+"""
+
+import re
+from email import quoprimime
+from email.generator import BytesGenerator
+from email.policy import compat32
+from email.utils import formatdate, make_msgid
+
+from django.conf import settings
+from django.core.mail import EmailMultiAlternatives
+from django.core.mail.message import RFC5322_EMAIL_LINE_LENGTH_LIMIT, forbid_multi_line_headers
+from django.core.mail.utils import DNS_NAME
+
+_POLICY = compat32.clone(linesep='\r\n')
+_NL = b'\r\n'
+_NLCRE = re.compile(r'\r\n|\r|\n')
+_NLCRE_BYTES = re.compile(rb'\r\n|\r|\n')
+
+# Headers whose value is the same for every recipient of an Email; their folded form is kept
+_SHARED_HEADERS = frozenset(['subject', 'from', 'cc', 'reply-to', 'sender', 'list-unsubscribe-post'])
+_MAX_CACHED = 4096
+
+
+def _boundary(text):
+    """A multipart boundary not occurring in ``text``, chosen as email.generator does."""
+    boundary = BytesGenerator._make_boundary()
+    if b'--' + boundary.encode('ascii') not in text:
+        return boundary  # Skips the generator's regex scan of the whole message
+    return BytesGenerator._make_boundary(text)
+
+
+class MessageSkeleton:
+    """Recipient-independent serialized pieces of one Email's messages."""
+
+    def __init__(self):
+        self._headers = {}  # (name, value) -> folded header bytes
+        self._qp_lines = {}  # body line -> quoted-printable encoding
+
+    @staticmethod
+    def supports(message):
+        """True for messages this class serializes: a text body and at most one text/html alternative."""
+        encoding = (message.encoding or settings.DEFAULT_CHARSET).lower()
+        return (
+            encoding == 'utf-8'
+            and not message.attachments
+            and message.content_subtype == 'plain'
+            and message.alternative_subtype == 'alternative'
+            and len(message.alternatives) == 1
+            and message.alternatives[0][1] == 'text/html'
+            and isinstance(message.alternatives[0][0], str)
+        )
+
+    def _header(self, name, value, encoding):
+        key = (name, value)
+        folded = self._headers.get(key)
+        if folded is None:
+            folded = _POLICY.fold_binary(name, forbid_multi_line_headers(name, value, encoding)[1])
+            if name.lower() in _SHARED_HEADERS or name in ('Content-Type', 'MIME-Version', 'Content-Transfer-Encoding'):
+                if len(self._headers) >= _MAX_CACHED:
+                    self._headers.clear()
+                self._headers[key] = folded
+        return folded
+
+    def _qp_encode(self, text):
+        # quoprimime.body_encode() encodes each line on its own, so lines shared with other recipients are reused
+        cache = self._qp_lines
+        if len(cache) >= _MAX_CACHED:
+            cache.clear()
+        lines = []
+        for line in _NLCRE.split(text.encode('utf-8', 'surrogateescape').decode('latin-1')):
+            encoded = cache.get(line)
+            if encoded is None:
+                encoded = cache[line] = quoprimime.body_encode(line, eol='\r\n')
+            lines.append(encoded)
+        return '\r\n'.join(lines).encode('ascii')
+
+    def _text_part(self, text, subtype):
+        """A text/* body part, as SafeMIMEText(text, subtype, 'utf-8') flattens."""
+        if any(len(line.encode(errors='surrogateescape')) > RFC5322_EMAIL_LINE_LENGTH_LIMIT for line in text.splitlines()):
+            cte, payload = 'quoted-printable', self._qp_encode(text)
+        else:
+            payload = text.encode('utf-8', 'surrogateescape')
+            cte = '7bit' if payload.isascii() else '8bit'
+            payload = _NLCRE_BYTES.sub(_NL, payload)
+        return b''.join([
+            self._header('Content-Type', f'text/{subtype}; charset="utf-8"', 'utf-8'),
+            self._header('MIME-Version', '1.0', 'utf-8'),
+            self._header('Content-Transfer-Encoding', cte, 'utf-8'),
+            _NL,
+            payload,
+        ])
+
+    def render(self, message):
+        """
+        The message as EmailMultiAlternatives.message().as_bytes(linesep='\\r\\n')
+        serializes it. Date and Message-ID must already be in extra_headers.
+        """
+        encoding = message.encoding or settings.DEFAULT_CHARSET
+        parts = []
+        if message.body:
+            parts.append(self._text_part(message.body, 'plain'))
+        parts.append(self._text_part(message.alternatives[0][0], 'html'))
+        boundary = _boundary(_NL.join(parts))
+
+        headers = [
+            _POLICY.fold_binary('Content-Type', f'multipart/alternative; boundary="{boundary}"'),
+            self._header('MIME-Version', '1.0', encoding),
+            self._header('Subject', message.subject, encoding),
+            self._header('From', message.extra_headers.get('From', message.from_email), encoding),
+        ]
+        for name, values in (('To', message.to), ('Cc', message.cc), ('Reply-To', message.reply_to)):
+            if values:
+                value = message.extra_headers[name] if name in message.extra_headers else ', '.join(str(v) for v in values)
+                headers.append(self._header(name, value, encoding))
+        for name, value in message.extra_headers.items():
+            if name.lower() not in {'from', 'to', 'cc', 'reply-to'}:
+                headers.append(self._header(name, value, encoding))
+
+        delimiter = b'--' + boundary.encode('ascii')
+        body = (_NL + delimiter + _NL).join(parts)
+        return b''.join(headers) + _NL + delimiter + _NL + body + _NL + delimiter + b'--' + _NL
+
+
+class SerializedMessage:
+    """
+    What CampaignEmail.message() returns: the final bytes, serialized once
+    (and signed), for backends; other attribute access goes to a MIME tree
+    built on demand.
+    """
+
+    def __init__(self, email_message, raw):
+        self._email_message = email_message
+        self._raw = raw
+        self._mime = None
+
+    def _tree(self):
+        if self._mime is None:
+            self._mime = EmailMultiAlternatives.message(self._email_message)
+        return self._mime
+
+    def __getattr__(self, name):
+        return getattr(self._tree(), name)
+
+    def __getitem__(self, name):
+        return self._tree()[name]
+
+    def __contains__(self, name):
+        return name in self._tree()
+
+    def as_bytes(self, unixfrom=False, linesep='\n'):
+        return self._raw if linesep == '\r\n' else self._raw.replace(b'\r\n', linesep.encode('ascii'))
+
+    def as_string(self, unixfrom=False, linesep='\n'):
+        return self.as_bytes(linesep=linesep).decode('utf-8', 'replace')
+
+
+class CampaignEmail(EmailMultiAlternatives):
+    """
+    EmailMultiAlternatives serialized through a MessageSkeleton where it can
+    be, and DKIM-signed by ``dkim_signer`` (campaigns.dkim) if one is set.
+    """
+
+    def __init__(self, *args, skeleton=None, dkim_signer=None, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.skeleton = skeleton
+        self.dkim_signer = dkim_signer
+
+    def message(self, *args, **kwargs):
+        # Pin Date/Message-ID so every serialization of this message (and its MIME tree) agrees.
+        # Django emits them right before extra_headers, so putting them first keeps the header order.
+        header_names = {name.lower() for name in self.extra_headers}
+        pinned = {}
+        if 'date' not in header_names:
+            pinned['Date'] = formatdate(localtime=settings.EMAIL_USE_LOCALTIME)
+        if 'message-id' not in header_names:
+            pinned['Message-ID'] = make_msgid(domain=DNS_NAME)
+        if pinned:
+            self.extra_headers = {**pinned, **self.extra_headers}
+
+        if self.skeleton is not None and self.skeleton.supports(self):
+            raw = self.skeleton.render(self)
+        elif self.dkim_signer is not None:
+            raw = super().message(*args, **kwargs).as_bytes(linesep='\r\n')
+        else:
+            return super().message(*args, **kwargs)
+        if self.dkim_signer is not None:
+            raw = self.dkim_signer.sign(raw)
+        return SerializedMessage(self, raw)
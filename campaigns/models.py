@@ -15,6 +15,10 @@ class Campaign(models.Model):
         ('weeks', _('Weeks')),
         ('months', _('Months')),
     ]
+    SEND_WINDOW_TIMEZONE_CHOICES = [
+        ('user', _("Sender's time zone")),
+        ('subscriber', _("Subscriber's time zone")),
+    ]
     
     id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
     user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='campaigns')
@@ -31,6 +35,11 @@ class Campaign(models.Model):
     bounce_count = models.IntegerField(_('Bounce Count'), default=0)
     unsubscribe_count = models.IntegerField(_('Unsubscribe Count'), default=0)
     complaint_count = models.IntegerField(_('Complaint Count'), default=0)
+    # Optional daily delivery window (e.g. 09:00-17:00); see campaigns.scheduling
+    send_window_start = models.TimeField(_('Send Window Start'), null=True, blank=True)
+    send_window_end = models.TimeField(_('Send Window End'), null=True, blank=True, help_text=_('May be earlier than the start for windows spanning midnight'))
+    send_window_timezone = models.CharField(_('Send Window Time Zone'), max_length=16, choices=SEND_WINDOW_TIMEZONE_CHOICES, default='user')
+    materialize_sequence = models.BooleanField(_('Schedule Whole Sequence'), default=False, help_text=_("Queue every email of the sequence when a subscriber is enrolled, instead of one step at a time"))
     
     class Meta:
         verbose_name = _('Campaign')
@@ -51,24 +60,62 @@ class Campaign(models.Model):
     def emails_count(self):
         return self.emails.count()
     
+    @property
+    def counts(self):
+        """Counter totals: this row's fields plus its counter shards (see campaigns.counters)."""
+        if getattr(self, '_counts', None) is None:
+            from .counters import load_counts
+
+            load_counts([self])
+        return self._counts
+    
     @property
     def open_rate(self):
-        if self.sent_count == 0:
+        counts = self.counts
+        if counts['sent_count'] == 0:
             return 0
-        return round((self.open_count / self.sent_count) * 100, 2)
+        return round((counts['open_count'] / counts['sent_count']) * 100, 2)
     
     @property
     def click_rate(self):
-        if self.sent_count == 0:
+        counts = self.counts
+        if counts['sent_count'] == 0:
             return 0
-        return round((self.click_count / self.sent_count) * 100, 2)
+        return round((counts['click_count'] / counts['sent_count']) * 100, 2)
     
     @property
     def delivery_rate(self):
-        if self.sent_count == 0:
+        counts = self.counts
+        if counts['sent_count'] == 0:
             return 0
-        delivered = self.sent_count - self.bounce_count
-        return round((delivered / self.sent_count) * 100, 2)
+        delivered = counts['sent_count'] - counts['bounce_count']
+        return round((delivered / counts['sent_count']) * 100, 2)
+
+
+class CampaignCounterShard(models.Model):
+    """
+    One of a campaign's counter rows. With CAMPAIGN_COUNTER_SHARDS set,
+    increments go to a random shard instead of the Campaign row, so
+    concurrent writers don't queue on one row lock (see campaigns.counters).
+    """
+    campaign = models.ForeignKey(Campaign, on_delete=models.CASCADE, related_name='counter_shards', verbose_name=_('Campaign'))
+    shard = models.PositiveSmallIntegerField(_('Shard'))
+    sent_count = models.IntegerField(_('Sent Count'), default=0)
+    open_count = models.IntegerField(_('Open Count'), default=0)
+    click_count = models.IntegerField(_('Click Count'), default=0)
+    bounce_count = models.IntegerField(_('Bounce Count'), default=0)
+    unsubscribe_count = models.IntegerField(_('Unsubscribe Count'), default=0)
+    complaint_count = models.IntegerField(_('Complaint Count'), default=0)
+
+    class Meta:
+        verbose_name = _('Campaign Counter Shard')
+        verbose_name_plural = _('Campaign Counter Shards')
+        constraints = [
+            models.UniqueConstraint(fields=['campaign', 'shard'], name='campaigncountershard_campaign_shard_uniq'),
+        ]
+
+    def __str__(self):
+        return f"{self.campaign_id} shard {self.shard}"
 
 
 class Email(models.Model):
@@ -112,6 +159,54 @@ class Email(models.Model):
         return f"{self.wait_time} {unit}"
 
 
+class EmailLink(models.Model):
+    """A distinct link of an Email, with the short id used in its click-tracking URL (/c/<tracking_id>/<link_id>/)."""
+    email = models.ForeignKey(Email, on_delete=models.CASCADE, related_name='links', verbose_name=_('Email'))
+    link_id = models.PositiveIntegerField(_('Link ID'))
+    url = models.TextField(_('URL'))
+    url_hash = models.CharField(_('URL Hash'), max_length=64, help_text=_("SHA-256 of the URL, for lookups"))
+    created_at = models.DateTimeField(_('Created At'), auto_now_add=True)
+
+    class Meta:
+        ordering = ['email', 'link_id']
+        verbose_name = _('Email Link')
+        verbose_name_plural = _('Email Links')
+        constraints = [
+            models.UniqueConstraint(fields=['email', 'link_id'], name='emaillink_email_link_id_uniq'),
+            models.UniqueConstraint(fields=['email', 'url_hash'], name='emaillink_email_url_hash_uniq'),
+        ]
+
+    def __str__(self):
+        return f"{self.email_id} #{self.link_id}: {self.url}"
+
+
+class DKIMKey(models.Model):
+    """
+    DKIM private key for a signing domain. Keys with a user sign that user's
+    mail; keys without one (e.g. the platform's own domain) sign mail of any
+    user sending from the domain.
+    """
+    user = models.ForeignKey(User, on_delete=models.CASCADE, null=True, blank=True, related_name='dkim_keys', verbose_name=_('User'))
+    domain = models.CharField(_('Domain'), max_length=253, help_text=_('Signing domain (d=), normally the From address domain'))
+    selector = models.CharField(_('Selector'), max_length=63, help_text=_('DNS selector (s=): the public key is at <selector>._domainkey.<domain>'))
+    private_key = models.TextField(_('Private Key'), help_text=_('PEM-encoded RSA or Ed25519 private key'))
+    is_active = models.BooleanField(_('Is Active'), default=True)
+    created_at = models.DateTimeField(_('Created At'), auto_now_add=True)
+    updated_at = models.DateTimeField(_('Updated At'), auto_now=True)
+
+    class Meta:
+        ordering = ['domain', 'selector']
+        verbose_name = _('DKIM Key')
+        verbose_name_plural = _('DKIM Keys')
+
+    def __str__(self):
+        return f"{self.selector}._domainkey.{self.domain}"
+
+    def save(self, *args, **kwargs):
+        self.domain = self.domain.strip().lower().rstrip('.')
+        super().save(*args, **kwargs)
+
+
 class EmailEvent(models.Model):
     """Track events related to emails."""
     EVENT_TYPES = [
@@ -149,6 +244,7 @@ class EmailSendRequest(models.Model):
         ('queued', _('Queued')),
         ('sent', _('Sent')),
         ('failed', _('Failed')),
+        ('cancelled', _('Cancelled')),
     ]
 
     id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
@@ -162,6 +258,9 @@ class EmailSendRequest(models.Model):
     scheduled_for = models.DateTimeField(_('Scheduled For'))
     sent_at = models.DateTimeField(_('Sent At'), null=True, blank=True)
     error_message = models.TextField(_('Error Message'), blank=True)
+    attempts = models.PositiveIntegerField(_('Failed Attempts'), default=0)
+    next_attempt_at = models.DateTimeField(_('Next Attempt At'), null=True, blank=True)
+    materialized = models.BooleanField(_('Materialized'), default=False, help_text=_("Queued at enrolment with the rest of its sequence"))
     created_at = models.DateTimeField(_('Created At'), auto_now_add=True)
     updated_at = models.DateTimeField(_('Updated At'), auto_now=True)
 
@@ -169,6 +268,10 @@ class EmailSendRequest(models.Model):
         ordering = ['-created_at']
         verbose_name = _('Email Send Request')
         verbose_name_plural = _('Email Send Requests')
+        indexes = [
+            # Due-request lookups by the sender/scheduler
+            models.Index(fields=['status', 'scheduled_for'], name='sendrequest_status_sched_idx'),
+        ]
 
     def __str__(self):
         return f"{self.email.subject} -> {self.subscriber_email} ({self.status})"
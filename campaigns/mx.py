@@ -0,0 +1,217 @@
+"""
+Direct-to-MX delivery.
+
+Instead of handing every message to the relay, MXDeliveryEngine looks up the
+MX hosts of each recipient domain and delivers to them itself, over a small
+pool of warm sessions per MX host (campaigns.async_smtp.SMTPSessionPool).
+Messages for the same domain share those sessions, so a campaign going
+mostly to a handful of large mailbox providers needs only a few connections.
+
+MX answers are cached for their DNS TTL, clamped to MX_CACHE_MIN_TTL ..
+MX_CACHE_MAX_TTL. MX_DIRECT_ROUTES maps domains to fixed "host:port" routes
+that bypass DNS (staging, or local aiosmtpd stand-ins in tests).
+
+Enable with EMAIL_BACKEND = 'campaigns.backends.MXDirectBackend'.
+"""
+
+import asyncio
+import logging
+import smtplib
+import threading
+import time
+from email.utils import parseaddr
+
+import dns.exception
+import dns.resolver
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+
+from .async_smtp import AsyncDeliveryEngine, SMTPSessionPool, aiosmtplib, register_engine
+
+logger = logging.getLogger(__name__)
+
+
+class MXLookupError(smtplib.SMTPResponseException):
+    """A recipient domain has no usable MX; 5xx if permanent, 4xx if DNS should be retried."""
+
+    def copy(self):
+        return MXLookupError(self.smtp_code, self.smtp_error)
+
+
+def recipient_domain(address):
+    """Lower-cased domain of an address ('' if it has none)."""
+    addr = parseaddr(address)[1]
+    return addr.rpartition('@')[2].lower() if '@' in addr else ''
+
+
+def _parse_route(route, default_port):
+    host, _, port = route.rpartition(':')
+    if not host or not port.isdigit():
+        return route, default_port
+    return host, int(port)
+
+
+class MXResolver:
+    """
+    Resolves a domain to its delivery hosts, [(host, port), ...] in MX
+    preference order, caching each answer for its TTL.
+    """
+
+    def __init__(self, port=25, min_ttl=60, max_ttl=3600, routes=None):
+        self.port = port
+        self.min_ttl = min_ttl
+        self.max_ttl = max(max_ttl, min_ttl)
+        self.routes = {
+            domain.lower(): [_parse_route(route, port)] for domain, route in (routes or {}).items()
+        }
+        self._cache = {}  # domain -> (expires_at, hosts or MXLookupError)
+        self._lock = threading.Lock()
+
+    def cached(self, domain, now=None):
+        """The cached answer for ``domain``, or None if it must be looked up."""
+        if domain in self.routes:
+            return self.routes[domain]
+        now = time.monotonic() if now is None else now
+        with self._lock:
+            entry = self._cache.get(domain)
+            if entry is None:
+                return None
+            if entry[0] <= now:
+                del self._cache[domain]
+                return None
+        return entry[1]
+
+    def resolve(self, domain, now=None):
+        """
+        Delivery hosts for ``domain``. Raises MXLookupError if the domain
+        doesn't accept mail or couldn't be resolved.
+        """
+        answer = self.cached(domain, now)
+        if answer is None:
+            answer, ttl = self._lookup(domain)
+            if ttl is not None:
+                now = time.monotonic() if now is None else now
+                with self._lock:
+                    self._cache[domain] = (now + min(max(ttl, self.min_ttl), self.max_ttl), answer)
+        if isinstance(answer, MXLookupError):
+            raise answer.copy()
+        return answer
+
+    def _lookup(self, domain):
+        """(hosts or MXLookupError, ttl) from DNS; a ttl of None means don't cache."""
+        try:
+            answer = dns.resolver.resolve(domain, 'MX')
+        except dns.resolver.NoAnswer:
+            # No MX record: the domain itself is the implicit MX (RFC 5321 5.1)
+            logger.debug(f"No MX records for {domain}, using the domain itself")
+            return [(domain, self.port)], self.min_ttl
+        except dns.resolver.NXDOMAIN:
+            return MXLookupError(550, f"Domain {domain} does not exist".encode()), self.min_ttl
+        except dns.exception.DNSException as e:
+            # Timeouts and SERVFAIL are transient; ask again next time
+            logger.warning(f"MX lookup for {domain} failed: {str(e)}")
+            return MXLookupError(451, f"MX lookup for {domain} failed".encode()), None
+
+        records = sorted(answer, key=lambda record: record.preference)
+        hosts = [str(record.exchange).rstrip('.') for record in records]
+        ttl = answer.rrset.ttl if answer.rrset is not None else self.min_ttl
+        if hosts == [''] or not hosts:
+            # Null MX (RFC 7505): the domain accepts no mail
+            return MXLookupError(556, f"Domain {domain} does not accept mail".encode()), ttl
+        return [(host, self.port) for host in hosts], ttl
+
+
+class MXDeliveryEngine(AsyncDeliveryEngine):
+    """
+    AsyncDeliveryEngine that splits each envelope by recipient domain and
+    delivers every part to that domain's MX hosts, falling back to the next
+    MX when one can't be reached.
+    """
+
+    def __init__(self, resolver, pool_size=2, max_messages=100, timeout=None, local_hostname=None):
+        super().__init__(pool=None)
+        self.resolver = resolver
+        self.pool_size = pool_size
+        self.max_messages = max_messages
+        self.timeout = timeout
+        self.local_hostname = local_hostname
+        self.pools = {}  # (host, port) -> SMTPSessionPool; only touched on the loop
+
+    def _pool(self, host, port):
+        pool = self.pools.get((host, port))
+        if pool is None:
+            pool = self.pools[(host, port)] = SMTPSessionPool(
+                host, port, timeout=self.timeout, size=self.pool_size, max_messages=self.max_messages,
+                opportunistic_tls=True, local_hostname=self.local_hostname,
+            )
+        return pool
+
+    async def _hosts(self, domain):
+        hosts = self.resolver.cached(domain)
+        if hosts is None:
+            # Cache miss: the DNS query blocks, keep it off the loop
+            hosts = await asyncio.get_running_loop().run_in_executor(None, self.resolver.resolve, domain)
+        elif isinstance(hosts, MXLookupError):
+            raise hosts.copy()
+        return hosts
+
+    async def _send_to_domain(self, domain, sender, recipients, message):
+        if not domain:
+            raise MXLookupError(553, f"No domain in recipient address {recipients[0]}".encode())
+        hosts = await self._hosts(domain)
+        last_error = None
+        for host, port in hosts:
+            try:
+                await self._pool(host, port).send(sender, recipients, message)
+                return
+            except (aiosmtplib.SMTPResponseException, aiosmtplib.SMTPRecipientsRefused):
+                raise  # The MX answered; a lower-preference MX won't say otherwise
+            except (OSError, asyncio.TimeoutError, aiosmtplib.SMTPException) as e:
+                logger.debug(f"MX {host}:{port} for {domain} unavailable: {str(e)}")
+                last_error = e
+        raise last_error
+
+    async def _send(self, sender, recipients, message):
+        by_domain = {}
+        for recipient in recipients:
+            by_domain.setdefault(recipient_domain(recipient), []).append(recipient)
+
+        results = await asyncio.gather(
+            *(self._send_to_domain(domain, sender, rcpts, message) for domain, rcpts in by_domain.items()),
+            return_exceptions=True,
+        )
+        errors = [result for result in results if isinstance(result, BaseException)]
+        if errors and len(errors) == len(results):
+            raise errors[0]
+        for error in errors:
+            # Like a relay accepting some recipients: the message counts as sent
+            logger.warning(f"Direct delivery to some recipients failed: {str(error)}")
+
+    async def _close_pools(self):
+        pools, self.pools = list(self.pools.values()), {}
+        for pool in pools:
+            await pool.close()
+
+
+def get_mx_engine():
+    """Process-wide MX delivery engine configured from settings."""
+    if aiosmtplib is None:
+        raise ImproperlyConfigured("Direct MX delivery requires aiosmtplib (pip install aiosmtplib)")
+
+    def build():
+        resolver = MXResolver(
+            port=getattr(settings, 'MX_DIRECT_PORT', 25),
+            min_ttl=getattr(settings, 'MX_CACHE_MIN_TTL', 60),
+            max_ttl=getattr(settings, 'MX_CACHE_MAX_TTL', 3600),
+            routes=getattr(settings, 'MX_DIRECT_ROUTES', {}),
+        )
+        return MXDeliveryEngine(
+            resolver,
+            pool_size=getattr(settings, 'MX_DIRECT_POOL_SIZE', 2),
+            max_messages=getattr(settings, 'ASYNC_SMTP_SESSION_MESSAGES', 100),
+            timeout=getattr(settings, 'EMAIL_TIMEOUT', None),
+            local_hostname=getattr(settings, 'MX_DIRECT_HELO_HOSTNAME', '') or None,
+        )
+
+    routes = tuple(sorted(getattr(settings, 'MX_DIRECT_ROUTES', {}).items()))
+    return register_engine(('mx', getattr(settings, 'MX_DIRECT_PORT', 25), routes), build)
@@ -0,0 +1,444 @@
+"""
+Compiled render plans and the render pipeline for campaign emails.
+
+Variable substitution and the tracking rewrites (separator image, click
+tracking links and open pixel) depend only on the Email template, so they
+are worked out once per Email version and cached for the life of the
+process. Rendering a message for one recipient then only fills in the
+slots that differ per recipient (variables, tracking token, subscriber email)
+with a single join.
+
+render_email() runs a message through a fixed sequence of stages (body,
+footer, quoted original, unsubscribe block, ad footer, plain text). Campaign
+sends, single/API sends, test sends and dashboard previews all go through
+it, so they produce the same message.
+"""
+
+import re
+import threading
+from collections import OrderedDict
+from urllib.parse import quote
+
+# Slot markers injected into the template while compiling. The control
+# characters never occur in real email bodies and survive the tracking
+# regexes untouched; quote() turns them into %02/%03, which lets us tell
+# apart slots that ended up inside a URL-quoted tracking link.
+_VAR_MARK = '\x02V{}\x03'
+_TRACKING_MARK = '\x02T\x03'
+_EMAIL_MARK = '\x02E\x03'
+_SLOT_RE = re.compile(r'\x02([VTE])(\d*)\x03|%02([VE])(\d*)%03')
+
+# Placeholder syntax: the campaign sender accepts "{{ Key }}" with optional
+# whitespace in any case; the single/API sender only accepts "{{key}}".
+_LOOSE_PLACEHOLDER_RE = re.compile(r'\{\{\s*([^{}]+?)\s*\}\}')
+_EXACT_PLACEHOLDER_RE = re.compile(r'\{\{([^{}]+?)\}\}')
+
+# Part kinds
+_LITERAL = 0
+_VAR = 1
+_VAR_QUOTED = 2
+_TRACKING_ID = 3
+_EMAIL = 4
+_EMAIL_QUOTED = 5
+
+PLAN_CACHE_SIZE = 512
+
+_plan_cache = OrderedDict()
+_plan_cache_lock = threading.Lock()
+
+
+def safe_variable_str(val):
+    """Convert a variable value to a string for substitution; avoid 'nan' from pandas/float."""
+    if val is None:
+        return ''
+    if isinstance(val, float) and (val != val or val == float('inf') or val == float('-inf')):
+        return ''
+    s = str(val).strip()
+    return '' if s.lower() == 'nan' else s
+
+
+class TemplatePlan:
+    """A text template split into literal segments and variable slots."""
+
+    def __init__(self, parts, loose):
+        self.parts = parts
+        self.loose = loose
+
+    def lookup_table(self, variables):
+        """Normalise a variables dict the way this plan looks keys up."""
+        if not variables:
+            return {}
+        if not self.loose:
+            return {key: safe_variable_str(value) for key, value in variables.items()}
+        table = {}
+        for key, value in variables.items():
+            # First match wins, like the sequential re.sub passes did
+            table.setdefault(str(key).lower(), safe_variable_str(value))
+        return table
+
+    def render(self, variables=None, tracking_id='', subscriber_email='', table=None):
+        if table is None:
+            table = self.lookup_table(variables)
+        out = []
+        append = out.append
+        for kind, payload in self.parts:
+            if kind == _LITERAL:
+                append(payload)
+            elif kind == _VAR:
+                key, literal = payload
+                append(table.get(key, literal))
+            elif kind == _VAR_QUOTED:
+                key, literal = payload
+                append(quote(table.get(key, literal)))
+            elif kind == _TRACKING_ID:
+                append(tracking_id)
+            elif kind == _EMAIL:
+                append(subscriber_email)
+            else:
+                append(quote(subscriber_email, safe=''))
+        return ''.join(out)
+
+
+class EmailRenderPlan:
+    """Compiled subject, HTML body, plain-text body and footer of one Email version."""
+
+    def __init__(self, version, subject, html, footer, text=None):
+        self.version = version
+        self.subject = subject
+        self.html = html
+        self.footer = footer
+        self.text = text
+
+    def render_subject(self, variables):
+        return self.subject.render(variables)
+
+    def render_html(self, variables, tracking_id, subscriber_email):
+        """Body with variables substituted and separator, click tracking and pixel applied."""
+        return self.html.render(variables, str(tracking_id), subscriber_email)
+
+    def render_footer(self, variables):
+        """Assigned EmailFooter with variables substituted ('' if the Email has none)."""
+        if self.footer is None:
+            return ''
+        return self.footer.render(variables)
+
+    def render_text(self, variables):
+        """Stored body_text with variables substituted."""
+        if self.text is None:
+            return ''
+        return self.text.render(variables)
+
+
+def _tokenize(text, loose, static_vars, slot_keys):
+    """Replace placeholders with baked static values or slot markers."""
+    pattern = _LOOSE_PLACEHOLDER_RE if loose else _EXACT_PLACEHOLDER_RE
+
+    def replace(match):
+        key = match.group(1).lower() if loose else match.group(1)
+        if key in static_vars:
+            return static_vars[key]
+        slot_keys.append((key, match.group(0)))
+        return _VAR_MARK.format(len(slot_keys) - 1)
+
+    return pattern.sub(replace, text)
+
+
+def _split(marked, slot_keys):
+    """Split marked text into (kind, payload) parts."""
+    parts = []
+    pos = 0
+    for match in _SLOT_RE.finditer(marked):
+        if match.start() > pos:
+            parts.append((_LITERAL, marked[pos:match.start()]))
+        pos = match.end()
+        if match.group(1):
+            kind, index = match.group(1), match.group(2)
+            if kind == 'V':
+                parts.append((_VAR, slot_keys[int(index)]))
+            elif kind == 'T':
+                parts.append((_TRACKING_ID, None))
+            else:
+                parts.append((_EMAIL, None))
+        else:
+            kind, index = match.group(3), match.group(4)
+            if kind == 'V':
+                parts.append((_VAR_QUOTED, slot_keys[int(index)]))
+            else:
+                parts.append((_EMAIL_QUOTED, None))
+    if pos < len(marked):
+        parts.append((_LITERAL, marked[pos:]))
+    return _merge_literals(parts)
+
+
+def _merge_literals(parts):
+    merged = []
+    for kind, payload in parts:
+        if kind == _LITERAL and merged and merged[-1][0] == _LITERAL:
+            merged[-1] = (_LITERAL, merged[-1][1] + payload)
+        else:
+            merged.append((kind, payload))
+    return merged
+
+
+def compile_template(text, loose=False, static_vars=None):
+    """Compile plain placeholder substitution (subject lines, footers)."""
+    static_vars = _static_table(static_vars, loose)
+    slot_keys = []
+    marked = _tokenize(text or '', loose, static_vars, slot_keys)
+    return TemplatePlan(_split(marked, slot_keys), loose)
+
+
+def _static_table(static_vars, loose):
+    static_vars = static_vars or {}
+    if loose:
+        return {str(k).lower(): safe_variable_str(v) for k, v in static_vars.items()}
+    return {k: safe_variable_str(v) for k, v in static_vars.items()}
+
+
+def compile_tracked_html(html_content, site_url, loose=False, normalize_breaks=False, static_vars=None, email=None):
+    """
+    Compile an HTML body into a plan that reproduces the per-send chain
+    (optional <p> normalisation, variable substitution, separator image, click
+    tracking and open pixel) without running any regex at render time.
+
+    Variable values are treated as opaque text: they are inserted after the
+    tracking rewrites instead of being rescanned by them. Links are tracked
+    through the ``email``'s link table (campaigns.links); links whose URL
+    contains a per-recipient variable, or all links when no ``email`` is
+    given, are left untracked.
+    """
+    from .links import link_ids_for
+    from .tasks import (
+        _normalize_html_line_breaks,
+        _replace_hr_with_separator,
+        _trackable_links,
+        _wrap_links_with_tracking,
+        _add_tracking_pixel,
+    )
+
+    html_content = html_content or ''
+    if normalize_breaks:
+        html_content = _normalize_html_line_breaks(html_content)
+
+    static_vars = _static_table(static_vars, loose)
+    slot_keys = []
+    marked = _tokenize(html_content, loose, static_vars, slot_keys)
+    link_ids = {}
+    if email is not None:
+        urls = [url for url in _trackable_links(marked, base_url=site_url) if '\x02' not in url]
+        link_ids = link_ids_for(email, urls)
+    marked = _replace_hr_with_separator(marked, _TRACKING_MARK, _EMAIL_MARK, base_url=site_url)
+    marked = _wrap_links_with_tracking(marked, _TRACKING_MARK, link_ids, base_url=site_url)
+    marked = _add_tracking_pixel(marked, _TRACKING_MARK, _EMAIL_MARK, base_url=site_url)
+    return TemplatePlan(_split(marked, slot_keys), loose)
+
+
+def compile_untracked_html(html_content, loose=False, normalize_breaks=False, static_vars=None):
+    """Compile an HTML body with variable substitution only (previews and test sends)."""
+    from .tasks import _normalize_html_line_breaks
+
+    html_content = html_content or ''
+    if normalize_breaks:
+        html_content = _normalize_html_line_breaks(html_content)
+    return compile_template(html_content, loose=loose, static_vars=static_vars)
+
+
+def get_render_plan(email, site_url, site_name, sender_email, loose=False, normalize_breaks=False, tracked=True):
+    """
+    Return the compiled plan for an Email, building it on first use.
+
+    Plans are cached per process, keyed by the Email id and invalidated when
+    the Email (or its footer) is updated or the site/sender values change.
+    Untracked plans (``tracked=False``) leave links alone and add no pixel.
+    """
+    footer = email.footer
+    version = (
+        email.updated_at,
+        footer.pk if footer else None,
+        footer.updated_at if footer else None,
+        site_url,
+        site_name,
+        sender_email,
+    )
+    key = (email.pk, loose, normalize_breaks, tracked)
+
+    with _plan_cache_lock:
+        plan = _plan_cache.get(key)
+        if plan is not None and plan.version == version:
+            _plan_cache.move_to_end(key)
+            return plan
+
+    static_vars = {'site_name': site_name, 'site_url': site_url, 'sender_email': sender_email}
+    if tracked:
+        html = compile_tracked_html(
+            email.body_html or '',
+            site_url,
+            loose=loose,
+            normalize_breaks=normalize_breaks,
+            static_vars=static_vars,
+            email=email,
+        )
+    else:
+        html = compile_untracked_html(
+            email.body_html or '',
+            loose=loose,
+            normalize_breaks=normalize_breaks,
+            static_vars=static_vars,
+        )
+    plan = EmailRenderPlan(
+        version,
+        subject=compile_template(email.subject or '', loose=loose, static_vars=static_vars),
+        html=html,
+        footer=compile_template(footer.html_content, loose=loose, static_vars=static_vars) if footer else None,
+        text=compile_template(email.body_text or '', loose=loose, static_vars=static_vars),
+    )
+
+    with _plan_cache_lock:
+        _plan_cache[key] = plan
+        _plan_cache.move_to_end(key)
+        while len(_plan_cache) > PLAN_CACHE_SIZE:
+            _plan_cache.popitem(last=False)
+    return plan
+
+
+def clear_render_plans():
+    """Drop all cached plans (used by tests and after bulk template edits)."""
+    with _plan_cache_lock:
+        _plan_cache.clear()
+
+
+_ad_footer_cache = {}
+_ad_footer_lock = threading.Lock()
+
+
+def ad_footer_html(site_url, site_name, site_logo):
+    """The rendered emails/ad_footer.html for a site (cached per process; it only depends on the site)."""
+    key = (site_url, site_name, site_logo)
+    with _ad_footer_lock:
+        cached = _ad_footer_cache.get(key)
+    if cached is None:
+        from django.template.loader import render_to_string
+
+        cached = render_to_string('emails/ad_footer.html', {
+            'site_url': site_url,
+            'site_name': site_name,
+            'site_logo': site_logo,
+        })
+        with _ad_footer_lock:
+            _ad_footer_cache[key] = cached
+    return cached
+
+
+class RenderedEmail:
+    """Subject, HTML and plain-text parts produced by render_email()."""
+
+    def __init__(self, subject, html, text):
+        self.subject = subject
+        self.html = html
+        self.text = text
+
+
+class RenderJob:
+    """One message on its way through the render stages."""
+
+    def __init__(self, email, context, plan, variables, subscriber_email, subscriber_uuid,
+                 tracking_id, original_email_message, preview):
+        self.email = email
+        self.context = context
+        self.plan = plan
+        self.variables = variables
+        self.table = plan.subject.lookup_table(variables)
+        self.subscriber_email = subscriber_email
+        self.subscriber_uuid = subscriber_uuid
+        self.tracking_id = tracking_id
+        self.original_email_message = original_email_message
+        self.preview = preview
+        self.subject = ''
+        self.html_parts = []
+
+
+def body_stage(job):
+    """Subject and HTML body: variables substituted, plus separator, click tracking and pixel when tracked."""
+    plan = job.plan
+    job.subject = plan.subject.render(table=job.table)
+    tracking = ''
+    if job.tracking_id:
+        from .tokens import mint_token
+
+        # Open and click URLs carry a signed token rather than the bare event id
+        tracking = mint_token(job.tracking_id, job.email.pk, job.email.campaign_id, job.subscriber_email)
+    job.html_parts.append(plan.html.render(
+        tracking_id=tracking, subscriber_email=job.subscriber_email, table=job.table,
+    ))
+
+
+def footer_stage(job):
+    """The EmailFooter assigned to the Email, if any."""
+    if job.plan.footer is not None:
+        job.html_parts.append(job.plan.footer.render(table=job.table))
+
+
+def quoted_original_stage(job):
+    """For auto-reply campaigns, the incoming message being replied to."""
+    if job.original_email_message is None:
+        return
+    campaign_name_lower = job.email.campaign.name.lower() if job.email.campaign else ''
+    if 'auto' in campaign_name_lower or 'reply' in campaign_name_lower:
+        from .tasks import _quoted_original_html
+
+        job.html_parts.append(_quoted_original_html(job.original_email_message))
+
+
+def unsubscribe_stage(job):
+    """Unsubscribe link and the sender's postal address, unless the sender opted out."""
+    context = job.context
+    # Recipients that aren't subscribers get no link; previews show a generic one
+    if context.show_unsubscribe and (job.subscriber_uuid or job.preview):
+        job.html_parts.append(context.unsubscribe_html(job.subscriber_uuid))
+
+
+def ads_stage(job):
+    """The promotional footer for senders without a verified promo."""
+    if job.context.show_ads:
+        job.html_parts.append(job.context.ads_html)
+
+
+MESSAGE_STAGES = (body_stage, footer_stage, quoted_original_stage, unsubscribe_stage, ads_stage)
+
+
+def render_email(email, context, variables=None, subscriber_email='', subscriber_uuid=None, tracking_id=None,
+                 original_email_message=None, preview=False, stages=MESSAGE_STAGES):
+    """
+    Render one message of ``email`` for one recipient.
+
+    ``context`` is the sending user's SendContext. Messages are tracked (click
+    tracking, separator image and open pixel) when a ``tracking_id`` is given;
+    previews and test sends pass none. The Email's compiled plan and the
+    context's footer blocks are shared by every recipient; only the variable
+    slots, tracking values and plain-text conversion are worked out per call.
+    """
+    from .tasks import _html_to_plain_text
+
+    plan = get_render_plan(
+        email,
+        site_url=context.site_url,
+        site_name=context.site_name,
+        sender_email=context.user_email,
+        loose=True,
+        normalize_breaks=True,
+        tracked=tracking_id is not None,
+    )
+    job = RenderJob(
+        email, context, plan, variables, subscriber_email, subscriber_uuid,
+        tracking_id, original_email_message, preview,
+    )
+    for stage in stages:
+        stage(job)
+
+    html_content = ''.join(job.html_parts)
+    # Plain part is derived from the final HTML (stored body_text often loses paragraph breaks)
+    if html_content.strip():
+        text_content = _html_to_plain_text(html_content)
+    else:
+        text_content = plan.text.render(table=job.table)
+    return RenderedEmail(job.subject, html_content, text_content)
@@ -0,0 +1,94 @@
+"""
+Retry policy for failed deliveries.
+
+SMTP failures are sorted into transient ones (4xx replies, dropped or
+refused connections, timeouts), which are worth another attempt, and
+permanent ones (5xx replies, bad templates, ...), which are not. Transient
+failures put the EmailSendRequest back to 'pending' with scheduled_for moved
+to ``next_attempt_at``, so the normal sender/scheduler drains retries.
+"""
+
+import random
+import smtplib
+from datetime import timedelta
+
+from django.conf import settings
+from django.utils import timezone as tz
+
+TRANSIENT = 'transient'
+PERMANENT = 'permanent'
+
+# Raised when the server is unreachable or the session drops mid-send
+_TRANSIENT_ERRORS = (
+    smtplib.SMTPServerDisconnected,
+    smtplib.SMTPConnectError,
+    ConnectionError,
+    TimeoutError,
+)
+
+
+def _code_class(code):
+    try:
+        code = int(code)
+    except (TypeError, ValueError):
+        return None
+    if 400 <= code < 500:
+        return TRANSIENT
+    if 500 <= code < 600:
+        return PERMANENT
+    return None
+
+
+def classify_send_error(exc):
+    """Return TRANSIENT or PERMANENT for an exception raised while sending."""
+    if isinstance(exc, smtplib.SMTPRecipientsRefused):
+        # {recipient: (code, message)}; retry only if every refusal was temporary
+        classes = {_code_class(code) for code, _message in exc.recipients.values()}
+        return TRANSIENT if classes == {TRANSIENT} else PERMANENT
+    if isinstance(exc, smtplib.SMTPConnectError):
+        return TRANSIENT
+    if isinstance(exc, smtplib.SMTPResponseException):
+        return _code_class(exc.smtp_code) or TRANSIENT
+    if isinstance(exc, _TRANSIENT_ERRORS):
+        return TRANSIENT
+    return PERMANENT
+
+
+def retry_delay(attempts):
+    """
+    Seconds to wait before attempt number ``attempts + 1``.
+
+    Exponential in the number of failed attempts, capped at
+    SEND_RETRY_MAX_SECONDS, with the upper half jittered so a relay blip
+    doesn't bring every deferred message back in the same second.
+    """
+    base = getattr(settings, 'SEND_RETRY_BASE_SECONDS', 60)
+    cap = getattr(settings, 'SEND_RETRY_MAX_SECONDS', 3600)
+    delay = min(cap, base * (2 ** max(attempts - 1, 0)))
+    return random.uniform(delay / 2, delay)
+
+
+def schedule_retry(request_obj, exc):
+    """
+    Record a failed attempt on a send request.
+
+    Returns True if the request was put back to 'pending' for another
+    attempt, False if it was marked 'failed' for good.
+    """
+    request_obj.attempts += 1
+    request_obj.error_message = str(exc)
+    max_attempts = getattr(settings, 'SEND_RETRY_MAX_ATTEMPTS', 5)
+
+    if classify_send_error(exc) == TRANSIENT and request_obj.attempts < max_attempts:
+        request_obj.next_attempt_at = tz.now() + timedelta(seconds=retry_delay(request_obj.attempts))
+        request_obj.scheduled_for = request_obj.next_attempt_at
+        request_obj.status = 'pending'
+        request_obj.save(update_fields=[
+            'status', 'attempts', 'next_attempt_at', 'scheduled_for', 'error_message', 'updated_at',
+        ])
+        return True
+
+    request_obj.status = 'failed'
+    request_obj.next_attempt_at = None
+    request_obj.save(update_fields=['status', 'attempts', 'next_attempt_at', 'error_message', 'updated_at'])
+    return False
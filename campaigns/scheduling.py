@@ -0,0 +1,293 @@
+"""
+When scheduled sends go out.
+
+wait_delay() turns an Email's wait_time/wait_unit into a Delay, with months
+added on the calendar (Jan 31 + 1 month is Feb 28/29) rather than as 30 days.
+step_table() resolves a campaign's whole sequence once into a StepTable of
+steps and their delays, so finding and timing the next step of a drip is a
+lookup instead of a query per send, and a campaign with materialize_sequence
+can queue a subscriber's whole sequence at once. Each step's due time is
+chained from the previous step's (see StepTable.schedule()) rather than added
+up as a fixed offset, since calendar months and send windows don't add up.
+
+SendWindow implements a campaign's optional daily delivery window
+(Campaign.send_window_start/end, in the sender's UserProfile.timezone or the
+subscriber's Subscriber.timezone). A send due outside the window moves into
+the next one, and rather than all of them piling up on the opening minute,
+each lands in one of the window's SEND_WINDOW_SLOT_SECONDS slots, picked by
+a stable hash of the recipient and email. Steps whose delay is whole days
+are spread over the window of the day they fall on as well, so a drip step
+doesn't go to every subscriber at the hour the previous step went out.
+"""
+
+import calendar
+import hashlib
+import threading
+import time as _time
+from collections import namedtuple
+from datetime import datetime, timedelta
+
+import pytz
+from django.conf import settings
+from django.utils import timezone as tz
+
+
+# Delays in these units only fix the day a step is due, not the hour
+DAY_UNITS = ('days', 'weeks', 'months')
+
+_UNIT_SECONDS = {
+    'seconds': 1,
+    'minutes': 60,
+    'hours': 3600,
+    'days': 86400,
+    'weeks': 7 * 86400,
+}
+
+# Seconds a StepTable is trusted before the campaign's emails are re-read;
+# saves in this process invalidate it immediately (see campaigns.signals)
+STEP_TABLE_TTL = 60
+
+
+def add_months(when, months):
+    """``when`` moved by whole calendar months, clamping the day to the target month's length."""
+    if not months:
+        return when
+    month_index = when.year * 12 + when.month - 1 + months
+    year, month = divmod(month_index, 12)
+    month += 1
+    day = min(when.day, calendar.monthrange(year, month)[1])
+    return when.replace(year=year, month=month, day=day)
+
+
+class Delay(namedtuple('Delay', 'months delta')):
+    """A wait of ``months`` calendar months followed by a fixed ``delta``."""
+
+    __slots__ = ()
+
+    def after(self, when):
+        return add_months(when, self.months) + self.delta
+
+    def __bool__(self):
+        return bool(self.months or self.delta)
+
+
+NO_DELAY = Delay(0, timedelta(0))
+
+
+def wait_delay(wait_time, wait_unit='days'):
+    """The Delay for ``wait_time`` ``wait_unit``s; unknown units and non-positive times mean no wait."""
+    wait_time = int(wait_time or 0)
+    if wait_time <= 0:
+        return NO_DELAY
+    unit = wait_unit or 'days'
+    if unit == 'months':
+        return Delay(wait_time, timedelta(0))
+    seconds = _UNIT_SECONDS.get(unit)
+    if seconds is None:
+        return NO_DELAY
+    return Delay(0, timedelta(seconds=wait_time * seconds))
+
+
+def email_delay(email):
+    """The Delay before ``email`` goes out after the previous step (or after being queued)."""
+    return wait_delay(email.wait_time, email.wait_unit)
+
+
+def due_after(email, start=None):
+    """When ``email`` is due if its wait starts at ``start`` (default now)."""
+    return email_delay(email).after(start or tz.now())
+
+
+# One step of a sequence: ``delay`` is its wait after the previous step
+Step = namedtuple('Step', 'index email_id order subject wait_time wait_unit delay')
+
+
+class StepTable:
+    """A campaign's emails in send order with each step's Delay."""
+
+    def __init__(self, campaign_id, rows, loaded_at=None):
+        self.campaign_id = campaign_id
+        self.loaded_at = _time.monotonic() if loaded_at is None else loaded_at
+        self.steps = []
+        self._index = {}
+        for index, (email_id, order, subject, wait_time, wait_unit) in enumerate(rows):
+            step = Step(index, email_id, order, subject, wait_time, wait_unit, wait_delay(wait_time, wait_unit))
+            self.steps.append(step)
+            self._index[email_id] = index
+
+    def __len__(self):
+        return len(self.steps)
+
+    def __getitem__(self, index):
+        return self.steps[index]
+
+    def step_for(self, email_id):
+        index = self._index.get(email_id)
+        return None if index is None else self.steps[index]
+
+    def next_after(self, email_id):
+        """The first step with a higher order than ``email_id``'s, or None if there is none (or it is unknown)."""
+        index = self._index.get(email_id)
+        if index is None:
+            return None
+        order = self.steps[index].order
+        for step in self.steps[index + 1:]:
+            if step.order > order:
+                return step
+        return None
+
+    def schedule(self, start, key, subscriber_timezone='', window=None, from_index=0, spread_first=False):
+        """
+        (step, due) for the steps a recipient gets from step ``from_index``
+        on, where that step is due at ``start`` and each later one waits its
+        delay after the one before. Each step is placed in ``window`` (if any)
+        before the next one's delay is counted from it, as sending them one at
+        a time would; ``key`` (the recipient) and the email id pick its slot.
+        """
+        step, due = self.steps[from_index], start
+        while step is not None:
+            if window is not None:
+                # Unless spread_first, the first step goes out as soon as the window allows
+                spread_day = (spread_first or step.index != from_index) and spreads_over_day(step)
+                due = window.place(due, f"{key}:{step.email_id}", subscriber_timezone, spread_day=spread_day, now=start)
+            yield step, due
+            step = self.next_after(step.email_id)
+            if step is not None:
+                due = step.delay.after(due)
+
+
+_step_tables = {}
+_step_tables_lock = threading.Lock()
+
+
+def step_table(campaign_id):
+    """The campaign's StepTable, loaded with one query and cached per process."""
+    now = _time.monotonic()
+    with _step_tables_lock:
+        table = _step_tables.get(campaign_id)
+        if table is not None and now - table.loaded_at < STEP_TABLE_TTL:
+            return table
+
+    from .models import Email
+
+    rows = list(
+        Email.objects.filter(campaign_id=campaign_id)
+        .order_by('order', 'created_at')
+        .values_list('id', 'order', 'subject', 'wait_time', 'wait_unit')
+    )
+    table = StepTable(campaign_id, rows, loaded_at=now)
+    with _step_tables_lock:
+        _step_tables[campaign_id] = table
+    return table
+
+
+def next_step(campaign_id, email_id):
+    """The step after ``email_id`` in its campaign, reloading the table once if the email is new to it."""
+    table = step_table(campaign_id)
+    if table.step_for(email_id) is None:
+        invalidate_step_table(campaign_id)
+        table = step_table(campaign_id)
+    return table.next_after(email_id)
+
+
+def invalidate_step_table(campaign_id=None):
+    """Forget the cached StepTable for ``campaign_id`` (or all of them)."""
+    with _step_tables_lock:
+        if campaign_id is None:
+            _step_tables.clear()
+        else:
+            _step_tables.pop(campaign_id, None)
+
+
+def spreads_over_day(email):
+    """True if ``email``'s delay is a whole number of days, so it may go out any time in that day's window."""
+    return bool(email.wait_time) and (email.wait_unit or 'days') in DAY_UNITS
+
+
+def _zone(name):
+    try:
+        return pytz.timezone(name or 'UTC')
+    except pytz.UnknownTimeZoneError:
+        return pytz.UTC
+
+
+def _slot_fraction(key):
+    """Stable value in [0, 1) for spreading ``key`` over a window."""
+    return int(hashlib.sha1(key.encode('utf-8')).hexdigest()[:8], 16) / 0x100000000
+
+
+class SendWindow:
+    """A daily [start, end) delivery window; end <= start means it spans midnight."""
+
+    def __init__(self, start, end, timezone_name='UTC', per_subscriber=False):
+        self.start = start
+        self.end = end
+        self.zone = _zone(timezone_name)
+        self.per_subscriber = per_subscriber
+        self.slot = timedelta(seconds=max(getattr(settings, 'SEND_WINDOW_SLOT_SECONDS', 300), 1))
+
+    @classmethod
+    def for_campaign(cls, campaign, profile=None):
+        """The campaign's window, or None if it sends around the clock."""
+        start, end = campaign.send_window_start, campaign.send_window_end
+        if start is None or end is None or start == end:
+            return None
+        if profile is None:
+            from analytics.models import UserProfile
+
+            profile = UserProfile.objects.filter(user_id=campaign.user_id).only('timezone').first()
+        return cls(start, end, getattr(profile, 'timezone', 'UTC'), campaign.send_window_timezone == 'subscriber')
+
+    def _zone_for(self, subscriber_timezone):
+        if self.per_subscriber and subscriber_timezone:
+            return _zone(subscriber_timezone)
+        return self.zone
+
+    def _interval(self, day, zone):
+        """The window opening on local date ``day``, as aware datetimes."""
+        opens = zone.localize(datetime.combine(day, self.start))
+        close_day = day if self.end > self.start else day + timedelta(days=1)
+        return opens, zone.localize(datetime.combine(close_day, self.end))
+
+    def _window_at_or_after(self, when, zone):
+        """The (open, close) interval containing ``when``, else the next one."""
+        day = when.astimezone(zone).date()
+        for offset in (-1, 0, 1, 2):
+            opens, closes = self._interval(day + timedelta(days=offset), zone)
+            if closes > when:
+                return opens, closes
+        raise AssertionError("unreachable: a window closes within two days")
+
+    def _slot_in(self, opens, closes, key):
+        slots = max(int((closes - opens) / self.slot), 1)
+        return opens + self.slot * int(_slot_fraction(key) * slots)
+
+    def place(self, due, key, subscriber_timezone='', spread_day=False, now=None):
+        """
+        When a send due at ``due`` should go out. ``key`` identifies the send
+        (recipient and email) and picks its slot. With ``spread_day``, the send
+        may go anywhere in the window of the local day it is due, not only later.
+        """
+        zone = self._zone_for(subscriber_timezone)
+        now = now or tz.now()
+        if spread_day:
+            local_day = due.astimezone(zone).date()
+            opens, closes = self._interval(local_day, zone)
+            if closes <= due:
+                opens, closes = self._interval(local_day + timedelta(days=1), zone)
+            slot = self._slot_in(opens, closes, key)
+            if slot >= now:
+                return slot
+        opens, closes = self._window_at_or_after(due, zone)
+        if opens <= due:
+            return due
+        return self._slot_in(opens, closes, key)
+
+
+def apply_send_window(campaign, due, key, subscriber_timezone='', spread_day=False, window=None):
+    """``due`` moved into the campaign's send window (unchanged if it has none)."""
+    if window is None:
+        window = SendWindow.for_campaign(campaign)
+    if window is None:
+        return due
+    return window.place(due, key, subscriber_timezone, spread_day)
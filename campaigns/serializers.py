@@ -62,6 +62,9 @@ class EmailSerializer(serializers.ModelSerializer):
 class CampaignSerializer(serializers.ModelSerializer):
     emails = EmailSerializer(many=True, read_only=True)
     emails_count = serializers.ReadOnlyField()
+    sent_count = serializers.ReadOnlyField(source='counts.sent_count')
+    open_count = serializers.ReadOnlyField(source='counts.open_count')
+    click_count = serializers.ReadOnlyField(source='counts.click_count')
     open_rate = serializers.ReadOnlyField()
     click_rate = serializers.ReadOnlyField()
     subscriber_list = serializers.PrimaryKeyRelatedField(
@@ -75,9 +78,18 @@ class CampaignSerializer(serializers.ModelSerializer):
         fields = ['id', 'name', 'description', 'slug', 'subscriber_list', 
                  'is_active', 'created_at', 'updated_at', 'emails', 
                  'emails_count', 'sent_count', 'open_count', 'click_count',
-                 'open_rate', 'click_rate']
-        read_only_fields = ['id', 'slug', 'created_at', 'updated_at', 
-                          'sent_count', 'open_count', 'click_count']
+                 'open_rate', 'click_rate',
+                 'send_window_start', 'send_window_end', 'send_window_timezone',
+                 'materialize_sequence']
+        read_only_fields = ['id', 'slug', 'created_at', 'updated_at']
+
+    def validate(self, attrs):
+        """A send window needs both ends (or neither)."""
+        start = attrs.get('send_window_start', getattr(self.instance, 'send_window_start', None))
+        end = attrs.get('send_window_end', getattr(self.instance, 'send_window_end', None))
+        if (start is None) != (end is None):
+            raise serializers.ValidationError("Set both send_window_start and send_window_end, or neither.")
+        return attrs
         
     def create(self, validated_data):
         user = self.context['request'].user
@@ -1,7 +1,7 @@
-from django.db.models.signals import post_save
+from django.db.models.signals import post_delete, post_save
 from django.dispatch import receiver
 from django.contrib.auth.models import User
-from .models import EmailEvent, Campaign, Email
+from .models import EmailEvent, Campaign, Email, EmailSendRequest
 import logging
 
 logger = logging.getLogger(__name__)
@@ -49,38 +49,50 @@ def update_campaign_metrics(sender, instance, created, **kwargs):
     """
     Automatically update campaign metrics when an EmailEvent is created.
     This ensures analytics are always accurate regardless of how emails are sent.
+    Events saved in bulk (bulk_create) don't get here; their writers count them.
     """
     if not created:
         return  # Only process new events
-    
-    campaign = instance.email.campaign
-    
-    if instance.event_type == 'sent':
-        campaign.sent_count += 1
-        campaign.save(update_fields=['sent_count'])
-        logger.info(f"Campaign {campaign.id} sent_count incremented to {campaign.sent_count}")
-        
-    elif instance.event_type == 'opened':
-        campaign.open_count += 1
-        campaign.save(update_fields=['open_count'])
-        logger.info(f"Campaign {campaign.id} open_count incremented to {campaign.open_count}")
-        
-    elif instance.event_type == 'clicked':
-        campaign.click_count += 1
-        campaign.save(update_fields=['click_count'])
-        logger.info(f"Campaign {campaign.id} click_count incremented to {campaign.click_count}")
-        
-    elif instance.event_type == 'bounced':
-        campaign.bounce_count += 1
-        campaign.save(update_fields=['bounce_count'])
-        logger.info(f"Campaign {campaign.id} bounce_count incremented to {campaign.bounce_count}")
-        
-    elif instance.event_type == 'unsubscribed':
-        campaign.unsubscribe_count += 1
-        campaign.save(update_fields=['unsubscribe_count'])
-        logger.info(f"Campaign {campaign.id} unsubscribe_count incremented to {campaign.unsubscribe_count}")
-        
-    elif instance.event_type == 'complained':
-        campaign.complaint_count += 1
-        campaign.save(update_fields=['complaint_count'])
-        logger.info(f"Campaign {campaign.id} complaint_count incremented to {campaign.complaint_count}")
+
+    from .counters import count_event
+
+    count_event(instance.email.campaign_id, instance.event_type)
+
+
+@receiver(post_save, sender=EmailSendRequest)
+def notify_send_scheduler(sender, instance, **kwargs):
+    """
+    Wake the resident send scheduler (cron.py run_scheduler) for new or rescheduled requests.
+    """
+    from .dispatch import notify_send_request
+
+    try:
+        notify_send_request(instance)
+    except Exception as e:
+        logger.warning(f"Could not notify send scheduler about request {instance.id}: {str(e)}")
+
+
+@receiver(post_save, sender=Email)
+@receiver(post_delete, sender=Email)
+def invalidate_campaign_steps(sender, instance, **kwargs):
+    """
+    Drop this process's cached step table (campaigns.scheduling) when a campaign's emails change.
+    """
+    from .scheduling import invalidate_step_table
+
+    invalidate_step_table(instance.campaign_id)
+
+
+@receiver(post_save, sender=Campaign)
+def cancel_sequences_of_inactive_campaign(sender, instance, created, **kwargs):
+    """
+    Cancel the materialized sends still waiting when a campaign is deactivated.
+    """
+    if created or instance.is_active:
+        return
+
+    from .tasks import cancel_materialized_requests
+
+    cancelled = cancel_materialized_requests(campaign_id=instance.pk)
+    if cancelled:
+        logger.info(f"Cancelled {cancelled} queued sequence emails of deactivated campaign {instance.id}")
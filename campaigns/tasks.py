@@ -1,14 +1,17 @@
 from django.core.mail import EmailMultiAlternatives
 from django.utils import timezone as tz
 from django.conf import settings
-from django.template.loader import render_to_string
-from datetime import timedelta
 import logging
+import smtplib
 import uuid
 import sys
 import re
 import html
 from analytics.models import UserProfile
+from .dkim import signer_for
+from .mime import CampaignEmail, MessageSkeleton
+from .rendering import ad_footer_html, render_email
+from .scheduling import SendWindow, apply_send_window, next_step, spreads_over_day, step_table
 
 logger = logging.getLogger(__name__)
 
@@ -59,81 +62,155 @@ def _normalize_html_line_breaks(html_content: str) -> str:
     return html_content.strip()
 
 
-def _html_to_plain_text(html_content):
-    """Convert HTML to readable plain text, preserving useful web/mail links."""
-    if not html_content:
-        return ""
-
-    # Remove non-content regions first
-    html_content = re.sub(r'<(script|style|head)[^>]*>.*?</\1>', '', html_content, flags=re.IGNORECASE | re.DOTALL)
-
-    # Replace <a href="URL">text</a> with sensible plain-text representation
-    def replace_link(match):
-        url = (match.group(1) or '').strip()
-        text = match.group(2) or ''
-        text = re.sub(r'<[^>]+>', '', text)
-        text = html.unescape(text).strip()
-
-        if not text:
-            text = url
-
-        lower_url = url.lower()
-
-        # Don't leak noisy/non-user-facing URL schemes into plain text
-        if lower_url.startswith(('data:', 'cid:', 'javascript:')):
-            return text
-
-        # mailto links are useful; render as the address
-        if lower_url.startswith('mailto:'):
-            address = url[7:]
-            if text and text.lower() != address.lower():
-                return f"{text} ({address})"
-            return address
-
-        # Keep web links readable
-        if lower_url.startswith(('http://', 'https://')):
-            if text.lower() == url.lower():
-                return text
-            return f"{text} ({url})"
-
-        # Fallback for other schemes/relative links
+# html -> text conversion (see _html_to_plain_text)
+_NON_CONTENT_RE = re.compile(r'<(script|style|head)[^>]*>.*?</\1>', re.IGNORECASE | re.DOTALL)
+_NON_CONTENT_HINT_RE = re.compile(r'<(?:script|style|head)', re.IGNORECASE)
+# A link (<a ... href="...">text</a>) or any other tag; a '<' that can't start a tag is text
+_TOKEN_RE = re.compile(
+    r'<(?:[aA][^>]*[hH][rR][eE][fF]=["\'](?P<url>[^"\']+)["\'][^>]*>(?P<text>.*?)</[aA]>|(?P<tag>[a-zA-Z/!?][^>]*)>)',
+    re.DOTALL,
+)
+_TAG_TOKEN_RE = re.compile(r'<([a-zA-Z/!?][^>]*)>')
+_TAG_RE = re.compile(r'<[^>]+>')
+_BREAK_TAG_RE = re.compile(r'(br|hr)\s*/?', re.IGNORECASE)
+_BLANK_LINES_RE = re.compile(r'\n{3,}')
+_BLOCK_TAGS = ('p', 'div', 'h1', 'h2', 'h3', 'h4', 'h5', 'h6', 'section', 'article', 'blockquote', 'pre', 'tr')
+_BLOCK_CLOSE_TAGS = frozenset('/' + tag for tag in _BLOCK_TAGS)
+_CELL_CLOSE_TAGS = frozenset(('/td', '/th'))
+_TEXT_SEPARATOR = '\n----------------------------------------\n'
+_TAG_TEXT_CACHE_SIZE = 4096
+_tag_text_cache = {}
+
+
+def _plain_text_link(url, text):
+    """Plain-text rendering of one <a href> element."""
+    url = (url or '').strip()
+    text = text or ''
+    if '<' in text:
+        text = _TAG_RE.sub('', text)
+    if '&' in text:
+        text = html.unescape(text)
+    text = text.strip()
+
+    if not text:
+        text = url
+
+    lower_url = url.lower()
+
+    # Don't leak noisy/non-user-facing URL schemes into plain text
+    if lower_url.startswith(('data:', 'cid:', 'javascript:')):
         return text
 
-    # Pattern to match <a> tags with href
-    link_pattern = re.compile(r'<a[^>]*href=["\']([^"\']+)["\'][^>]*>(.*?)</a>', re.IGNORECASE | re.DOTALL)
-    html_content = link_pattern.sub(replace_link, html_content)
+    # mailto links are useful; render as the address
+    if lower_url.startswith('mailto:'):
+        address = url[7:]
+        if text and text.lower() != address.lower():
+            return f"{text} ({address})"
+        return address
 
-    # Replace block-level tags with line breaks for readability
-    html_content = re.sub(r'</(p|div|h[1-6]|section|article|blockquote|pre|tr)>', '\n\n', html_content, flags=re.IGNORECASE)
-    html_content = re.sub(r'<(p|div|h[1-6]|section|article|blockquote|pre|tr)[^>]*>', '\n', html_content, flags=re.IGNORECASE)
-
-    # Table/list structure hints
-    html_content = re.sub(r'</td>', '\t', html_content, flags=re.IGNORECASE)
-    html_content = re.sub(r'</th>', '\t', html_content, flags=re.IGNORECASE)
-    html_content = re.sub(r'<li[^>]*>', '\n- ', html_content, flags=re.IGNORECASE)
-    html_content = re.sub(r'</li>', '', html_content, flags=re.IGNORECASE)
-
-    # Replace <br> and <br/> with newlines
-    html_content = re.sub(r'<br\s*/?>', '\n', html_content, flags=re.IGNORECASE)
+    # Keep web links readable
+    if lower_url.startswith(('http://', 'https://')):
+        if text.lower() == url.lower():
+            return text
+        return f"{text} ({url})"
+
+    # Fallback for other schemes/relative links
+    return text
+
+
+def _tag_text(tag):
+    """Cached _plain_text_for_tag; email bodies repeat the same few tags over and over."""
+    replacement = _tag_text_cache.get(tag)
+    if replacement is None:
+        if len(_tag_text_cache) >= _TAG_TEXT_CACHE_SIZE:
+            _tag_text_cache.clear()
+        replacement = _tag_text_cache[tag] = _plain_text_for_tag(tag)
+    return replacement
+
+
+def _plain_text_for_tag(tag):
+    """Text that replaces one tag (the part between < and >)."""
+    name = tag.lower()
+    if name[0] == '/':
+        if name in _BLOCK_CLOSE_TAGS:
+            return '\n\n'
+        if name in _CELL_CLOSE_TAGS:
+            return '\t'
+        return ''
+    # Block-level tags become line breaks; lists become bullets
+    if name.startswith(_BLOCK_TAGS):
+        return '\n'
+    if name.startswith('li'):
+        return '\n- '
+    match = _BREAK_TAG_RE.fullmatch(tag)
+    if match:
+        return '\n' if match.group(1).lower() == 'br' else _TEXT_SEPARATOR
+    # Images, inline formatting and anything else are dropped
+    return ''
+
+
+def _html_to_text_pieces(html_content, out, links=True):
+    """Tokenize html_content in one left-to-right scan, appending text pieces to ``out``."""
+    append = out.append
+    if not links:
+        # Link text that decoded to markup: only tag handling applies
+        for i, token in enumerate(_TAG_TOKEN_RE.split(html_content)):
+            append(_tag_text(token) if i % 2 else token)
+        return
 
-    # Replace horizontal rule with plain separator
-    html_content = re.sub(r'<hr\s*/?>', '\n----------------------------------------\n', html_content, flags=re.IGNORECASE)
+    # split() yields [text, url, link text, tag, text, url, link text, tag, ...]
+    tokens = _TOKEN_RE.split(html_content)
+    append(tokens[0])
+    for i in range(1, len(tokens), 4):
+        tag = tokens[i + 2]
+        if tag is not None:
+            append(_tag_text(tag))
+        else:
+            text = _plain_text_link(tokens[i], tokens[i + 1])
+            if '<' in text:
+                # Link text may decode to markup; it gets the same tag handling
+                _html_to_text_pieces(text, out, links=False)
+            else:
+                append(text)
+        append(tokens[i + 3])
 
-    # Remove image tags entirely
-    html_content = re.sub(r'<img[^>]*>', '', html_content, flags=re.IGNORECASE)
 
-    # Remove all other HTML tags
-    html_content = re.sub(r'<[^>]+>', '', html_content)
+def _html_to_plain_text(html_content):
+    """Convert HTML to readable plain text, preserving useful web/mail links.
 
-    # Decode HTML entities
-    html_content = html.unescape(html_content)
+    Single scan over the markup: links are rendered as "text (url)" (mailto as
+    the address; data:, cid: and javascript: URLs are dropped), block tags
+    become blank lines, <li> a "- " bullet, <br> a newline, <hr> a dashed
+    separator, table cells tabs; script/style/head and all other tags are
+    removed. Entities are decoded and whitespace is collapsed at the end.
+    """
+    if not html_content:
+        return ""
 
-    # Clean up extra whitespace and newlines
-    html_content = re.sub(r'\n\s*\n\s*\n+', '\n\n', html_content)
-    html_content = re.sub(r'[^\S\n]+', ' ', html_content)
-    html_content = re.sub(r'\n[ \t]+', '\n', html_content)
+    # Remove non-content regions first (rare in email bodies, so only when present)
+    if _NON_CONTENT_HINT_RE.search(html_content):
+        html_content = _NON_CONTENT_RE.sub('', html_content)
+
+    pieces = []
+    _html_to_text_pieces(html_content, pieces)
+    text = html.unescape(''.join(pieces))
+
+    # Clean up extra whitespace: single spaces inside lines (a trailing one is
+    # kept), no indentation, at most one blank line in a row
+    lines = []
+    for line in text.split('\n'):
+        words = line.split()
+        if not words:
+            lines.append('')
+        elif line[-1].isspace():
+            lines.append(' '.join(words) + ' ')
+        else:
+            lines.append(' '.join(words))
+    text = '\n'.join(lines)
+    if '\n\n\n' in text:
+        text = _BLANK_LINES_RE.sub('\n\n', text)
 
-    return html_content.strip()
+    return text.strip()
 
 
 def _add_tracking_pixel(html_content, tracking_id, subscriber_email, base_url=None):
@@ -233,13 +310,14 @@ def _replace_hr_with_separator(html_content, tracking_id, subscriber_email, base
     return html_content
 
 
-def _wrap_links_with_tracking(html_content, tracking_id, subscriber_email, base_url=None):
-    """Wrap all links in HTML content with tracking redirects."""
-    from django.conf import settings
+# <a ... href="..."> tags whose destination can be click-tracked
+_LINK_HREF_RE = re.compile(r'<a([^>]*?)href=["\']([^"\'>]+)["\']([^>]*?)>', re.IGNORECASE)
+
+
+def _tracking_base_url(base_url=None):
+    """Site URL (no trailing slash) used for click-tracking links."""
     from core.context_processors import site_detection
-    import re
-    from urllib.parse import quote
-    
+
     # Get base URL - prefer provided base_url, then try site detection, then DEFAULT_URL, then fallback
     if base_url:
         tracking_base_url = base_url
@@ -255,28 +333,73 @@ def _wrap_links_with_tracking(html_content, tracking_id, subscriber_email, base_
         except Exception:
             # Fall back to DEFAULT_URL or SITE_URL
             tracking_base_url = getattr(settings, 'DEFAULT_URL', None) or getattr(settings, 'SITE_URL', 'http://localhost:8000')
-    
-    # Ensure base_url doesn't end with a slash (we'll add it in the path)
-    tracking_base_url = tracking_base_url.rstrip('/')
-    
-    # Pattern to find <a> tags with href attributes
-    link_pattern = re.compile(r'<a([^>]*?)href=["\']([^"\'>]+)["\']([^>]*?)>', re.IGNORECASE)
+    return tracking_base_url.rstrip('/')
+
+
+def _trackable_links(html_content, base_url=None):
+    """Destination URLs (entities decoded) of the links _wrap_links_with_tracking may rewrite, in order."""
+    tracking_base_url = _tracking_base_url(base_url)
+    urls = []
+    for match in _LINK_HREF_RE.finditer(html_content):
+        if _is_trackable_link(match.group(2), tracking_base_url):
+            urls.append(html.unescape(match.group(2)))
+    return urls
+
+
+def _is_trackable_link(url, tracking_base_url):
+    # Only absolute web links, and not our own (already tracked, unsubscribe, ...);
+    # mailto:, tel:, anchors and relative links are left alone
+    return url.lower().startswith(('http://', 'https://')) and not url.startswith(tracking_base_url)
+
+
+def _wrap_links_with_tracking(html_content, tracking_id, link_ids, base_url=None):
+    """
+    Point links at the click-tracking redirect /c/<tracking_id>/<link_id>/.
+
+    ``link_ids`` maps destination URLs to their EmailLink ids (see
+    campaigns.links); links not in it are left as they are.
+    """
+    tracking_base_url = _tracking_base_url(base_url)
     
     def replace_link(match):
         before_href = match.group(1)
         original_url = match.group(2)
         after_href = match.group(3)
         
-        # Skip if it's already a tracking link, mailto, or anchor link
-        if original_url.startswith(('#', 'mailto:', tracking_base_url)):
+        if not _is_trackable_link(original_url, tracking_base_url):
+            return match.group(0)
+        link_id = link_ids.get(html.unescape(original_url))
+        if link_id is None:
             return match.group(0)
         
         # Create tracking URL
-        tracking_url = f"{tracking_base_url}/analytics/track/click/{tracking_id}/?email={subscriber_email}&url={quote(original_url)}"
+        tracking_url = f"{tracking_base_url}/c/{tracking_id}/{link_id}/"
         
         return f'<a{before_href}href="{tracking_url}"{after_href}>'
     
-    return link_pattern.sub(replace_link, html_content)
+    return _LINK_HREF_RE.sub(replace_link, html_content)
+
+
+def _quoted_original_html(original_email_message):
+    """The incoming message an auto-reply answers, quoted below an "On [date] [email] wrote:" line."""
+    from django.utils import dateformat
+
+    # Format date for separator: "On Sun, Jan 18, 2026, 2:08 PM"
+    date_str = dateformat.format(original_email_message.received_at, 'D, M j, Y, g:i A')
+    original_from_email = original_email_message.from_email or ''
+    separator_text = f"On {date_str} {original_from_email} wrote:"
+    separator_html = f'<div style="margin-top: 20px; padding-top: 20px; border-top: 1px solid #e0e0e0;"><p style="font-size: 12px; color: #666; margin-bottom: 10px;">{separator_text}</p>'
+
+    # Get original email content - ALWAYS use text content, convert HTML to plain text if needed
+    original_body_text = original_email_message.body_text or ''
+    if not original_body_text and original_email_message.body_html:
+        original_body_text = _html_to_plain_text(original_email_message.body_html)
+
+    # Convert plain text to HTML by escaping and preserving line breaks
+    escaped_text = html.escape(original_body_text).replace('\n', '<br>').replace('\r', '')
+    original_content_html = f'<div style="font-size: 13px; color: #333; line-height: 1.6;">{escaped_text}</div>'
+
+    return separator_html + original_content_html + '</div>'
 
 
 def _is_celery_available():
@@ -297,43 +420,30 @@ def _send_test_email_sync(email_id, test_email, variables=None):
     from .models import Email, EmailEvent
 
     try:
-        email = Email.objects.select_related('campaign').get(id=email_id)
+        email = Email.objects.select_related('campaign', 'campaign__user', 'footer').get(id=email_id)
     except Email.DoesNotExist:
         error_msg = f"Email {email_id} not found"
         logger.error(error_msg)
         raise ValueError(error_msg)
 
-    # Replace variables in content
-    html_content = email.body_html or ""
-    text_content = email.body_text or ""
-    subject = email.subject or "Test Email"
-
-    # Get user email for sender_email variable
-    user_email = email.campaign.user.email if email.campaign and email.campaign.user else settings.DEFAULT_FROM_EMAIL
-
-    # Build vars with site_name/site_url so {{site_name}} and {{site_url}} work in emails
-    site_url, site_name, _ = _get_site_info(request=None)
-    vars_for_replace = dict(variables) if variables else {}
-    vars_for_replace['site_name'] = site_name
-    vars_for_replace['site_url'] = site_url
-    vars_for_replace['sender_email'] = user_email
-
-    for key, value in vars_for_replace.items():
-        placeholder = f"{{{{{key}}}}}"
-        html_content = html_content.replace(placeholder, str(value))
-        text_content = text_content.replace(placeholder, str(value))
-        subject = subject.replace(placeholder, str(value))
-    
     # Ensure we have at least some content
-    if not html_content and not text_content:
+    if not email.body_html and not email.body_text:
         error_msg = "Email has no content (both body_html and body_text are empty)"
         logger.error(error_msg)
         raise ValueError(error_msg)
-    
-    # Derive text/plain from HTML so paragraphs match (stored body_text often loses </p> breaks)
-    if html_content and html_content.strip():
-        text_content = _html_to_plain_text(html_content)
-    
+
+    # Same pipeline as real sends (footer, unsubscribe block, ads), without tracking
+    context = SendContext(email.campaign.user, email.campaign)
+    rendered = render_email(
+        email,
+        context,
+        variables,
+        subscriber_email=test_email,
+        subscriber_uuid=context.subscriber_uuid(test_email),
+        preview=True,
+    )
+    subject = rendered.subject or "Test Email"
+
     # Create and send email
     try:
         # Create a sent EmailEvent so analytics track this test send as well
@@ -350,12 +460,12 @@ def _send_test_email_sync(email_id, test_email, variables=None):
 
         msg = EmailMultiAlternatives(
             subject=subject,
-            body=text_content or "This is a test email.",
+            body=rendered.text or "This is a test email.",
             from_email=settings.DEFAULT_FROM_EMAIL,
             to=[test_email]
         )
-        if html_content:
-            msg.attach_alternative(html_content, "text/html")
+        if rendered.html:
+            msg.attach_alternative(rendered.html, "text/html")
         
         msg.send()
         logger.info(f"Sent test email '{subject}' to {test_email}")
@@ -365,6 +475,398 @@ def _send_test_email_sync(email_id, test_email, variables=None):
         raise Exception(error_msg)
 
 
+class PreparedSend:
+    """A rendered campaign message plus the context needed to record its outcome."""
+
+    def __init__(self, msg, email, subscriber_email, variables, request_obj, user, user_email,
+                 full_name, original_email_message=None, tracking_id=None):
+        self.msg = msg
+        self.email = email
+        self.subscriber_email = subscriber_email
+        self.variables = variables
+        self.request_obj = request_obj
+        self.user = user
+        self.user_email = user_email
+        self.full_name = full_name
+        self.original_email_message = original_email_message
+        self.tracking_id = tracking_id
+
+
+class SendContext:
+    """
+    Everything about a send that depends on the sending user rather than the recipient.
+
+    Built once per (user, campaign) and reused for every message of a batch:
+    the UserProfile, site info, From/Sender/BCC settings, the CAN-SPAM address
+    block, the rendered ad footer, the DKIM signer, a MessageSkeleton per
+    Email and a subscriber email -> uuid map.
+    """
+
+    def __init__(self, user, campaign=None, profile=None):
+        self.user = user
+        self.campaign = campaign
+        if profile is None:
+            profile, _ = UserProfile.objects.get_or_create(user=user)
+        self.profile = profile
+        self.site_url, self.site_name, self.site_logo = _get_site_info(request=None)
+
+        profile = self.profile
+        self.user_email = user.email
+        self.full_name = profile.full_name or ''
+        # Format From header: "Full Name <email@example.com>" or just email if no name
+        self.from_email_header = f"{self.full_name} <{self.user_email}>" if self.full_name else self.user_email
+        self.has_valid_spf = profile.spf_verified
+        # BCC the user so they can see emails being sent
+        self.bcc_list = [self.user_email] if profile.auto_bcc_enabled else []
+        self.show_ads = not profile.has_verified_promo
+        self.show_unsubscribe = not profile.send_without_unsubscribe
+
+        self.ads_html = ad_footer_html(self.site_url, self.site_name, self.site_logo) if self.show_ads else ''
+        self.address_html = self._address_html(profile)
+        self._subscriber_uuids = {}
+        self._dkim_signer = False  # Looked up on the first build_message()
+        self._skeletons = {}
+
+    @property
+    def dkim_signer(self):
+        """DKIMSigner for this user's mail (None if no key applies)."""
+        if self._dkim_signer is False:
+            sender = None if self.has_valid_spf else settings.DEFAULT_FROM_EMAIL
+            self._dkim_signer = signer_for(self.user, self.user_email, sender)
+        return self._dkim_signer
+
+    def skeleton(self, email):
+        """MessageSkeleton shared by the messages of one version of ``email``."""
+        key = (email.pk, email.updated_at)
+        skeleton = self._skeletons.get(key)
+        if skeleton is None:
+            skeleton = self._skeletons[key] = MessageSkeleton()
+        return skeleton
+
+    @staticmethod
+    def _address_html(user_profile):
+        """User's postal address for the footer (required by CAN-SPAM, GDPR, etc.)."""
+        address_lines = []
+        # Add full name first if available
+        if user_profile.full_name:
+            address_lines.append(user_profile.full_name)
+        if user_profile.address_line1:
+            address_lines.append(user_profile.address_line1)
+        if user_profile.address_line2:
+            address_lines.append(user_profile.address_line2)
+        city_state = []
+        if user_profile.city:
+            city_state.append(user_profile.city)
+        if user_profile.state:
+            city_state.append(user_profile.state)
+        if city_state:
+            address_lines.append(', '.join(city_state))
+        postal_country = []
+        if user_profile.postal_code:
+            postal_country.append(user_profile.postal_code)
+        if user_profile.country:
+            postal_country.append(user_profile.country)
+        if postal_country:
+            address_lines.append(' '.join(postal_country))
+
+        if not address_lines:
+            return ''
+        return '<p style="font-size: 11px; color: #999; margin-top: 10px; line-height: 1.4;">' + '<br>'.join(address_lines) + '</p>'
+
+    def unsubscribe_url(self, subscriber_uuid):
+        if subscriber_uuid is None:
+            return f"{self.site_url}/unsubscribe/"  # Previews of non-subscribers
+        return f"{self.site_url}/unsubscribe/{subscriber_uuid}/"
+
+    def unsubscribe_html(self, subscriber_uuid):
+        """Separator, unsubscribe link and address block appended to the HTML body."""
+        return (
+            '<hr style="border: none; border-top: 1px solid #e0e0e0; margin: 20px 0;">'
+            '<p style="font-size: 12px; color: #666; margin-top: 20px;">If you no longer wish to receive these emails, '
+            f'you can <a href="{self.unsubscribe_url(subscriber_uuid)}">unsubscribe here</a>.</p>{self.address_html}'
+        )
+
+    def preload_subscribers(self, subscriber_emails):
+        """Look up the uuids of many recipients with one query."""
+        from subscribers.models import Subscriber
+
+        missing = {e for e in subscriber_emails if e and e not in self._subscriber_uuids}
+        if not missing:
+            return
+        found = dict(Subscriber.objects.filter(email__in=missing).values_list('email', 'uuid'))
+        for subscriber_email in missing:
+            self._subscriber_uuids[subscriber_email] = found.get(subscriber_email)
+
+    def subscriber_uuid(self, subscriber_email, subscriber=None):
+        """Unsubscribe uuid for a recipient (None if they aren't a known subscriber)."""
+        if subscriber is not None:
+            self._subscriber_uuids[subscriber.email] = subscriber.uuid
+            return subscriber.uuid
+        if subscriber_email not in self._subscriber_uuids:
+            self.preload_subscribers([subscriber_email])
+        return self._subscriber_uuids.get(subscriber_email)
+
+    def build_message(self, subject, text_content, html_content, subscriber_email, subscriber_uuid=None, email=None):
+        """
+        EmailMultiAlternatives with the From/Sender/BCC/List-Unsubscribe headers for this user,
+        DKIM-signed if a key applies and serialized through ``email``'s skeleton if given.
+        """
+        msg = CampaignEmail(
+            subject=subject,
+            body=text_content,
+            from_email=self.from_email_header,
+            to=[subscriber_email],
+            bcc=self.bcc_list if self.bcc_list else None,
+            skeleton=self.skeleton(email) if email is not None else None,
+            dkim_signer=self.dkim_signer,
+        )
+        # Only set Sender header if user doesn't have valid SPF record
+        if not self.has_valid_spf:
+            msg.extra_headers['Sender'] = settings.DEFAULT_FROM_EMAIL
+
+        # Add List-Unsubscribe headers if unsubscribe is enabled
+        if self.show_unsubscribe and subscriber_uuid:
+            msg.extra_headers['List-Unsubscribe'] = f"<{self.unsubscribe_url(subscriber_uuid)}>"
+            msg.extra_headers['List-Unsubscribe-Post'] = "List-Unsubscribe=One-Click"
+
+        msg.attach_alternative(html_content, "text/html")
+        return msg
+
+
+def _send_user(email, request_obj=None):
+    """The user a message is sent as: the request's user if set, otherwise the campaign owner."""
+    if request_obj and request_obj.user:
+        return request_obj.user
+    return email.campaign.user
+
+
+def _get_send_context(contexts, user, campaign):
+    """SendContext for (user, campaign) from a per-batch cache dict, building it on first use."""
+    key = (user.pk, campaign.pk if campaign else None)
+    context = contexts.get(key)
+    if context is None:
+        context = contexts[key] = SendContext(user, campaign)
+    return context
+
+
+def _prepare_single_email(email_id, subscriber_email, variables=None, request_obj=None,
+                          original_email_message=None, email=None, subscriber=None, context=None):
+    """Render one campaign message (variables, tracking, footers) without sending it.
+
+    ``email``, ``subscriber`` and ``context`` (a SendContext for the sending user)
+    may be passed by batch callers that already hold them, which skips the
+    per-message lookups.
+    """
+    from .models import Email
+
+    if email is None:
+        try:
+            email = Email.objects.select_related('campaign', 'footer').get(id=email_id)
+        except Email.DoesNotExist:
+            logger.error(f"Email {email_id} not found")
+            if request_obj:
+                request_obj.status = 'failed'
+                request_obj.error_message = f"Email {email_id} not found"
+                request_obj.save(update_fields=['status', 'error_message', 'updated_at'])
+            raise
+    logger.info(f"Sending email {email.id} for campaign: {email.campaign.id} - {email.campaign.name}")
+
+    # Profile, site info, ad footer and address block for the sending user
+    if context is None:
+        context = SendContext(_send_user(email, request_obj), email.campaign)
+
+    # Get subscriber UUID for unsubscribe link
+    if subscriber is None and request_obj and request_obj.subscriber:
+        subscriber = request_obj.subscriber
+    subscriber_uuid = context.subscriber_uuid(subscriber_email, subscriber)
+
+    # Tracking ID is allocated up front; the 'sent' EmailEvent is saved with this id once delivered
+    tracking_id = str(uuid.uuid4())
+
+    rendered = render_email(
+        email,
+        context,
+        variables,
+        subscriber_email=subscriber_email,
+        subscriber_uuid=subscriber_uuid,
+        tracking_id=tracking_id,
+        original_email_message=original_email_message,
+    )
+
+    # From address, SPF and unsubscribe settings come from the sending user's context
+    user = context.user
+    user_email = context.user_email
+    full_name = context.full_name
+    msg = context.build_message(rendered.subject, rendered.text, rendered.html, subscriber_email, subscriber_uuid, email=email)
+
+    return PreparedSend(
+        msg, email, subscriber_email, variables, request_obj, user, user_email, full_name,
+        original_email_message=original_email_message,
+        tracking_id=tracking_id,
+    )
+
+
+def _sent_event(prepared):
+    """Unsaved 'sent' EmailEvent for a delivered message, keyed by its tracking id."""
+    from .models import EmailEvent
+
+    return EmailEvent(
+        id=prepared.tracking_id,
+        email=prepared.email,
+        subscriber_email=prepared.subscriber_email,
+        event_type='sent',
+    )
+
+
+def _save_sent_events(events):
+    """
+    Persist 'sent' events for a batch with one INSERT and bump each campaign's
+    sent_count with one UPDATE (bulk_create skips the post_save metrics signal).
+    """
+    from .counters import add_counts
+    from .models import EmailEvent
+
+    if not events:
+        return
+    EmailEvent.objects.bulk_create(events)
+    per_campaign = {}
+    for event in events:
+        counts = per_campaign.setdefault(event.email.campaign_id, {'sent_count': 0})
+        counts['sent_count'] += 1
+    add_counts(per_campaign)
+
+
+def _record_single_email_sent(prepared, save_event=True):
+    """Bookkeeping after a prepared message was accepted by the mail server.
+
+    Batch callers pass ``save_event=False`` and save the 'sent' events in bulk.
+    """
+    msg = prepared.msg
+    email = prepared.email
+    subscriber_email = prepared.subscriber_email
+    variables = prepared.variables
+    request_obj = prepared.request_obj
+    user = prepared.user
+    user_email = prepared.user_email
+    full_name = prepared.full_name
+    original_email_message = prepared.original_email_message
+    subject = msg.subject
+    text_content = msg.body
+    html_content = msg.alternatives[0][0] if msg.alternatives else ''
+
+    # Campaign metrics are updated via EmailEvent post_save signal
+    campaign = email.campaign
+    if save_event:
+        _sent_event(prepared).save()
+        logger.info(f"Created EmailEvent {prepared.tracking_id} for email {email.id}, campaign {campaign.id}, subscriber {subscriber_email}")
+
+    # Update send request status
+    if request_obj:
+        request_obj.status = 'sent'
+        request_obj.error_message = ''
+        request_obj.sent_at = tz.now()
+        request_obj.save(update_fields=['status', 'error_message', 'sent_at', 'updated_at'])
+
+    logger.info(f"Sent single email '{subject}' to {subscriber_email}")
+
+    # If this is a Gmail or IMAP campaign, create an EmailMessage record for the sent email
+    # so it shows up in Recent Gmail/IMAP Emails
+    campaign_name_lower = campaign.name.lower()
+    is_gmail_campaign = 'gmail' in campaign_name_lower and ('auto' in campaign_name_lower or 'reply' in campaign_name_lower)
+    is_imap_campaign = 'imap' in campaign_name_lower and ('auto' in campaign_name_lower or 'reply' in campaign_name_lower)
+
+    logger.info(f"Checking if campaign '{campaign.name}' is Gmail/IMAP auto-reply: Gmail={is_gmail_campaign}, IMAP={is_imap_campaign}")
+
+    if is_gmail_campaign or is_imap_campaign:
+        from gmail.models import EmailCredential, EmailMessage, EmailProvider
+
+        # Find the credential for this user and provider
+        provider = EmailProvider.GMAIL if is_gmail_campaign else EmailProvider.IMAP
+        credential = EmailCredential.objects.filter(
+            user=user,
+            provider=provider,
+            is_active=True
+        ).first()
+
+        logger.info(f"Looking for {provider} credential for user {user.id}: found={credential is not None}")
+
+        if credential:
+            try:
+                # Create EmailMessage to represent the sent email
+                # Use a unique provider_message_id based on timestamp and subscriber email
+                provider_message_id = f"sent-{tz.now().timestamp()}-{subscriber_email}"
+
+                # Get the actual sent email content (with variables replaced)
+                sent_subject = subject
+                sent_body_html = html_content
+                sent_body_text = text_content
+
+                # Extract recipient name from variables if available
+                recipient_name = ''
+                if variables:
+                    first_name = variables.get('first_name', '')
+                    last_name = variables.get('last_name', '')
+                    if first_name or last_name:
+                        recipient_name = f"{first_name} {last_name}".strip()
+
+                # Use credential's email address for from_email to ensure proper matching
+                from_email_for_message = credential.email_address if credential.email_address else user_email
+
+                # Create EmailMessage for the sent email
+                sent_email_msg = EmailMessage.objects.create(
+                    user=user,
+                    credential=credential,
+                    provider=provider,
+                    provider_message_id=provider_message_id,
+                    subject=sent_subject,
+                    from_email=from_email_for_message,  # Use credential's email address
+                    to_emails=subscriber_email,  # The recipient
+                    sender_email=from_email_for_message,
+                    body_text=sent_body_text[:1000] if sent_body_text else '',  # Limit length
+                    body_html=sent_body_html[:2000] if sent_body_html else '',  # Limit length
+                    received_at=tz.now(),  # When it was sent
+                    processed=True,  # Mark as processed since we just sent it
+                    campaign_email=email,  # Link to the campaign email template
+                    provider_data={
+                        'sent': True,
+                        'folder': 'Sent',  # Mark as sent folder
+                        'recipient_email': subscriber_email,
+                        'recipient_name': recipient_name or subscriber_email,
+                        'from_name': full_name or '',
+                        'to_names': {subscriber_email: recipient_name or subscriber_email},
+                        'original_email_id': str(original_email_message.id) if original_email_message else None,  # Store original email ID for lookup
+                    }
+                )
+                logger.info(f"✓ Created EmailMessage {sent_email_msg.id} for sent email to {subscriber_email} in {provider} campaign '{campaign.name}'")
+                logger.info(f"  EmailMessage details: from={from_email_for_message}, to={subscriber_email}, subject={sent_subject}, provider={provider}, credential={credential.id}")
+            except Exception as e:
+                logger.error(f"Error creating EmailMessage for sent email: {str(e)}", exc_info=True)
+        else:
+            logger.debug(f"Could not find {provider} credential for user {user.id} to create EmailMessage for sent email (optional; email was still sent)")
+
+    # Schedule the next email in the campaign sequence
+    try:
+        schedule_next_email_in_sequence(email, request_obj, subscriber_email, variables, original_email_message)
+    except Exception as next_email_error:
+        # Log but don't fail the current email send if scheduling next email fails
+        logger.warning(f"Failed to schedule next email in sequence: {str(next_email_error)}")
+
+
+def _record_single_email_failed(prepared, exc):
+    """Record a failed delivery: requeue transient failures for retry, fail the rest."""
+    from .retry import schedule_retry
+
+    logger.error(f"Error sending single email to {prepared.subscriber_email}: {str(exc)}")
+    request_obj = prepared.request_obj
+    if not request_obj:
+        return
+    if schedule_retry(request_obj, exc):
+        logger.info(
+            f"Send request {request_obj.id} will be retried at {request_obj.next_attempt_at} "
+            f"(attempt {request_obj.attempts + 1})"
+        )
+
+
 def _send_single_email_sync(email_id, subscriber_email, variables=None, request_id=None, original_email_message=None):
     """Send a single email synchronously (non-Celery version).
     
@@ -377,7 +879,7 @@ def _send_single_email_sync(email_id, subscriber_email, variables=None, request_
                                that triggered this auto-reply. If provided, its content will be
                                appended to the sent email with a separator.
     """
-    from .models import Email, EmailEvent, EmailSendRequest
+    from .models import EmailSendRequest
     request_obj = None
     if request_id:
         try:
@@ -385,324 +887,244 @@ def _send_single_email_sync(email_id, subscriber_email, variables=None, request_
         except EmailSendRequest.DoesNotExist:
             request_obj = None
     
+    prepared = _prepare_single_email(
+        email_id,
+        subscriber_email,
+        variables,
+        request_obj=request_obj,
+        original_email_message=original_email_message,
+    )
+    
     try:
-        email = Email.objects.select_related('campaign').get(id=email_id)
-        logger.info(f"Sending email {email_id} for campaign: {email.campaign.id} - {email.campaign.name}")
-    except Email.DoesNotExist:
-        logger.error(f"Email {email_id} not found")
-        if request_obj:
-            request_obj.status = 'failed'
-            request_obj.error_message = f"Email {email_id} not found"
-            request_obj.save(update_fields=['status', 'error_message', 'updated_at'])
+        prepared.msg.send()
+    except Exception as e:
+        _record_single_email_failed(prepared, e)
         raise
 
-    # Get site info early so {{site_name}} and {{site_url}} work in email body
-    site_url, site_name, site_logo = _get_site_info(request=None)
-    site_info = {'site_url': site_url, 'site_name': site_name, 'site_logo': site_logo}
+    # The message is out: a failure to record it must not schedule a retry (a second copy)
+    try:
+        _record_single_email_sent(prepared)
+    except Exception as e:
+        logger.error(f"Error recording sent email to {prepared.subscriber_email}: {str(e)}", exc_info=True)
 
-    # Replace variables in content (include site_name, site_url, sender_email)
-    html_content = email.body_html
-    text_content = email.body_text or ""
-    subject = email.subject
 
-    user_email_for_var = email.campaign.user.email if email.campaign and email.campaign.user else settings.DEFAULT_FROM_EMAIL
-    vars_for_replace = dict(variables) if variables else {}
-    vars_for_replace['site_name'] = site_name
-    vars_for_replace['site_url'] = site_url
-    vars_for_replace['sender_email'] = user_email_for_var
+# Errors that mean the SMTP session went away, as opposed to the message being refused
+_CONNECTION_ERRORS = (smtplib.SMTPServerDisconnected, ConnectionError, TimeoutError)
 
-    def _var_str(val):
-        """Convert variable value to string for substitution; avoid 'nan' from pandas/float."""
-        if val is None:
-            return ''
-        if isinstance(val, float) and (val != val or val == float('inf') or val == float('-inf')):
-            return ''
-        s = str(val).strip()
-        return '' if s.lower() == 'nan' else s
 
-    for key in list(vars_for_replace.keys()):
-        vars_for_replace[key] = _var_str(vars_for_replace[key])
+def _get_original_email_message(send_request):
+    """
+    For IMAP auto-reply campaigns, retrieve the original incoming email message
+    so subsequent emails in the sequence can include the original email content.
+    """
+    campaign_name_lower = send_request.campaign.name.lower() if send_request.campaign else ''
+    is_auto_reply = 'auto' in campaign_name_lower or 'reply' in campaign_name_lower
+    if not is_auto_reply or not send_request.variables:
+        return None
+    original_email_id = send_request.variables.get('_original_email_id')
+    if not original_email_id:
+        return None
 
-    for key, value in vars_for_replace.items():
-        placeholder = f"{{{{{key}}}}}"
-        html_content = html_content.replace(placeholder, value)
-        text_content = text_content.replace(placeholder, value)
-        subject = subject.replace(placeholder, value)
+    from gmail.models import EmailMessage
+    try:
+        original_email_message = EmailMessage.objects.get(id=original_email_id)
+        logger.info(f"Retrieved original email message {original_email_id} for scheduled email {send_request.id}")
+        return original_email_message
+    except EmailMessage.DoesNotExist:
+        logger.warning(f"Original email message {original_email_id} not found for scheduled email {send_request.id}")
+        return None
+
+
+def _prepare_batch_item(item, emails, contexts):
+    """Render one batch item: an EmailSendRequest or an (email, subscriber) pair."""
+    from .models import EmailSendRequest
+
+    email = emails.get(_batch_email_id(item))
+    if email is None:
+        raise ValueError(f"Email {_batch_email_id(item)} not found")
+
+    if isinstance(item, EmailSendRequest):
+        return _prepare_single_email(
+            str(item.email_id),
+            item.subscriber_email,
+            item.variables,
+            request_obj=item,
+            original_email_message=_get_original_email_message(item),
+            email=email,
+            subscriber=item.subscriber,
+            context=_get_send_context(contexts, _send_user(email, item), email.campaign),
+        )
 
-    # Create the sent event first to get tracking ID
-    sent_event = EmailEvent.objects.create(
+    email_id = _batch_email_id(item)
+    subscriber = item[1]
+    if isinstance(subscriber, str):
+        subscriber_email, subscriber = subscriber, None
+        variables = {'email': subscriber_email}
+    else:
+        subscriber_email = subscriber.email
+        variables = {
+            'first_name': subscriber.first_name or '',
+            'last_name': subscriber.last_name or '',
+            'email': subscriber.email,
+        }
+    return _prepare_single_email(
+        str(email_id),
+        subscriber_email,
+        variables,
         email=email,
-        subscriber_email=subscriber_email,
-        event_type='sent'
+        subscriber=subscriber,
+        context=_get_send_context(contexts, _send_user(email), email.campaign),
     )
-    tracking_id = str(sent_event.id)
-    logger.info(f"Created EmailEvent {tracking_id} for email {email.id}, campaign {email.campaign.id}, subscriber {subscriber_email}")
 
-    # Replace HR tags with separator image and wrap links (site_url from site_info above)
-    html_content = _replace_hr_with_separator(html_content, tracking_id, subscriber_email, base_url=site_url)
-    html_content = _wrap_links_with_tracking(html_content, tracking_id, subscriber_email, base_url=site_url)
-    
-    # Always add tracking pixel for open tracking (especially important for IMAP/Gmail auto-replies)
-    html_content = _add_tracking_pixel(html_content, tracking_id, subscriber_email, base_url=site_url)
-    
-    # For auto-reply campaigns, append original incoming email content with separator
-    campaign_name_lower = email.campaign.name.lower() if email.campaign else ''
-    is_auto_reply = 'auto' in campaign_name_lower or 'reply' in campaign_name_lower
-    if is_auto_reply and original_email_message:
-        from django.utils import dateformat
-        import html
-        
-        # Format date for separator: "On Sun, Jan 18, 2026, 2:08 PM"
-        original_date = original_email_message.received_at
-        date_str = dateformat.format(original_date, 'D, M j, Y, g:i A')
-        
-        # Get original email sender
-        original_provider_data = original_email_message.provider_data or {}
-        original_from_email = original_email_message.from_email or ''
-        
-        # Format separator: "On [date] [email] wrote:"
-        separator_text = f"On {date_str} {original_from_email} wrote:"
-        separator_html = f'<div style="margin-top: 20px; padding-top: 20px; border-top: 1px solid #e0e0e0;"><p style="font-size: 12px; color: #666; margin-bottom: 10px;">{separator_text}</p>'
-        
-        # Get original email content - ALWAYS use text content, convert HTML to plain text if needed
-        original_body_text = original_email_message.body_text or ''
-        if not original_body_text and original_email_message.body_html:
-            # Convert HTML to plain text
-            original_body_text = _html_to_plain_text(original_email_message.body_html)
-        
-        # Convert plain text to HTML by escaping and preserving line breaks
-        escaped_text = html.escape(original_body_text)
-        # Convert line breaks to <br>
-        escaped_text = escaped_text.replace('\n', '<br>').replace('\r', '')
-        original_content_html = f'<div style="font-size: 13px; color: #333; line-height: 1.6;">{escaped_text}</div>'
-        
-        separator_html += original_content_html + '</div>'
-        
-        # Add separator and original content to HTML
-        html_content += separator_html
-    
-    # Add email footer if one is assigned
-    if email.footer:
-        footer_html = email.footer.html_content
-        for key, value in vars_for_replace.items():
-            placeholder = f"{{{{{key}}}}}"
-            footer_html = footer_html.replace(placeholder, str(value))
-        html_content += footer_html
-    
-    # Get user email and name for From address
-    # Prefer user from request_obj if available, otherwise use campaign user
-    if request_obj and request_obj.user:
-        user_email = request_obj.user.email
-        user = request_obj.user
-    else:
-        user_email = email.campaign.user.email
-        user = email.campaign.user
-    
-    # Get user profile for full_name and SPF
-    user_profile, _ = UserProfile.objects.get_or_create(user=user)
-    has_valid_spf = user_profile.spf_verified
-    full_name = user_profile.full_name or ''
-    
-    # Format From header: "Full Name <email@example.com>" or just email if no name
-    if full_name:
-        from_email_header = f"{full_name} <{user_email}>"
-    else:
-        from_email_header = user_email
-    show_ads = not user_profile.has_verified_promo
-    show_unsubscribe = not user_profile.send_without_unsubscribe
 
-    # Get subscriber UUID for unsubscribe link (site_url, site_name, site_logo from site_info above)
-    subscriber_uuid = None
-    if request_obj and request_obj.subscriber:
-        subscriber_uuid = request_obj.subscriber.uuid
-    else:
-        # Try to find subscriber by email
-        from subscribers.models import Subscriber
-        try:
-            subscriber = Subscriber.objects.filter(email=subscriber_email).first()
-            if subscriber:
-                subscriber_uuid = subscriber.uuid
-        except Exception:
-            pass
-    
-    # Add unsubscribe link to email content if enabled
-    if show_unsubscribe and subscriber_uuid:
-        unsubscribe_url = f"{site_url}/unsubscribe/{subscriber_uuid}/"
-        
-        # Format user address for footer (required by CAN-SPAM, GDPR, etc.)
-        address_lines = []
-        # Add full name first if available
-        if user_profile.full_name:
-            address_lines.append(user_profile.full_name)
-        if user_profile.address_line1:
-            address_lines.append(user_profile.address_line1)
-        if user_profile.address_line2:
-            address_lines.append(user_profile.address_line2)
-        city_state = []
-        if user_profile.city:
-            city_state.append(user_profile.city)
-        if user_profile.state:
-            city_state.append(user_profile.state)
-        if city_state:
-            address_lines.append(', '.join(city_state))
-        postal_country = []
-        if user_profile.postal_code:
-            postal_country.append(user_profile.postal_code)
-        if user_profile.country:
-            postal_country.append(user_profile.country)
-        if postal_country:
-            address_lines.append(' '.join(postal_country))
-        
-        address_html = ''
-        if address_lines:
-            address_html = '<p style="font-size: 11px; color: #999; margin-top: 10px; line-height: 1.4;">' + '<br>'.join(address_lines) + '</p>'
-        
-        # Add to HTML content with separator
-        unsubscribe_html = f'<hr style="border: none; border-top: 1px solid #e0e0e0; margin: 20px 0;"><p style="font-size: 12px; color: #666; margin-top: 20px;">If you no longer wish to receive these emails, you can <a href="{unsubscribe_url}">unsubscribe here</a>.</p>{address_html}'
-        html_content += unsubscribe_html
-    
-    # Add ads if required
-    if show_ads:
-        ads_html = render_to_string('emails/ad_footer.html', {
-            'site_url': site_url,
-            'site_name': site_name,
-            'site_logo': site_logo,
-        })
-        html_content += ads_html
-    
-    # Plain part must match final HTML (stored body_text often omits paragraph breaks)
-    if html_content and html_content.strip():
-        text_content = _html_to_plain_text(html_content)
-    
-    # Create and send email
-    # Check if user has auto BCC enabled
-    bcc_list = []
-    if user_profile.auto_bcc_enabled:
-        bcc_list = [user_email]  # BCC the user so they can see emails being sent
-    
-    msg = EmailMultiAlternatives(
-        subject=subject,
-        body=text_content,
-        from_email=from_email_header,
-        to=[subscriber_email],
-        bcc=bcc_list if bcc_list else None
-    )
-    # Only set Sender header if user doesn't have valid SPF record
-    if not has_valid_spf:
-        msg.extra_headers['Sender'] = settings.DEFAULT_FROM_EMAIL
-    
-    # Add List-Unsubscribe headers if unsubscribe is enabled
-    if show_unsubscribe and subscriber_uuid:
-        unsubscribe_url = f"{site_url}/unsubscribe/{subscriber_uuid}/"
-        msg.extra_headers['List-Unsubscribe'] = f"<{unsubscribe_url}>"
-        msg.extra_headers['List-Unsubscribe-Post'] = "List-Unsubscribe=One-Click"
-    
-    msg.attach_alternative(html_content, "text/html")
-    
+def _batch_email_id(item):
+    """Email primary key of a batch item (as a UUID, so it matches in_bulk keys)."""
+    from .models import EmailSendRequest
+
+    if isinstance(item, EmailSendRequest):
+        return item.email_id
+    email = item[0]
+    if hasattr(email, 'pk'):
+        return email.pk
+    return email if isinstance(email, uuid.UUID) else uuid.UUID(str(email))
+
+
+def _preload_batch_subscribers(chunk, emails, contexts):
+    """Resolve unsubscribe uuids of recipients given only by address, one query per context."""
+    from .models import EmailSendRequest
+
+    pending = {}
+    for item in chunk:
+        email = emails.get(_batch_email_id(item))
+        if email is None:
+            continue
+        if isinstance(item, EmailSendRequest):
+            if item.subscriber_id:
+                continue
+            subscriber_email, request_obj = item.subscriber_email, item
+        elif isinstance(item[1], str):
+            subscriber_email, request_obj = item[1], None
+        else:
+            continue
+        context = _get_send_context(contexts, _send_user(email, request_obj), email.campaign)
+        pending.setdefault(id(context), (context, []))[1].append(subscriber_email)
+
+    for context, subscriber_emails in pending.values():
+        context.preload_subscribers(subscriber_emails)
+
+
+def _deliver_message(connection, msg):
+    """Send one message on an open connection, reconnecting once if the session dropped."""
     try:
-        msg.send()
-        
-        # Campaign metrics are updated via EmailEvent post_save signal
-        campaign = email.campaign
-        logger.debug(f"Email sent; campaign {campaign.id} metrics updated by signal")
-        
-        # Update send request status
-        if request_obj:
-            request_obj.status = 'sent'
-            request_obj.error_message = ''
-            request_obj.sent_at = tz.now()
-            request_obj.save(update_fields=['status', 'error_message', 'sent_at', 'updated_at'])
-        
-        logger.info(f"Sent single email '{subject}' to {subscriber_email}")
-        
-        # If this is a Gmail or IMAP campaign, create an EmailMessage record for the sent email
-        # so it shows up in Recent Gmail/IMAP Emails
-        campaign_name_lower = campaign.name.lower()
-        is_gmail_campaign = 'gmail' in campaign_name_lower and ('auto' in campaign_name_lower or 'reply' in campaign_name_lower)
-        is_imap_campaign = 'imap' in campaign_name_lower and ('auto' in campaign_name_lower or 'reply' in campaign_name_lower)
-        
-        logger.info(f"Checking if campaign '{campaign.name}' is Gmail/IMAP auto-reply: Gmail={is_gmail_campaign}, IMAP={is_imap_campaign}")
-        
-        if is_gmail_campaign or is_imap_campaign:
-            from gmail.models import EmailCredential, EmailMessage, EmailProvider
-            
-            # Find the credential for this user and provider
-            provider = EmailProvider.GMAIL if is_gmail_campaign else EmailProvider.IMAP
-            credential = EmailCredential.objects.filter(
-                user=user,
-                provider=provider,
-                is_active=True
-            ).first()
-            
-            logger.info(f"Looking for {provider} credential for user {user.id}: found={credential is not None}")
-            
-            if credential:
+        sent = connection.send_messages([msg])
+    except _CONNECTION_ERRORS as e:
+        logger.warning(f"SMTP connection lost ({e}); reconnecting")
+        connection.close()
+        connection.open()
+        sent = connection.send_messages([msg])
+    if not sent:
+        raise RuntimeError("Message was not accepted by the mail backend")
+
+
+def _deliver_chunk(connection, prepared_sends):
+    """Yield None, or the error it failed with, for each prepared send in order."""
+    deliver_each = getattr(connection, 'deliver_each', None)
+    if deliver_each is not None:
+        # Backends that deliver concurrently (campaigns.backends.AsyncSMTPBackend) take the whole chunk
+        yield from deliver_each([prepared.msg for prepared in prepared_sends])
+        return
+    for prepared in prepared_sends:
+        try:
+            _deliver_message(connection, prepared.msg)
+        except Exception as e:
+            yield e
+        else:
+            yield None
+
+
+def send_email_batch(items, batch_size=None, connection=None):
+    """
+    Render and deliver many campaign messages over one pooled mail connection.
+
+    Each chunk of ``batch_size`` messages is rendered and then delivered in a
+    single SMTP session; a dropped session is reopened and the message retried
+    once. Backends with a ``deliver_each`` method (AsyncSMTPBackend) get the
+    whole chunk at once and deliver it concurrently. Successes and failures
+    are recorded exactly like _send_single_email_sync.
+
+    Args:
+        items: EmailSendRequest objects, or (email, subscriber) pairs where email is an
+               Email or its id and subscriber a Subscriber or an email address
+        batch_size: Messages per SMTP session (default: settings.EMAIL_BATCH_SIZE)
+        connection: Optional mail backend connection; defaults to get_connection()
+
+    Returns:
+        dict with 'sent' and 'failed' counts
+    """
+    from django.core.mail import get_connection
+    from .models import Email, EmailSendRequest
+
+    items = list(items)
+    batch_size = max(int(batch_size or getattr(settings, 'EMAIL_BATCH_SIZE', 100)), 1)
+    if connection is None:
+        connection = get_connection()
+
+    sent_count = 0
+    failed_count = 0
+    # One SendContext per (user, campaign) for the whole call
+    contexts = {}
+
+    for start in range(0, len(items), batch_size):
+        chunk = items[start:start + batch_size]
+
+        # One query for all templates in the chunk instead of one per message
+        email_ids = {_batch_email_id(item) for item in chunk}
+        emails = Email.objects.select_related('campaign', 'campaign__user', 'footer').in_bulk(list(email_ids))
+        _preload_batch_subscribers(chunk, emails, contexts)
+
+        prepared_sends = []
+        for item in chunk:
+            try:
+                prepared_sends.append(_prepare_batch_item(item, emails, contexts))
+            except Exception as e:
+                failed_count += 1
+                logger.error(f"Error preparing batch email {item}: {str(e)}")
+                if isinstance(item, EmailSendRequest) and item.status != 'failed':
+                    item.status = 'failed'
+                    item.error_message = str(e)
+                    item.save(update_fields=['status', 'error_message', 'updated_at'])
+
+        if not prepared_sends:
+            continue
+
+        try:
+            connection.open()
+        except Exception as e:
+            logger.error(f"Could not open mail connection for batch of {len(prepared_sends)}: {str(e)}")
+            for prepared in prepared_sends:
+                _record_single_email_failed(prepared, e)
+            failed_count += len(prepared_sends)
+            continue
+
+        sent_events = []
+        try:
+            for prepared, error in zip(prepared_sends, _deliver_chunk(connection, prepared_sends)):
+                if error is not None:
+                    _record_single_email_failed(prepared, error)
+                    failed_count += 1
+                    continue
+                sent_events.append(_sent_event(prepared))
+                sent_count += 1
                 try:
-                    # Create EmailMessage to represent the sent email
-                    # Use a unique provider_message_id based on timestamp and subscriber email
-                    provider_message_id = f"sent-{tz.now().timestamp()}-{subscriber_email}"
-                    
-                    # Get the actual sent email content (with variables replaced)
-                    sent_subject = subject
-                    sent_body_html = html_content
-                    sent_body_text = text_content
-                    
-                    # Extract recipient name from variables if available
-                    recipient_name = ''
-                    if variables:
-                        first_name = variables.get('first_name', '')
-                        last_name = variables.get('last_name', '')
-                        if first_name or last_name:
-                            recipient_name = f"{first_name} {last_name}".strip()
-                    
-                    # Use credential's email address for from_email to ensure proper matching
-                    from_email_for_message = credential.email_address if credential.email_address else user_email
-                    
-                    # Create EmailMessage for the sent email
-                    sent_email_msg = EmailMessage.objects.create(
-                        user=user,
-                        credential=credential,
-                        provider=provider,
-                        provider_message_id=provider_message_id,
-                        subject=sent_subject,
-                        from_email=from_email_for_message,  # Use credential's email address
-                        to_emails=subscriber_email,  # The recipient
-                        sender_email=from_email_for_message,
-                        body_text=sent_body_text[:1000] if sent_body_text else '',  # Limit length
-                        body_html=sent_body_html[:2000] if sent_body_html else '',  # Limit length
-                        received_at=tz.now(),  # When it was sent
-                        processed=True,  # Mark as processed since we just sent it
-                        campaign_email=email,  # Link to the campaign email template
-                        provider_data={
-                            'sent': True,
-                            'folder': 'Sent',  # Mark as sent folder
-                            'recipient_email': subscriber_email,
-                            'recipient_name': recipient_name or subscriber_email,
-                            'from_name': full_name or '',
-                            'to_names': {subscriber_email: recipient_name or subscriber_email},
-                            'original_email_id': str(original_email_message.id) if original_email_message else None,  # Store original email ID for lookup
-                        }
-                    )
-                    logger.info(f"✓ Created EmailMessage {sent_email_msg.id} for sent email to {subscriber_email} in {provider} campaign '{campaign.name}'")
-                    logger.info(f"  EmailMessage details: from={from_email_for_message}, to={subscriber_email}, subject={sent_subject}, provider={provider}, credential={credential.id}")
+                    _record_single_email_sent(prepared, save_event=False)
                 except Exception as e:
-                    logger.error(f"Error creating EmailMessage for sent email: {str(e)}", exc_info=True)
-            else:
-                logger.debug(f"Could not find {provider} credential for user {user.id} to create EmailMessage for sent email (optional; email was still sent)")
-        
-        # Schedule the next email in the campaign sequence
-        try:
-            schedule_next_email_in_sequence(email, request_obj, subscriber_email, variables, original_email_message)
-        except Exception as next_email_error:
-            # Log but don't fail the current email send if scheduling next email fails
-            logger.warning(f"Failed to schedule next email in sequence: {str(next_email_error)}")
-    except Exception as e:
-        logger.error(f"Error sending single email to {subscriber_email}: {str(e)}")
-        if request_obj:
-            request_obj.status = 'failed'
-            request_obj.error_message = str(e)
-            request_obj.save(update_fields=['status', 'error_message', 'updated_at'])
-        raise
+                    logger.error(f"Error recording sent email to {prepared.subscriber_email}: {str(e)}", exc_info=True)
+        finally:
+            connection.close()
+            _save_sent_events(sent_events)
+
+    logger.info(f"Batch send complete: {sent_count} sent, {failed_count} failed (batch size {batch_size})")
+    return {'sent': sent_count, 'failed': failed_count}
 
 
 def schedule_next_email_in_sequence(current_email, request_obj, subscriber_email, variables, original_email_message=None):
@@ -718,18 +1140,18 @@ def schedule_next_email_in_sequence(current_email, request_obj, subscriber_email
                                that triggered the auto-reply sequence. This will be stored so subsequent
                                emails in the sequence can include it.
     """
-    from .models import Email, EmailSendRequest
+    from .models import EmailSendRequest
     from subscribers.models import Subscriber
-    from datetime import timedelta
+    
+    if request_obj is not None and request_obj.materialized:
+        # The rest of the sequence was queued when the subscriber was enrolled
+        return
     
     # Get the campaign and current email order
     campaign = current_email.campaign
     
-    # Find the next email in the sequence (by order)
-    next_email = Email.objects.filter(
-        campaign=campaign,
-        order__gt=current_email.order
-    ).order_by('order').first()
+    # Find the next email in the sequence (by order) in the campaign's step table
+    next_email = next_step(campaign.pk, current_email.pk)
     
     if not next_email:
         logger.debug(f"No next email found in campaign '{campaign.name}' after email order {current_email.order}")
@@ -750,27 +1172,11 @@ def schedule_next_email_in_sequence(current_email, request_obj, subscriber_email
         logger.warning(f"Could not find subscriber for email {subscriber_email} to schedule next email")
         return
     
-    # Calculate scheduled time based on next email's wait_time and wait_unit
-    # Use 0 as default if wait_time is None, but allow 0 to mean immediate sending
-    wait_time = next_email.wait_time if next_email.wait_time is not None else 0
-    wait_unit = next_email.wait_unit or 'days'
-    
-    send_delay = timedelta(0)
-    if wait_time > 0:
-        if wait_unit == 'seconds':
-            send_delay = timedelta(seconds=wait_time)
-        elif wait_unit == 'minutes':
-            send_delay = timedelta(minutes=wait_time)
-        elif wait_unit == 'hours':
-            send_delay = timedelta(hours=wait_time)
-        elif wait_unit == 'days':
-            send_delay = timedelta(days=wait_time)
-        elif wait_unit == 'weeks':
-            send_delay = timedelta(weeks=wait_time)
-        elif wait_unit == 'months':
-            send_delay = timedelta(days=wait_time * 30)
-    
-    scheduled_for = tz.now() + send_delay
+    # Scheduled time is the next email's wait (0 means immediate) from now
+    scheduled_for = apply_send_window(
+        campaign, next_email.delay.after(tz.now()), f"{subscriber_email}:{next_email.email_id}",
+        subscriber.timezone, spread_day=spreads_over_day(next_email),
+    )
 
     # Get user from request_obj or campaign
     user = request_obj.user if request_obj else campaign.user
@@ -807,7 +1213,7 @@ def schedule_next_email_in_sequence(current_email, request_obj, subscriber_email
     next_send_request = EmailSendRequest.objects.create(
         user=user,
         campaign=campaign,
-        email=next_email,
+        email_id=next_email.email_id,
         subscriber=subscriber,
         subscriber_email=subscriber_email,
         variables=next_variables,
@@ -819,24 +1225,79 @@ def schedule_next_email_in_sequence(current_email, request_obj, subscriber_email
                 f"for {subscriber_email} to be sent at {scheduled_for}")
 
 
+# EmailSendRequest rows inserted per bulk_create when a campaign fans out
+FANOUT_CHUNK_SIZE = 1000
+
+
+def _sequence_send_requests(campaign, table, from_index, start, subscriber_id, subscriber_email, variables,
+                            subscriber_timezone='', window=None, user=None, spread_first=False):
+    """
+    Unsaved 'pending' EmailSendRequests for every step of ``table`` a subscriber
+    gets from ``from_index`` on (campaigns with materialize_sequence), the
+    first due at ``start`` and each later one its delay after the one before.
+    """
+    from .models import EmailSendRequest
+
+    return [
+        EmailSendRequest(
+            user=user or campaign.user,
+            campaign=campaign,
+            email_id=step.email_id,
+            subscriber_id=subscriber_id,
+            subscriber_email=subscriber_email,
+            variables=dict(variables),
+            scheduled_for=scheduled_for,
+            status='pending',
+            materialized=True,
+        )
+        for step, scheduled_for in table.schedule(
+            start, subscriber_email, subscriber_timezone, window, from_index, spread_first=spread_first,
+        )
+    ]
+
+
+def cancel_materialized_requests(campaign_id=None, subscriber_id=None, campaign_ids=None, subscriber_ids=None):
+    """
+    Cancel the still-pending materialized sends of a campaign and/or a subscriber
+    (on deactivation or unsubscribe), or of several at once with ``campaign_ids``
+    and ``subscriber_ids`` (ids or a queryset). Returns the number of requests cancelled.
+    """
+    from .models import EmailSendRequest
+
+    pending = EmailSendRequest.objects.filter(status='pending', materialized=True)
+    if campaign_id is not None:
+        pending = pending.filter(campaign_id=campaign_id)
+    if subscriber_id is not None:
+        pending = pending.filter(subscriber_id=subscriber_id)
+    if campaign_ids is not None:
+        pending = pending.filter(campaign_id__in=campaign_ids)
+    if subscriber_ids is not None:
+        pending = pending.filter(subscriber_id__in=subscriber_ids)
+    return pending.update(status='cancelled', updated_at=tz.now())
+
+
 def send_campaign_emails(campaign_id):
     """
     Process the campaign and schedule emails to subscribers.
     This task is triggered when a campaign is activated.
+    
+    Subscribers who haven't had the campaign yet are found with one anti-join
+    query, and a 'pending' EmailSendRequest for the first email is bulk-inserted
+    for each of them; the scheduled sender delivers them from there. With
+    materialize_sequence, the requests for every later step are inserted too.
     """
-    from .models import Campaign, Email, EmailEvent
-    from subscribers.models import Subscriber
+    from django.db.models import Exists, OuterRef
+    from .dispatch import notify_bulk_send_requests
+    from .models import Campaign, EmailEvent, EmailSendRequest
     
     try:
-        campaign = Campaign.objects.get(id=campaign_id, is_active=True)
+        campaign = Campaign.objects.select_related('user', 'subscriber_list').get(id=campaign_id, is_active=True)
     except Campaign.DoesNotExist:
         logger.error(f"Campaign with id {campaign_id} not found or not active")
         return
     
-    # Get all subscribers in the list
-    subscribers = campaign.subscriber_list.subscribers.filter(is_active=True)
-    if not subscribers.exists():
-        logger.warning(f"No active subscribers found for campaign {campaign.name}")
+    if not campaign.subscriber_list:
+        logger.warning(f"Campaign {campaign.name} has no subscriber list")
         return
     
     # Get first email in sequence
@@ -845,24 +1306,76 @@ def send_campaign_emails(campaign_id):
         logger.warning(f"No emails found in campaign {campaign.name}")
         return
     
-    # Schedule the first email for each subscriber
-    for subscriber in subscribers:
-        # Check if this subscriber has already received emails from this campaign
-        if not EmailEvent.objects.filter(
-            email__campaign=campaign, 
-            subscriber_email=subscriber.email,
-            event_type='sent'
-        ).exists():
-            # Send the first email immediately
-            send_campaign_email(
-                email_id=str(first_email.id),
-                subscriber_id=str(subscriber.id)
-            )
+    # Active subscribers in the list who have neither been sent anything from this
+    # campaign nor already have the first email waiting in the queue
+    already_sent = EmailEvent.objects.filter(
+        email__campaign=campaign,
+        subscriber_email=OuterRef('email'),
+        event_type='sent',
+    )
+    already_queued = EmailSendRequest.objects.filter(
+        email=first_email,
+        subscriber=OuterRef('pk'),
+        status__in=['pending', 'queued', 'sent'],
+    )
+    subscribers = (
+        campaign.subscriber_list.subscribers.filter(is_active=True)
+        .exclude(Exists(already_sent))
+        .exclude(Exists(already_queued))
+        .values_list('id', 'email', 'first_name', 'last_name', 'timezone')
+    )
     
-    logger.info(f"Scheduled first email of campaign {campaign.name} for {subscribers.count()} subscribers")
+    now = tz.now()
+    window = SendWindow.for_campaign(campaign)
+    table = first_index = None
+    if campaign.materialize_sequence:
+        table = step_table(campaign.pk)
+        first_index = getattr(table.step_for(first_email.pk), 'index', 0)
+    scheduled = 0
+    pending = []
+    for subscriber_id, subscriber_email, first_name, last_name, subscriber_tz in subscribers.iterator(chunk_size=FANOUT_CHUNK_SIZE):
+        variables = {'first_name': first_name or '', 'last_name': last_name or '', 'email': subscriber_email}
+        if table is not None:
+            pending.extend(_sequence_send_requests(
+                campaign, table, first_index, now, subscriber_id, subscriber_email, variables, subscriber_tz, window,
+            ))
+        else:
+            if window is not None:
+                # Outside the window, first emails are spread over the next one
+                scheduled_for = window.place(now, f"{subscriber_email}:{first_email.pk}", subscriber_tz, now=now)
+            else:
+                scheduled_for = now
+            pending.append(EmailSendRequest(
+                user=campaign.user,
+                campaign=campaign,
+                email=first_email,
+                subscriber_id=subscriber_id,
+                subscriber_email=subscriber_email,
+                variables=variables,
+                scheduled_for=scheduled_for,
+                status='pending',
+            ))
+        if len(pending) >= FANOUT_CHUNK_SIZE:
+            EmailSendRequest.objects.bulk_create(pending)
+            scheduled += len(pending)
+            pending = []
+    if pending:
+        EmailSendRequest.objects.bulk_create(pending)
+        scheduled += len(pending)
+    
+    if not scheduled:
+        logger.warning(f"No active subscribers left to schedule for campaign {campaign.name}")
+        return
+    
+    # bulk_create skips post_save, so wake the scheduler explicitly
+    notify_bulk_send_requests()
+    if table is not None:
+        logger.info(f"Scheduled the whole sequence of campaign {campaign.name} ({scheduled} emails)")
+    else:
+        logger.info(f"Scheduled first email of campaign {campaign.name} for {scheduled} subscribers")
 
 
-def send_campaign_email(email_id, subscriber_id, variables=None, original_email_message=None):
+def send_campaign_email(email_id, subscriber_id, variables=None, original_email_message=None, context=None):
     """Send a specific campaign email to a specific subscriber.
     
     Args:
@@ -872,12 +1385,13 @@ def send_campaign_email(email_id, subscriber_id, variables=None, original_email_
         original_email_message: Optional EmailMessage object representing the original incoming email
                                that triggered this auto-reply. If provided, its content will be
                                appended to the sent email with a separator.
+        context: Optional SendContext for the campaign owner, shared by callers sending many
     """
     from .models import Email, EmailEvent
     from subscribers.models import Subscriber
     
     try:
-        email = Email.objects.select_related('campaign').get(id=email_id)
+        email = Email.objects.select_related('campaign', 'footer').get(id=email_id)
     except Email.DoesNotExist:
         logger.error(f"Email {email_id} not found")
         return
@@ -894,7 +1408,11 @@ def send_campaign_email(email_id, subscriber_id, variables=None, original_email_
         return
     
     # Check if subscriber is still in the list and active
-    if not subscriber.is_active or subscriber not in email.campaign.subscriber_list.subscribers.all():
+    in_list = (
+        email.campaign.subscriber_list is not None
+        and email.campaign.subscriber_list.subscribers.filter(id=subscriber.id).exists()
+    )
+    if not subscriber.is_active or not in_list:
         logger.info(f"Subscriber {subscriber.email} is no longer active or in the list. Skipping email.")
         return
     
@@ -913,200 +1431,38 @@ def send_campaign_email(email_id, subscriber_id, variables=None, original_email_
     if original_email_message and getattr(original_email_message, 'subject', None):
         variables.setdefault('subject', original_email_message.subject)
     
-    # Get user profile for ad settings
-    user_profile, created = UserProfile.objects.get_or_create(user=email.campaign.user)
-    show_ads = not user_profile.has_verified_promo
-    show_unsubscribe = not user_profile.send_without_unsubscribe
-    
-    # Create the sent event first to get tracking ID
-    sent_event = EmailEvent.objects.create(
-        email=email,
-        subscriber_email=subscriber.email,
-        event_type='sent'
-    )
-    tracking_id = str(sent_event.id)
-    
-    # Get site information for tracking, unsubscribe links, and {{site_name}}/{{site_url}} in body
-    site_url, site_name, site_logo = _get_site_info(request=None)
-    variables['site_name'] = site_name
-    variables['site_url'] = site_url
-    user_email_for_sender = email.campaign.user.email
-    variables['sender_email'] = user_email_for_sender
-
-    # Generate URLs (clean, no mention of tracking or pixel)
-    from urllib.parse import quote
-    encoded_email = quote(subscriber.email, safe='')
-    unsubscribe_link = f"{site_url}/unsubscribe/{subscriber.uuid}/"
-    
-    # Prepare email with tracking and replace variables
-    html_content = _normalize_html_line_breaks(email.body_html or "")
-    text_content = email.body_text
-    subject = email.subject
-    
-    # Replace variables in content (robustly handle {{ key }} with optional whitespace/case)
-    # Sanitize values so nan/None never appear in email (same as _send_single_email_sync)
-    def _safe_replacement(val):
-        if val is None:
-            return ''
-        if isinstance(val, float) and (val != val or val == float('inf') or val == float('-inf')):
-            return ''
-        s = str(val).strip()
-        return '' if s.lower() == 'nan' else s
-
-    if variables:
-        import re
-        for key, value in variables.items():
-            pattern = re.compile(r"\{\{\s*" + re.escape(key) + r"\s*\}\}", re.IGNORECASE)
-            replacement = _safe_replacement(value)
-            if html_content:
-                html_content = pattern.sub(replacement, html_content)
-            if text_content:
-                text_content = pattern.sub(replacement, text_content)
-            if subject:
-                subject = pattern.sub(replacement, subject)
-
-    # Replace HR tags with separator image and wrap all links with tracking
-    html_content = _replace_hr_with_separator(html_content, tracking_id, subscriber.email, base_url=site_url)
-    html_content = _wrap_links_with_tracking(html_content, tracking_id, subscriber.email, base_url=site_url)
-    
-    # Always add tracking pixel for open tracking (especially important for IMAP/Gmail auto-replies)
-    html_content = _add_tracking_pixel(html_content, tracking_id, subscriber.email, base_url=site_url)
-    
-    # Add email footer if one is assigned
-    if email.footer:
-        footer_html = email.footer.html_content
-        if variables:
-            for key, value in variables.items():
-                placeholder = f"{{{{{key}}}}}"
-                footer_html = footer_html.replace(placeholder, _safe_replacement(value))
-        html_content += footer_html
-    
-    # For auto-reply campaigns, append original incoming email content with separator
-    campaign_name_lower = email.campaign.name.lower()
-    is_auto_reply = 'auto' in campaign_name_lower or 'reply' in campaign_name_lower
-    if is_auto_reply and original_email_message:
-        from django.utils import dateformat
-        
-        # Format date for separator: "On Sun, Jan 18, 2026, 2:08 PM"
-        original_date = original_email_message.received_at
-        date_str = dateformat.format(original_date, 'D, M j, Y, g:i A')
-        
-        # Get original email sender
-        original_provider_data = original_email_message.provider_data or {}
-        original_from_email = original_email_message.from_email or ''
-        original_from_name = original_provider_data.get('from_name', '') or original_provider_data.get('sender_name', '')
-        
-        # Format separator: "On [date] [email] wrote:"
-        separator_text = f"On {date_str} {original_from_email} wrote:"
-        separator_html = f'<div style="margin-top: 20px; padding-top: 20px; border-top: 1px solid #e0e0e0;"><p style="font-size: 12px; color: #666; margin-bottom: 10px;">{separator_text}</p>'
-        
-        # Get original email content - ALWAYS use text content, convert HTML to plain text if needed
-        original_body_text = original_email_message.body_text or ''
-        if not original_body_text and original_email_message.body_html:
-            # Convert HTML to plain text
-            original_body_text = _html_to_plain_text(original_email_message.body_html)
-        
-        # Convert plain text to HTML by escaping and preserving line breaks
-        import html
-        escaped_text = html.escape(original_body_text)
-        # Convert line breaks to <br>
-        escaped_text = escaped_text.replace('\n', '<br>').replace('\r', '')
-        original_content_html = f'<div style="font-size: 13px; color: #333; line-height: 1.6;">{escaped_text}</div>'
-        
-        separator_html += original_content_html + '</div>'
-        
-        # Add separator and original content to HTML
-        html_content += separator_html
-    
-    # Add ads if required
-    if show_ads:
-        ads_html = render_to_string('emails/ad_footer.html', {
-            'site_url': site_url,
-            'site_name': site_name,
-            'site_logo': site_logo,
-        })
-        html_content += ads_html
+    # Profile, site info, ad footer and address block for the campaign owner
+    if context is None:
+        context = SendContext(email.campaign.user, email.campaign)
+    user_profile = context.profile
     
-    # Add unsubscribe link if required
-    if show_unsubscribe:
-        # Format user address for footer (required by CAN-SPAM, GDPR, etc.)
-        address_lines = []
-        # Add full name first if available
-        if user_profile.full_name:
-            address_lines.append(user_profile.full_name)
-        if user_profile.address_line1:
-            address_lines.append(user_profile.address_line1)
-        if user_profile.address_line2:
-            address_lines.append(user_profile.address_line2)
-        city_state = []
-        if user_profile.city:
-            city_state.append(user_profile.city)
-        if user_profile.state:
-            city_state.append(user_profile.state)
-        if city_state:
-            address_lines.append(', '.join(city_state))
-        postal_country = []
-        if user_profile.postal_code:
-            postal_country.append(user_profile.postal_code)
-        if user_profile.country:
-            postal_country.append(user_profile.country)
-        if postal_country:
-            address_lines.append(' '.join(postal_country))
-        
-        address_html = ''
-        if address_lines:
-            address_html = '<p style="font-size: 11px; color: #999; margin-top: 10px; line-height: 1.4;">' + '<br>'.join(address_lines) + '</p>'
-        
-        unsubscribe_html = f'<hr style="border: none; border-top: 1px solid #e0e0e0; margin: 20px 0;"><p style="font-size: 12px; color: #666; margin-top: 20px;">If you no longer wish to receive these emails, you can <a href="{unsubscribe_link}">unsubscribe here</a>.</p>{address_html}'
-        html_content += unsubscribe_html
-    
-    # Plain part must match HTML structure (stored body_text often loses </p> breaks — jQuery .text() concatenates paragraphs)
-    if html_content and html_content.strip():
-        text_content = _html_to_plain_text(html_content)
-    
-    # Get user email and name for From address
-    user_email = email.campaign.user.email
+    # Tracking ID is allocated up front; the 'sent' EmailEvent is saved with this id once delivered
+    tracking_id = str(uuid.uuid4())
     
-    # Check if user has valid SPF record
-    has_valid_spf = user_profile.spf_verified
-    
-    # Get full_name for From header
-    full_name = user_profile.full_name or ''
-    
-    # Format From header: "Full Name <email@example.com>" or just email if no name
-    if full_name:
-        from_email_header = f"{full_name} <{user_email}>"
-    else:
-        from_email_header = user_email
-    
-    # Create and send email
-    # Check if user has auto BCC enabled
-    bcc_list = []
-    if user_profile.auto_bcc_enabled:
-        bcc_list = [user_email]  # BCC the user so they can see emails being sent
-    
-    msg = EmailMultiAlternatives(
-        subject=subject,
-        body=text_content,
-        from_email=from_email_header,
-        to=[subscriber.email],
-        bcc=bcc_list if bcc_list else None
+    rendered = render_email(
+        email,
+        context,
+        variables,
+        subscriber_email=subscriber.email,
+        subscriber_uuid=subscriber.uuid,
+        tracking_id=tracking_id,
+        original_email_message=original_email_message,
     )
-    # Only set Sender header if user doesn't have valid SPF record
-    if not has_valid_spf:
-        msg.extra_headers['Sender'] = settings.DEFAULT_FROM_EMAIL
-    
-    # Add List-Unsubscribe headers if unsubscribe is enabled
-    if show_unsubscribe:
-        msg.extra_headers['List-Unsubscribe'] = f"<{unsubscribe_link}>"
-        msg.extra_headers['List-Unsubscribe-Post'] = "List-Unsubscribe=One-Click"
+    subject, html_content, text_content = rendered.subject, rendered.html, rendered.text
     
-    msg.attach_alternative(html_content, "text/html")
+    user_email = context.user_email
+    msg = context.build_message(subject, text_content, html_content, subscriber.email, subscriber.uuid, email=email)
     
     try:
         msg.send()
         
         # Campaign metrics are updated via EmailEvent post_save signal
+        EmailEvent.objects.create(
+            id=tracking_id,
+            email=email,
+            subscriber_email=subscriber.email,
+            event_type='sent'
+        )
         campaign = email.campaign
         logger.debug(f"Email sent; campaign {campaign.id} metrics updated by signal")
         
@@ -1122,7 +1478,6 @@ def send_campaign_email(email_id, subscriber_id, variables=None, original_email_
         
         if is_gmail_campaign or is_imap_campaign:
             from gmail.models import EmailCredential, EmailMessage, EmailProvider
-            import uuid
             
             # Find the credential for this user and provider
             provider = EmailProvider.GMAIL if is_gmail_campaign else EmailProvider.IMAP
@@ -1181,27 +1536,29 @@ def send_campaign_email(email_id, subscriber_id, variables=None, original_email_
                 logger.debug(f"Could not find {provider} credential for user {campaign.user.id} to create EmailMessage for sent email (optional; email was still sent)")
         
         # Schedule the next email in sequence if one exists
-        next_email = email.campaign.emails.filter(order__gt=email.order).order_by('order').first()
-        if next_email:
-            # Calculate when to send the next email
-            wait_time_val = next_email.wait_time or 0
-            wait_unit_val = next_email.wait_unit or 'days'
-            
-            send_delay = timedelta(0)
-            if wait_unit_val == 'seconds':
-                send_delay = timedelta(seconds=wait_time_val)
-            elif wait_unit_val == 'minutes':
-                send_delay = timedelta(minutes=wait_time_val)
-            elif wait_unit_val == 'hours':
-                send_delay = timedelta(hours=wait_time_val)
-            elif wait_unit_val == 'days':
-                send_delay = timedelta(days=wait_time_val)
-            elif wait_unit_val == 'weeks':
-                send_delay = timedelta(weeks=wait_time_val)
-            elif wait_unit_val == 'months':
-                send_delay = timedelta(days=wait_time_val * 30)
+        next_email = next_step(email.campaign_id, email.pk)
+        if next_email and email.campaign.materialize_sequence:
+            # Queue the rest of the sequence now rather than one step per send
+            from .dispatch import notify_bulk_send_requests
+            from .models import EmailSendRequest
             
-            scheduled_for = tz.now() + send_delay
+            next_variables = (variables or {}).copy()
+            if original_email_message:
+                next_variables['_original_email_id'] = str(original_email_message.id)
+            rows = _sequence_send_requests(
+                email.campaign, step_table(email.campaign_id), next_email.index, next_email.delay.after(tz.now()),
+                subscriber.pk, subscriber.email, next_variables, subscriber.timezone,
+                SendWindow.for_campaign(email.campaign), spread_first=True,
+            )
+            EmailSendRequest.objects.bulk_create(rows)
+            notify_bulk_send_requests()
+            logger.info(f"Scheduled the remaining {len(rows)} emails of campaign '{email.campaign.name}' for {subscriber.email}")
+        elif next_email:
+            # The next email is due its wait after this one
+            scheduled_for = apply_send_window(
+                email.campaign, next_email.delay.after(tz.now()), f"{subscriber.email}:{next_email.email_id}",
+                subscriber.timezone, spread_day=spreads_over_day(next_email),
+            )
 
             # Use EmailSendRequest to schedule the next email
             # Store original email message ID in variables so subsequent emails can include it
@@ -1213,7 +1570,7 @@ def send_campaign_email(email_id, subscriber_id, variables=None, original_email_
             EmailSendRequest.objects.create(
                 user=email.campaign.user,
                 campaign=email.campaign,
-                email=next_email,
+                email_id=next_email.email_id,
                 subscriber=subscriber,
                 subscriber_email=subscriber.email,
                 variables=next_variables,
@@ -1228,7 +1585,7 @@ def send_campaign_email(email_id, subscriber_id, variables=None, original_email_
 
 def process_email_open(tracking_id, subscriber_email):
     """Process email open event."""
-    from .models import EmailEvent, Campaign
+    from .models import EmailEvent
     
     try:
         # Find the sent event with the same tracking ID
@@ -1246,18 +1603,13 @@ def process_email_open(tracking_id, subscriber_email):
         ).exists()
         
         if not existing_open:
-            # Create an open event
+            # Create an open event (counted by the post_save metrics signal)
             EmailEvent.objects.create(
                 email=sent_event.email,
                 subscriber_email=subscriber_email,
                 event_type='opened'
             )
             
-            # Update campaign metrics
-            campaign = sent_event.email.campaign
-            campaign.open_count += 1
-            campaign.save(update_fields=['open_count'])
-            
             logger.info(f"Recorded open event for {subscriber_email}")
         else:
             logger.debug(f"Open event already exists for {subscriber_email}, skipping duplicate")
@@ -1270,7 +1622,7 @@ def process_email_open(tracking_id, subscriber_email):
 
 def process_email_click(tracking_id, subscriber_email, link_url):
     """Process email click event."""
-    from .models import EmailEvent, Campaign
+    from .models import EmailEvent
     
     try:
         # Find the sent event with the same tracking ID
@@ -1280,7 +1632,8 @@ def process_email_click(tracking_id, subscriber_email, link_url):
             subscriber_email=subscriber_email
         )
         
-        # Always create click events (even if duplicate link clicks) for accurate tracking
+        # Always create click events (even if duplicate link clicks) for accurate tracking;
+        # the post_save metrics signal counts each one
         EmailEvent.objects.create(
             email=sent_event.email,
             subscriber_email=subscriber_email,
@@ -1288,11 +1641,6 @@ def process_email_click(tracking_id, subscriber_email, link_url):
             link_clicked=link_url
         )
         
-        # Update campaign metrics (count each click)
-        campaign = sent_event.email.campaign
-        campaign.click_count += 1
-        campaign.save(update_fields=['click_count'])
-        
         logger.info(f"Recorded click event for {subscriber_email} on {link_url}")
     
     except EmailEvent.DoesNotExist:
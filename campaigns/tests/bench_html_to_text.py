@@ -0,0 +1,47 @@
+#!/usr/bin/env python
+"""
+Micro-benchmark for campaigns.tasks._html_to_plain_text.
+
+Times the conversion of each document in the golden corpus (the rendered
+campaign email is the one that matters for the send loop).
+
+Usage:
+    python campaigns/tests/bench_html_to_text.py
+    python campaigns/tests/bench_html_to_text.py --number 20000
+"""
+
+import argparse
+import json
+import os
+import sys
+import timeit
+from pathlib import Path
+
+BASE_DIR = Path(__file__).resolve().parents[2]
+sys.path.insert(0, str(BASE_DIR))
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'dripemails.settings')
+
+import django
+
+django.setup()
+
+from campaigns.tasks import _html_to_plain_text
+
+CORPUS = json.loads((Path(__file__).parent / 'html_to_text_corpus.json').read_text(encoding='utf-8'))
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark _html_to_plain_text over the golden corpus')
+    parser.add_argument('--number', type=int, default=5000, help='Calls per document (default: 5000)')
+    args = parser.parse_args()
+
+    total = 0.0
+    for case in CORPUS:
+        seconds = min(timeit.repeat(lambda: _html_to_plain_text(case['html']), number=args.number, repeat=3))
+        total += seconds
+        print(f"{case['name']:<24} {len(case['html']):>6} chars  {seconds / args.number * 1e6:8.2f} us/call")
+    print(f"{'total':<24} {'':>12}  {total / args.number * 1e6:8.2f} us/corpus")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,105 @@
+import smtplib
+import socket
+import unittest
+
+from django.core import mail
+from django.core.mail import EmailMultiAlternatives
+from django.test import TestCase
+from django.contrib.auth.models import User
+
+from analytics.models import UserProfile
+from campaigns import async_smtp
+from campaigns.models import Campaign, Email, EmailEvent
+from campaigns.tasks import send_email_batch
+from campaigns.retry import classify_send_error, PERMANENT
+
+try:
+    from aiosmtpd.controller import Controller
+except ImportError:
+    Controller = None
+
+
+class RecordingHandler:
+    """aiosmtpd handler that records messages and sessions and refuses one recipient."""
+
+    def __init__(self):
+        self.messages = []
+        self.sessions = set()
+
+    async def handle_RCPT(self, server, session, envelope, address, rcpt_options):
+        if address.startswith('refused@'):
+            return '550 5.1.1 No such user'
+        envelope.rcpt_tos.append(address)
+        return '250 OK'
+
+    async def handle_DATA(self, server, session, envelope):
+        self.sessions.add(id(session))
+        self.messages.append((envelope.mail_from, list(envelope.rcpt_tos)))
+        return '250 Message accepted'
+
+
+def _free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+@unittest.skipUnless(async_smtp.aiosmtplib and Controller, 'aiosmtplib and aiosmtpd are required')
+class AsyncSMTPBackendTest(TestCase):
+    def setUp(self):
+        self.handler = RecordingHandler()
+        self.port = _free_port()
+        self.controller = Controller(self.handler, hostname='127.0.0.1', port=self.port)
+        self.controller.start()
+
+    def tearDown(self):
+        async_smtp.close_delivery_engines()
+        self.controller.stop()
+
+    def _backend(self, **kwargs):
+        backend = mail.get_connection(
+            'campaigns.backends.AsyncSMTPBackend', host='127.0.0.1', port=self.port,
+            username='', password='', use_tls=False, **kwargs
+        )
+        with self.settings(ASYNC_SMTP_POOL_SIZE=3):
+            backend.open()
+        return backend
+
+    def _message(self, to):
+        msg = EmailMultiAlternatives('Hi', 'Body', 'sender@example.com', [to])
+        msg.attach_alternative('<p>Body</p>', 'text/html')
+        return msg
+
+    def test_messages_fan_out_over_pooled_sessions(self):
+        backend = self._backend()
+        messages = [self._message(f'reader{i}@example.com') for i in range(12)]
+
+        self.assertEqual(backend.send_messages(messages), 12)
+        self.assertEqual(backend.send_messages(messages[:3]), 3)
+        self.assertEqual(len(self.handler.messages), 15)
+        # Concurrent, but never more than the pool size, and sessions are reused across calls
+        self.assertLessEqual(backend.engine.pool.opened, 3)
+        self.assertGreater(backend.engine.pool.opened, 1)
+
+    def test_per_message_errors_are_smtplib_errors(self):
+        backend = self._backend(fail_silently=True)
+        errors = backend.deliver_each([self._message('ok@example.com'), self._message('refused@example.com')])
+
+        self.assertIsNone(errors[0])
+        self.assertIsInstance(errors[1], smtplib.SMTPRecipientsRefused)
+        self.assertEqual(classify_send_error(errors[1]), PERMANENT)
+        with self.assertRaises(smtplib.SMTPRecipientsRefused):
+            self._backend().send_messages([self._message('refused@example.com')])
+
+    def test_batch_sender_delivers_chunks_concurrently(self):
+        user = User.objects.create_user(username='async', email='async@example.com', password='pass')
+        # No BCC copy, so the refused recipient is the message's only one
+        UserProfile.objects.filter(user=user).update(auto_bcc_enabled=False)
+        campaign = Campaign.objects.create(user=user, name='Async Campaign')
+        email = Email.objects.create(campaign=campaign, subject='Hi', body_html='<p>Hi</p>', body_text='Hi')
+        pairs = [(email, f'reader{i}@example.com') for i in range(5)] + [(email, 'refused@example.com')]
+
+        result = send_email_batch(pairs, batch_size=10, connection=self._backend())
+
+        self.assertEqual(result, {'sent': 5, 'failed': 1})
+        self.assertEqual(EmailEvent.objects.filter(email=email, event_type='sent').count(), 5)
@@ -0,0 +1,102 @@
+import re
+import smtplib
+from unittest import mock
+
+from django.core import mail
+from django.db import connection as db_connection
+from django.core.mail.backends.locmem import EmailBackend
+from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+from django.contrib.auth.models import User
+from django.utils import timezone
+from campaigns.models import Campaign, Email, EmailEvent, EmailSendRequest
+from analytics.models import UserProfile
+from campaigns.tasks import send_email_batch
+from campaigns.tokens import verify_token
+from subscribers.models import Subscriber
+
+
+class CountingBackend(EmailBackend):
+    """locmem backend that counts sessions and can drop the first send."""
+
+    def __init__(self, drop_first=False, **kwargs):
+        super().__init__(**kwargs)
+        self.opened = 0
+        self.drop_first = drop_first
+
+    def open(self):
+        self.opened += 1
+        return True
+
+    def send_messages(self, messages):
+        if self.drop_first:
+            self.drop_first = False
+            raise smtplib.SMTPServerDisconnected('Connection unexpectedly closed')
+        return super().send_messages(messages)
+
+
+class BatchSendTest(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='batch', email='batch@example.com', password='pass')
+        self.campaign = Campaign.objects.create(user=self.user, name='Batch Campaign')
+        self.email = Email.objects.create(campaign=self.campaign, subject='Hi {{first_name}}', body_html='<p>Hi</p>', body_text='Hi')
+        self.subscribers = [
+            Subscriber.objects.create(email=f'reader{i}@example.com', first_name=f'R{i}') for i in range(5)
+        ]
+
+    def _requests(self):
+        return [
+            EmailSendRequest.objects.create(
+                user=self.user, campaign=self.campaign, email=self.email, subscriber=sub,
+                subscriber_email=sub.email, variables={'first_name': sub.first_name},
+                scheduled_for=timezone.now(), status='queued',
+            )
+            for sub in self.subscribers
+        ]
+
+    def test_requests_share_connection_per_batch(self):
+        requests = self._requests()
+        connection = CountingBackend()
+        result = send_email_batch(requests, batch_size=2, connection=connection)
+
+        self.assertEqual(result, {'sent': 5, 'failed': 0})
+        self.assertEqual(connection.opened, 3)
+        self.assertEqual(len(mail.outbox), 5)
+        self.assertEqual(mail.outbox[0].subject, 'Hi R0')
+        self.assertEqual(EmailSendRequest.objects.filter(status='sent').count(), 5)
+
+    def test_pairs_and_reconnect_on_dropped_session(self):
+        connection = CountingBackend(drop_first=True)
+        pairs = [(self.email, sub) for sub in self.subscribers[:2]]
+        result = send_email_batch(pairs, connection=connection)
+
+        self.assertEqual(result, {'sent': 2, 'failed': 0})
+        self.assertEqual(connection.opened, 2)
+        self.assertEqual(sorted(m.to[0] for m in mail.outbox), ['reader0@example.com', 'reader1@example.com'])
+
+    def test_send_context_is_built_once_per_user(self):
+        requests = self._requests()
+        with mock.patch.object(UserProfile.objects, 'get_or_create', wraps=UserProfile.objects.get_or_create) as profile_lookup:
+            send_email_batch(requests, batch_size=2, connection=CountingBackend())
+
+        self.assertEqual(profile_lookup.call_count, 1)
+        for message, sub in zip(mail.outbox, self.subscribers):
+            self.assertTrue(message.extra_headers['List-Unsubscribe'].endswith(f'/unsubscribe/{sub.uuid}/>'))
+
+    def test_sent_events_are_bulk_created(self):
+        requests = self._requests()
+        with CaptureQueriesContext(db_connection) as queries:
+            send_email_batch(requests, batch_size=2, connection=CountingBackend())
+
+        event_inserts = [q for q in queries if q['sql'].startswith('INSERT INTO "campaigns_emailevent"')]
+        self.assertEqual(len(event_inserts), 3)
+        self.assertEqual(EmailEvent.objects.filter(email=self.email, event_type='sent').count(), 5)
+        self.campaign.refresh_from_db()
+        self.assertEqual(self.campaign.sent_count, 5)
+        # The tracking token in each message carries its saved event's id
+        for message in mail.outbox:
+            event = EmailEvent.objects.get(subscriber_email=message.to[0])
+            token = re.search(r't=([^&"]+)', message.alternatives[0][0]).group(1)
+            claims = verify_token(token)
+            self.assertEqual(claims.tracking_id, str(event.id))
+            self.assertEqual(claims.subscriber_email, message.to[0])
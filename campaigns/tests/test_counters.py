@@ -0,0 +1,94 @@
+from django.test import TestCase, override_settings
+from django.contrib.auth.models import User
+from campaigns.counters import CounterBuffer, add_counts, fold_counter_shards, load_counts, reconcile_counters
+from campaigns.models import Campaign, CampaignCounterShard, Email, EmailEvent
+from campaigns.tasks import process_email_click, process_email_open
+
+
+class CampaignCounterTest(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='counters', email='counters@example.com', password='pass')
+        self.campaign = Campaign.objects.create(user=self.user, name='Counter Campaign')
+        self.email = Email.objects.create(campaign=self.campaign, subject='Hi', body_html='<p>Hi</p>', body_text='Hi')
+
+    def _counts(self):
+        campaign = Campaign.objects.get(pk=self.campaign.pk)
+        return campaign.sent_count, campaign.open_count, campaign.click_count
+
+    def test_events_are_counted_with_one_update(self):
+        EmailEvent.objects.create(email=self.email, subscriber_email='a@example.com', event_type='sent')
+        with self.assertNumQueries(2):
+            # The INSERT and the counter UPDATE; the campaign row is never read
+            EmailEvent.objects.create(email=self.email, subscriber_email='b@example.com', event_type='sent')
+        self.assertEqual(self._counts(), (2, 0, 0))
+
+    def test_open_and_click_are_counted_once(self):
+        sent = EmailEvent.objects.create(email=self.email, subscriber_email='a@example.com', event_type='sent')
+        process_email_open(sent.id, 'a@example.com')
+        process_email_open(sent.id, 'a@example.com')
+        process_email_click(sent.id, 'a@example.com', 'https://example.net/')
+        self.assertEqual(self._counts(), (1, 1, 1))
+
+    def test_buffer_sums_increments(self):
+        buffer = CounterBuffer(autostart=False)
+        for _ in range(3):
+            buffer.add({self.campaign.pk: {'open_count': 1}})
+        buffer.add({self.campaign.pk: {'click_count': 2}})
+
+        with self.assertNumQueries(1):
+            self.assertEqual(buffer.flush(), 1)
+        self.assertEqual(self._counts(), (0, 3, 2))
+        self.assertEqual(len(buffer), 0)
+
+    @override_settings(CAMPAIGN_COUNTER_FLUSH_INTERVAL=0)
+    def test_reconcile_recomputes_from_events(self):
+        EmailEvent.objects.create(email=self.email, subscriber_email='a@example.com', event_type='sent')
+        EmailEvent.objects.create(email=self.email, subscriber_email='a@example.com', event_type='opened')
+        add_counts({self.campaign.pk: {'open_count': 5, 'bounce_count': 1}})
+
+        self.assertEqual(reconcile_counters(), [self.campaign.pk])
+        campaign = Campaign.objects.get(pk=self.campaign.pk)
+        self.assertEqual((campaign.sent_count, campaign.open_count, campaign.bounce_count), (1, 1, 0))
+        self.assertEqual(reconcile_counters([self.campaign.pk]), [])
+
+
+@override_settings(CAMPAIGN_COUNTER_SHARDS=4, CAMPAIGN_COUNTER_CACHE_SECONDS=0)
+class ShardedCounterTest(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='shards', email='shards@example.com', password='pass')
+        self.campaign = Campaign.objects.create(user=self.user, name='Shard Campaign', sent_count=10)
+        self.email = Email.objects.create(campaign=self.campaign, subject='Hi', body_html='<p>Hi</p>', body_text='Hi')
+
+    def test_increments_go_to_shards(self):
+        for i in range(20):
+            EmailEvent.objects.create(email=self.email, subscriber_email=f'r{i}@example.com', event_type='sent')
+        add_counts({self.campaign.pk: {'open_count': 5, 'bounce_count': 2}})
+
+        campaign = Campaign.objects.get(pk=self.campaign.pk)
+        self.assertEqual(campaign.sent_count, 10)
+        self.assertLessEqual(CampaignCounterShard.objects.filter(campaign=campaign).count(), 4)
+        self.assertEqual((campaign.counts['sent_count'], campaign.counts['open_count']), (30, 5))
+        self.assertEqual(campaign.open_rate, round(5 / 30 * 100, 2))
+        self.assertEqual(campaign.delivery_rate, round(28 / 30 * 100, 2))
+
+    def test_counts_of_many_campaigns_in_one_query(self):
+        other = Campaign.objects.create(user=self.user, name='Other Shard Campaign')
+        add_counts({self.campaign.pk: {'click_count': 1}, other.pk: {'click_count': 2}})
+
+        campaigns = list(Campaign.objects.filter(pk__in=[self.campaign.pk, other.pk]).order_by('name'))
+        with self.assertNumQueries(1):
+            load_counts(campaigns)
+            self.assertEqual([c.counts['click_count'] for c in campaigns], [2, 1])
+
+    def test_fold_and_reconcile(self):
+        EmailEvent.objects.create(email=self.email, subscriber_email='a@example.com', event_type='sent')
+        self.assertEqual(fold_counter_shards(self.campaign.pk), 1)
+        campaign = Campaign.objects.get(pk=self.campaign.pk)
+        self.assertEqual(campaign.sent_count, 11)
+        self.assertFalse(CampaignCounterShard.objects.exists())
+
+        add_counts({self.campaign.pk: {'sent_count': 3}})
+        self.assertEqual(reconcile_counters([self.campaign.pk]), [self.campaign.pk])
+        campaign = Campaign.objects.get(pk=self.campaign.pk)
+        self.assertEqual((campaign.sent_count, campaign.counts['sent_count']), (1, 1))
+        self.assertFalse(CampaignCounterShard.objects.exists())
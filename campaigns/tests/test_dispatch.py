@@ -0,0 +1,156 @@
+from datetime import timedelta
+from types import SimpleNamespace
+import socket
+import time
+from unittest import mock
+
+from django.test import TestCase, override_settings
+from django.contrib.auth.models import User
+from django.utils import timezone
+from campaigns.models import Campaign, Email, EmailSendRequest
+from campaigns import dispatch
+from campaigns.dispatch import claim_due_requests, send_due_requests, SendScheduler
+
+
+class DispatchTestCase(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='claim', email='claim@example.com', password='pass')
+        self.campaign = Campaign.objects.create(user=self.user, name='Claim Campaign')
+        self.email = Email.objects.create(campaign=self.campaign, subject='Hi', body_html='<p>Hi</p>', body_text='Hi')
+
+    def _request(self, status='pending', delta=timedelta(minutes=-1)):
+        return EmailSendRequest.objects.create(
+            user=self.user, campaign=self.campaign, email=self.email,
+            subscriber_email='reader@example.com', scheduled_for=timezone.now() + delta, status=status,
+        )
+
+
+
+class ClaimDueRequestsTest(DispatchTestCase):
+    def test_rows_are_claimed_once(self):
+        due = [self._request() for _ in range(3)]
+        self._request(delta=timedelta(hours=1))
+
+        claimed = claim_due_requests()
+        self.assertEqual({r.id for r in claimed}, {r.id for r in due})
+        self.assertTrue(all(r.status == 'queued' for r in claimed))
+        self.assertEqual(claim_due_requests(), [])
+
+    def test_limit(self):
+        for _ in range(3):
+            self._request()
+        self.assertEqual(len(claim_due_requests(limit=2)), 2)
+        self.assertEqual(len(claim_due_requests()), 1)
+
+    def test_requests_of_inactive_campaigns_or_subscribers_are_cancelled(self):
+        from subscribers.models import Subscriber
+
+        due = self._request()
+        subscriber = Subscriber.objects.create(email='gone@example.com')
+        gone = self._request()
+        EmailSendRequest.objects.filter(id=gone.id).update(subscriber=subscriber)
+        # Bulk updates, as the admin actions do, send no post_save
+        Subscriber.objects.filter(id=subscriber.id).update(is_active=False)
+
+        self.assertEqual([r.id for r in claim_due_requests()], [due.id])
+        self.assertEqual(EmailSendRequest.objects.get(id=gone.id).status, 'cancelled')
+
+        later = self._request()
+        Campaign.objects.filter(id=self.campaign.id).update(is_active=False)
+        self.assertEqual(claim_due_requests(), [])
+        self.assertEqual(EmailSendRequest.objects.get(id=later.id).status, 'cancelled')
+
+    @override_settings(SEND_CLAIM_LEASE_SECONDS=60)
+    def test_expired_claims_are_reclaimed(self):
+        stale = self._request(status='queued')
+        EmailSendRequest.objects.filter(id=stale.id).update(updated_at=timezone.now() - timedelta(minutes=5))
+        self._request(status='queued')
+
+        self.assertEqual([r.id for r in claim_due_requests()], [stale.id])
+
+
+
+class SendDueRequestsTest(DispatchTestCase):
+    @override_settings(EMAIL_BATCH_SIZE=2)
+    def test_claims_one_round_at_a_time(self):
+        for _ in range(5):
+            self._request()
+        self._request(delta=timedelta(hours=1))
+        rounds = []
+
+        def fake_dispatch(requests, workers=1):
+            # Nothing else is claimed while a round is being sent
+            rounds.append((len(requests), EmailSendRequest.objects.filter(status='queued').count()))
+            EmailSendRequest.objects.filter(id__in=[r.id for r in requests]).update(status='sent')
+            return {'sent': len(requests), 'failed': 0, 'throttled': 0}
+
+        with mock.patch.object(dispatch, 'dispatch_requests', side_effect=fake_dispatch):
+            totals = send_due_requests(workers=1)
+        self.assertEqual(rounds, [(2, 2), (2, 2), (1, 1)])
+        self.assertEqual((totals['claimed'], totals['sent']), (5, 5))
+        self.assertEqual(EmailSendRequest.objects.filter(status='pending').count(), 1)
+
+    @override_settings(EMAIL_BATCH_SIZE=2)
+    def test_limit_spans_rounds(self):
+        for _ in range(5):
+            self._request()
+        with mock.patch.object(dispatch, 'dispatch_requests', return_value={'sent': 0, 'failed': 0, 'throttled': 0}):
+            self.assertEqual(send_due_requests(limit=3, workers=1)['claimed'], 3)
+
+
+class SendSchedulerTest(DispatchTestCase):
+    def test_window_heap_and_notifications(self):
+        due = self._request()
+        soon = self._request(delta=timedelta(minutes=5))
+        self._request(delta=timedelta(hours=2))
+
+        scheduler = SendScheduler(window_seconds=600, window_limit=100, refresh_seconds=60)
+        scheduler.load_window()
+        self.assertEqual(sorted(scheduler._queued), sorted([due.id, soon.id]))
+        self.assertEqual(scheduler._pop_due(time.time()), [due.id])
+        self.assertLessEqual(scheduler._next_timeout(time.time()), 300)
+
+        # New requests reach the heap through the post_save hook
+        dispatch._active_scheduler = scheduler
+        try:
+            fresh = self._request(delta=timedelta(seconds=-5))
+        finally:
+            dispatch._active_scheduler = None
+        self.assertEqual(scheduler._pop_due(time.time()), [fresh.id])
+
+    def test_notifications_from_other_processes(self):
+        scheduler = SendScheduler(window_seconds=600, window_limit=100, refresh_seconds=60)
+        scheduler.load_window()
+        request = self._request(delta=timedelta(seconds=-5))
+
+        # Stand-in for the LISTEN connection, readable with one pending notification
+        readable, writer = socket.socketpair()
+        self.addCleanup(readable.close)
+        self.addCleanup(writer.close)
+        writer.send(b'\0')
+        listen_conn = SimpleNamespace(
+            fileno=readable.fileno, poll=lambda: None,
+            notifies=[SimpleNamespace(payload=dispatch._notify_payload(request)), SimpleNamespace(payload='7|x')],
+        )
+        scheduler._listen = lambda: listen_conn
+
+        with self.assertLogs('campaigns.dispatch', 'WARNING') as logs:
+            scheduler._wait(0)
+        self.assertEqual(len(logs.output), 1)
+        self.assertIn("'7|x'", logs.output[0])
+        self.assertEqual(scheduler._pop_due(time.time()), [request.id])
+
+
+class ForecastSendLoadTest(DispatchTestCase):
+    def test_pending_sends_are_counted_per_hour(self):
+        self._request(delta=timedelta(hours=-2))
+        self._request(delta=timedelta(hours=2, minutes=5))
+        self._request(delta=timedelta(hours=2, minutes=10))
+        self._request(status='cancelled', delta=timedelta(hours=1))
+        self._request(delta=timedelta(hours=30))
+
+        forecast = dispatch.forecast_send_load(hours=6)
+        self.assertEqual(len(forecast), 6)
+        self.assertEqual(forecast[0][1], 1)
+        self.assertEqual(sum(count for _hour, count in forecast), 3)
+        self.assertEqual(forecast[1][0] - forecast[0][0], timedelta(hours=1))
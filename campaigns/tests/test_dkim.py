@@ -0,0 +1,140 @@
+import base64
+import hashlib
+import re
+
+from cryptography.hazmat.primitives import hashes, serialization
+from cryptography.hazmat.primitives.asymmetric import ed25519, padding, rsa
+from django.contrib.auth.models import User
+from django.test import SimpleTestCase, TestCase
+
+from analytics.models import UserProfile
+from campaigns.dkim import (
+    DKIMSigner, canonicalize_body, canonicalize_header, load_private_key, parse_headers,
+)
+from campaigns.models import DKIMKey
+from campaigns.tasks import SendContext
+
+
+def _pem(key):
+    return key.private_bytes(
+        serialization.Encoding.PEM, serialization.PrivateFormat.PKCS8, serialization.NoEncryption()
+    ).decode('ascii')
+
+
+RSA_KEY = rsa.generate_private_key(public_exponent=65537, key_size=2048)
+ED25519_KEY = ed25519.Ed25519PrivateKey.generate()
+
+
+def verify(message, public_key):
+    """Check the first DKIM-Signature of ``message`` the way a receiver would; returns its tags."""
+    header_block, _, body = message.partition(b'\r\n\r\n')
+    headers = parse_headers(header_block)
+    name, value = headers[0]
+    assert name.lower() == b'dkim-signature'
+    tags = dict(
+        tag.strip().split(b'=', 1) for tag in re.sub(rb'\s+', b'', value).split(b';') if tag.strip()
+    )
+    assert base64.b64decode(tags[b'bh']) == hashlib.sha256(canonicalize_body(body)).digest(), 'body hash'
+
+    last = {}
+    for header_name, header_value in headers[1:]:
+        last[header_name.strip().lower()] = (header_name, header_value)
+    signed = b''.join(
+        canonicalize_header(*last[h]) + b'\r\n' for h in dict.fromkeys(tags[b'h'].split(b':')) if h in last
+    )
+    signed += canonicalize_header(b'DKIM-Signature', re.sub(rb'(;\s*b=)[^;]*$', rb'\1', value))
+    signature = base64.b64decode(tags[b'b'])
+    if tags[b'a'] == b'ed25519-sha256':
+        public_key.verify(signature, hashlib.sha256(signed).digest())
+    else:
+        public_key.verify(signature, signed, padding.PKCS1v15(), hashes.SHA256())
+    return tags
+
+
+class CanonicalizationTest(SimpleTestCase):
+    def test_rfc6376_example(self):
+        # RFC 6376 3.4.5
+        self.assertEqual(canonicalize_header(b'A', b' X'), b'a:X')
+        self.assertEqual(canonicalize_header(b'B ', b' Y\t\r\n\tZ  '), b'b:Y Z')
+        self.assertEqual(canonicalize_body(b' C \r\nD \t E\r\n\r\n\r\n'), b' C\r\nD E\r\n')
+        self.assertEqual(canonicalize_body(b''), b'')
+
+
+class DKIMSignerTest(SimpleTestCase):
+    message = (
+        b'From: Sender <sender@example.com>\r\nTo: reader@example.net\r\nSubject: Hello\r\n'
+        b'Date: Fri, 16 Oct 2026 10:00:00 -0000\r\nMessage-ID: <1@example.com>\r\n'
+        b'X-Unsigned: yes\r\n\r\nHi  there \r\n\r\n'
+    )
+
+    def test_rsa_signature_verifies(self):
+        signed = DKIMSigner('example.com', 'drip', _pem(RSA_KEY)).sign(self.message, timestamp=1800000000)
+
+        tags = verify(signed, RSA_KEY.public_key())
+        self.assertEqual(tags[b'a'], b'rsa-sha256')
+        self.assertEqual(tags[b'c'], b'relaxed/relaxed')
+        self.assertEqual(tags[b'd'], b'example.com')
+        self.assertEqual(tags[b'h'], b'from:subject:date:message-id:to:from')
+        self.assertTrue(signed.endswith(self.message))
+        self.assertTrue(all(len(line) <= 998 for line in signed.split(b'\r\n')))
+
+    def test_ed25519_signature_verifies(self):
+        signed = DKIMSigner('example.com', 'ed', _pem(ED25519_KEY)).sign(self.message)
+
+        self.assertEqual(verify(signed, ED25519_KEY.public_key())[b'a'], b'ed25519-sha256')
+
+    def test_relaxed_signature_survives_whitespace_changes(self):
+        signed = DKIMSigner('example.com', 'drip', _pem(RSA_KEY)).sign(self.message)
+        rewrapped = signed.replace(b'Subject: Hello', b'Subject:   Hello').replace(b'there \r\n', b'there\r\n')
+
+        verify(rewrapped, RSA_KEY.public_key())
+        with self.assertRaises(Exception):
+            verify(signed.replace(b'Subject: Hello', b'Subject: Hullo'), RSA_KEY.public_key())
+
+    def test_keys_are_parsed_once(self):
+        pem = _pem(RSA_KEY)
+        load_private_key.cache_clear()
+        for _ in range(3):
+            DKIMSigner('example.com', 'drip', pem)
+
+        self.assertEqual(load_private_key.cache_info().misses, 1)
+        self.assertEqual(load_private_key.cache_info().hits, 2)
+
+
+class SendPipelineSigningTest(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='dkim', email='owner@brand.example', password='pass')
+        UserProfile.objects.filter(user=self.user).update(spf_verified=True)
+
+    def _context(self):
+        return SendContext(self.user, profile=UserProfile.objects.get(user=self.user))
+
+    def test_messages_signed_with_the_users_key(self):
+        DKIMKey.objects.create(user=None, domain='brand.example', selector='shared', private_key=_pem(ED25519_KEY))
+        DKIMKey.objects.create(user=self.user, domain='Brand.Example', selector='own', private_key=_pem(RSA_KEY))
+        context = self._context()
+        msg = context.build_message('Hi', 'Body', '<p>Body</p>', 'reader@example.net')
+        with self.assertNumQueries(0):
+            second = context.build_message('Hi again', 'Body', '<p>Body</p>', 'other@example.net')
+
+        tags = verify(msg.message().as_bytes(linesep='\r\n'), RSA_KEY.public_key())
+        self.assertEqual((tags[b'd'], tags[b's']), (b'brand.example', b'own'))
+        self.assertIn(b'content-type', tags[b'h'].split(b':'))
+        verify(second.message().as_bytes(linesep='\r\n'), RSA_KEY.public_key())
+
+    def test_sender_domain_key_used_without_spf(self):
+        UserProfile.objects.filter(user=self.user).update(spf_verified=False)
+        DKIMKey.objects.create(domain='example.com', selector='platform', private_key=_pem(RSA_KEY))
+        with self.settings(DEFAULT_FROM_EMAIL='noreply@example.com'):
+            msg = self._context().build_message('Hi', 'Body', '<p>Body</p>', 'reader@example.net')
+            tags = verify(msg.message().as_bytes(linesep='\r\n'), RSA_KEY.public_key())
+
+        self.assertEqual(tags[b'd'], b'example.com')
+        self.assertIn(b'sender', tags[b'h'].split(b':'))
+
+    def test_unsigned_without_key(self):
+        other = User.objects.create_user(username='other', email='x@other.example', password='pass')
+        DKIMKey.objects.create(user=other, domain='brand.example', selector='theirs', private_key=_pem(RSA_KEY))
+        msg = self._context().build_message('Hi', 'Body', '<p>Body</p>', 'reader@example.net')
+
+        self.assertNotIn(b'DKIM-Signature', msg.message().as_bytes())
@@ -0,0 +1,89 @@
+from unittest import mock
+
+from django.contrib import admin
+from django.db import connection
+from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+from django.contrib.auth.models import User
+from django.utils import timezone
+from campaigns.admin import CampaignAdmin
+from campaigns.models import Campaign, Email, EmailEvent, EmailSendRequest
+from campaigns.tasks import send_campaign_emails
+from subscribers.admin import SubscriberAdmin
+from subscribers.models import List, Subscriber
+
+
+class CampaignFanOutTest(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='fanout', email='fanout@example.com', password='pass')
+        self.list = List.objects.create(user=self.user, name='Readers')
+        # Inactive while the list is filled, so the subscribe signal doesn't send anything
+        self.campaign = Campaign.objects.create(user=self.user, name='Fan-out Campaign', subscriber_list=self.list, is_active=False)
+        self.first = Email.objects.create(campaign=self.campaign, subject='One', body_html='<p>1</p>', body_text='1', order=0)
+        Email.objects.create(campaign=self.campaign, subject='Two', body_html='<p>2</p>', body_text='2', order=1)
+        self.subscribers = []
+        for i in range(6):
+            subscriber = Subscriber.objects.create(email=f'fan{i}@example.com', first_name=f'F{i}', is_active=i != 5)
+            subscriber.lists.add(self.list)
+            self.subscribers.append(subscriber)
+        Campaign.objects.filter(id=self.campaign.id).update(is_active=True)
+
+    def test_only_new_subscribers_are_queued(self):
+        EmailEvent.objects.create(email=self.first, subscriber_email='fan0@example.com', event_type='sent')
+        EmailSendRequest.objects.create(
+            user=self.user, campaign=self.campaign, email=self.first, subscriber=self.subscribers[1],
+            subscriber_email='fan1@example.com', scheduled_for=timezone.now(), status='pending',
+        )
+
+        with CaptureQueriesContext(connection) as queries:
+            send_campaign_emails(self.campaign.id)
+        self.assertLess(len(queries), 10)
+
+        queued = EmailSendRequest.objects.filter(email=self.first).exclude(subscriber=self.subscribers[1])
+        self.assertEqual(sorted(r.subscriber_email for r in queued), [f'fan{i}@example.com' for i in (2, 3, 4)])
+        self.assertEqual(queued.get(subscriber_email='fan2@example.com').variables['first_name'], 'F2')
+        self.assertTrue(all(r.status == 'pending' for r in queued))
+
+        # Running it again finds nobody new
+        send_campaign_emails(self.campaign.id)
+        self.assertEqual(EmailSendRequest.objects.filter(email=self.first).count(), 4)
+
+    def test_materialized_sequence_is_queued_and_cancelled(self):
+        Campaign.objects.filter(id=self.campaign.id).update(materialize_sequence=True)
+        second = Email.objects.get(campaign=self.campaign, order=1)
+
+        send_campaign_emails(self.campaign.id)
+
+        queued = EmailSendRequest.objects.filter(subscriber=self.subscribers[0]).order_by('scheduled_for')
+        self.assertEqual([r.email_id for r in queued], [self.first.id, second.id])
+        self.assertTrue(all(r.materialized for r in queued))
+        # The second email waits its default one day after the first
+        gap = queued[1].scheduled_for - queued[0].scheduled_for
+        self.assertEqual(gap.days, 1)
+
+        # Unsubscribing cancels that subscriber's rows; deactivating the campaign the rest
+        subscriber = self.subscribers[0]
+        subscriber.is_active = False
+        subscriber.save(update_fields=['is_active'])
+        self.assertEqual(set(queued.values_list('status', flat=True)), {'cancelled'})
+
+        campaign = Campaign.objects.get(id=self.campaign.id)
+        campaign.is_active = False
+        campaign.save()
+        self.assertFalse(EmailSendRequest.objects.filter(campaign=campaign, status='pending').exists())
+
+    def test_admin_bulk_deactivation_cancels_materialized_sends(self):
+        # The admin actions use QuerySet.update(), which sends no post_save
+        Campaign.objects.filter(id=self.campaign.id).update(materialize_sequence=True)
+        send_campaign_emails(self.campaign.id)
+
+        with mock.patch.object(SubscriberAdmin, 'message_user'):
+            SubscriberAdmin(Subscriber, admin.site).deactivate_subscribers(None, Subscriber.objects.filter(id=self.subscribers[0].id))
+        self.assertEqual(
+            set(EmailSendRequest.objects.filter(subscriber=self.subscribers[0]).values_list('status', flat=True)), {'cancelled'}
+        )
+        self.assertTrue(EmailSendRequest.objects.filter(campaign=self.campaign, status='pending').exists())
+
+        with mock.patch.object(CampaignAdmin, 'message_user'):
+            CampaignAdmin(Campaign, admin.site).deactivate_campaigns(None, Campaign.objects.filter(id=self.campaign.id))
+        self.assertFalse(EmailSendRequest.objects.filter(campaign=self.campaign, status='pending').exists())
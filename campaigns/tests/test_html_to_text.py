@@ -0,0 +1,18 @@
+import json
+from pathlib import Path
+
+from django.test import SimpleTestCase
+from campaigns.tasks import _html_to_plain_text
+
+# Inputs and the output of the regex-chain converter this one replaced
+CORPUS = json.loads((Path(__file__).parent / 'html_to_text_corpus.json').read_text(encoding='utf-8'))
+
+
+class HtmlToPlainTextTest(SimpleTestCase):
+    def test_golden_corpus(self):
+        for case in CORPUS:
+            with self.subTest(case['name']):
+                self.assertEqual(_html_to_plain_text(case['html']), case['text'])
+
+    def test_stray_less_than_is_text(self):
+        self.assertEqual(_html_to_plain_text('<p>a < b</p><p>c > d</p>'), 'a < b\n\nc > d')
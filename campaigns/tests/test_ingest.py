@@ -0,0 +1,140 @@
+import os
+import tempfile
+import time
+import uuid
+from unittest import mock
+
+from django.test import TestCase, Client, override_settings
+from django.contrib.auth.models import User
+from campaigns.models import Campaign, Email, EmailEvent
+from campaigns.dedupe import RecentOpens, get_recent_opens, reset_recent_opens
+from campaigns import ingest
+from campaigns.ingest import CLICK, OPEN, EventBuffer, TrackedEvent, drain_spool, write_events
+from campaigns.tokens import mint_token
+
+
+class EventIngestTest(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='ingest', email='ingest@example.com', password='pass')
+        self.campaign = Campaign.objects.create(user=self.user, name='Ingest Campaign')
+        self.email = Email.objects.create(campaign=self.campaign, subject='Hi', body_html='<p>Hi</p>', body_text='Hi')
+        self.sent = EmailEvent.objects.create(email=self.email, subscriber_email='reader@example.com', event_type='sent')
+        self.campaign.refresh_from_db()
+
+    def _event(self, kind=OPEN, tracking_id=None, subscriber_email='reader@example.com', link_url=None):
+        return TrackedEvent(kind, str(tracking_id or self.sent.id), subscriber_email, link_url, time.time())
+
+    def test_opens_are_deduped_and_counted_once(self):
+        buffer = EventBuffer(autostart=False)
+        for _ in range(3):
+            buffer.append(self._event())
+        buffer.append(self._event(CLICK, link_url='https://example.net/'))
+        buffer.append(self._event(tracking_id=uuid.uuid4()))
+        buffer.append(self._event(subscriber_email='someone@example.com'))
+
+        with self.assertNumQueries(4):
+            self.assertEqual(buffer.flush(), 2)
+        self.assertEqual(len(buffer), 0)
+        self.assertEqual(EmailEvent.objects.filter(event_type='opened').count(), 1)
+        self.assertEqual(EmailEvent.objects.get(event_type='clicked').link_clicked, 'https://example.net/')
+
+        # A later open of the same message is already recorded
+        self.assertEqual(write_events([self._event()]), 0)
+        campaign = Campaign.objects.get(pk=self.campaign.pk)
+        self.assertEqual((campaign.open_count, campaign.click_count), (self.campaign.open_count + 1, self.campaign.click_count + 1))
+
+    def test_full_buffer_drops_oldest(self):
+        buffer = EventBuffer(capacity=2, autostart=False)
+        for i in range(3):
+            buffer.append(self._event(link_url=str(i)))
+        self.assertEqual([event.link_url for event in buffer.drain()], ['1', '2'])
+        self.assertEqual(buffer.dropped, 1)
+
+    def test_pixel_is_spooled_then_written(self):
+        with tempfile.TemporaryDirectory() as spool_dir:
+            path = os.path.join(spool_dir, 'events.spool')
+            with override_settings(EVENT_INGEST_MODE='spool', EVENT_SPOOL_PATH=path):
+                with self.assertNumQueries(0):
+                    response = Client().get(f'/analytics/message_split.gif?t={self.sent.id}&e=reader%40example.com')
+                self.assertEqual(response['Content-Type'], 'image/gif')
+                self.assertFalse(EmailEvent.objects.filter(event_type='opened').exists())
+
+                self.assertEqual(drain_spool(), 1)
+                self.assertEqual([name for name in os.listdir(spool_dir) if not name.endswith('.lock')], [])
+        self.assertTrue(EmailEvent.objects.filter(event_type='opened', subscriber_email='reader@example.com').exists())
+
+    def test_failed_drain_resumes_where_it_stopped(self):
+        with tempfile.TemporaryDirectory() as spool_dir:
+            path = os.path.join(spool_dir, 'events.spool')
+            with override_settings(EVENT_SPOOL_PATH=path, EVENT_FLUSH_BATCH=2):
+                for i in range(5):
+                    ingest._append_to_spool(self._event(CLICK, link_url=f'https://example.net/{i}'))
+                real_write_events = ingest.write_events
+                calls = []
+
+                def failing_write_events(events):
+                    calls.append(len(events))
+                    if len(calls) == 2:
+                        raise RuntimeError('database went away')
+                    return real_write_events(events)
+
+                with mock.patch.object(ingest, 'write_events', side_effect=failing_write_events):
+                    with self.assertRaises(RuntimeError):
+                        drain_spool()
+                self.assertEqual(drain_spool(), 3)
+        # Clicks aren't deduped, so a replayed batch would show up twice
+        self.assertEqual(
+            sorted(EmailEvent.objects.filter(event_type='clicked').values_list('link_clicked', flat=True)),
+            [f'https://example.net/{i}' for i in range(5)],
+        )
+
+    def test_one_drain_at_a_time(self):
+        with tempfile.TemporaryDirectory() as spool_dir:
+            path = os.path.join(spool_dir, 'events.spool')
+            with override_settings(EVENT_SPOOL_PATH=path):
+                ingest._append_to_spool(self._event())
+                with ingest._flock(f'{path}.drain.lock'):
+                    self.assertEqual(drain_spool(), 0)
+                self.assertEqual(drain_spool(), 1)
+
+
+class RecentOpensTest(TestCase):
+    def test_repeats_are_hits(self):
+        recent = RecentOpens(lru_size=10)
+        self.assertFalse(recent.seen('e1', 'reader@example.com'))
+        recent.add('e1', 'reader@example.com')
+        self.assertTrue(recent.seen('e1', 'Reader@Example.com'))
+        self.assertFalse(recent.seen('e2', 'reader@example.com'))
+
+        stats = recent.stats(reset=True)
+        self.assertEqual((stats['lookups'], stats['hits']), (3, 1))
+        self.assertAlmostEqual(stats['hit_rate'], 1 / 3)
+        self.assertEqual(recent.stats()['lookups'], 0)
+
+    def test_evicted_pairs_are_not_repeats(self):
+        recent = RecentOpens(lru_size=2)
+        recent.add('e1', 'a@example.com')
+        recent.add('e1', 'b@example.com')
+        self.assertTrue(recent.seen('e1', 'a@example.com'))
+        recent.add('e1', 'c@example.com')
+        # b was the least recently used; the writer decides about it again
+        self.assertFalse(recent.seen('e1', 'b@example.com'))
+        self.assertTrue(recent.seen('e1', 'a@example.com'))
+        self.assertEqual(recent.stats()['tracked_pairs'], 2)
+
+    @override_settings(EVENT_INGEST_MODE='sync')
+    def test_repeated_pixel_fetches_skip_the_database(self):
+        reset_recent_opens()
+        user = User.objects.create_user(username='dedupe', email='dedupe@example.com', password='pass')
+        campaign = Campaign.objects.create(user=user, name='Dedupe Campaign')
+        email = Email.objects.create(campaign=campaign, subject='Hi', body_html='<p>Hi</p>', body_text='Hi')
+        sent = EmailEvent.objects.create(email=email, subscriber_email='reader@example.com', event_type='sent')
+        url = f"/analytics/message_split.gif?t={mint_token(sent.id, email.id, campaign.id, 'reader@example.com')}&e=reader%40example.com"
+
+        client = Client()
+        client.get(url)
+        with self.assertNumQueries(0):
+            for _ in range(5):
+                client.get(url)
+        self.assertEqual(EmailEvent.objects.filter(event_type='opened').count(), 1)
+        self.assertEqual(get_recent_opens().stats()['hits'], 5)
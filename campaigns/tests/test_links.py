@@ -0,0 +1,92 @@
+import re
+from urllib.parse import quote
+
+from django.core import mail
+from django.test import TestCase, Client, override_settings
+from django.contrib.auth.models import User
+from campaigns.links import clear_link_cache
+from campaigns.models import Campaign, Email, EmailEvent, EmailLink
+from campaigns.rendering import clear_render_plans
+from campaigns.tasks import send_email_batch
+from campaigns.tokens import verify_token
+from subscribers.models import Subscriber
+
+
+@override_settings(EVENT_INGEST_MODE='sync')
+class LinkTrackingTest(TestCase):
+    def setUp(self):
+        clear_render_plans()
+        clear_link_cache()
+        self.client = Client()
+        self.user = User.objects.create_user(username='links', email='links@example.com', password='pass')
+        self.campaign = Campaign.objects.create(user=self.user, name='Links Campaign')
+        self.email = Email.objects.create(
+            campaign=self.campaign, subject='Links', body_text='',
+            body_html='<p><a href="https://shop.example.net/a">A</a> <a href="https://shop.example.net/b">B</a> '
+                      '<a href="https://shop.example.net/a">A again</a></p>',
+        )
+        self.subscriber = Subscriber.objects.create(email='reader@example.com', first_name='Ann')
+
+    def _send(self):
+        send_email_batch([(self.email, self.subscriber)])
+        html = mail.outbox[-1].alternatives[0][0]
+        return re.findall(r'href="https?://[^/"]+(/c/[^"]+)"', html)
+
+    def test_links_get_stable_short_ids(self):
+        paths = self._send()
+        event = EmailEvent.objects.get(event_type='sent')
+        token = paths[0].split('/')[2]
+        self.assertEqual(paths, [f'/c/{token}/1/', f'/c/{token}/2/', f'/c/{token}/1/'])
+        self.assertEqual(verify_token(token).tracking_id, str(event.id))
+        self.assertNotIn('reader@example.com', mail.outbox[0].alternatives[0][0].split('message_split.gif')[0])
+
+        # A later edit keeps existing ids and appends new links
+        self.email.body_html = '<a href="https://shop.example.net/c">C</a><a href="https://shop.example.net/b">B</a>'
+        self.email.save()
+        self._send()
+        self.assertEqual(
+            list(EmailLink.objects.filter(email=self.email).values_list('link_id', 'url')),
+            [(1, 'https://shop.example.net/a'), (2, 'https://shop.example.net/b'), (3, 'https://shop.example.net/c')],
+        )
+
+    def test_click_redirects_and_records(self):
+        path = self._send()[1]
+        response = self.client.get(path)
+
+        self.assertEqual(response.status_code, 302)
+        self.assertEqual(response['Location'], 'https://shop.example.net/b')
+        click = EmailEvent.objects.get(event_type='clicked')
+        self.assertEqual((click.subscriber_email, click.link_clicked), ('reader@example.com', 'https://shop.example.net/b'))
+        self.assertEqual(self.client.get(path.replace('/2/', '/9/')).status_code, 404)
+
+    def test_click_with_bare_tracking_id(self):
+        # Messages sent before signed tokens link to /c/<event id>/<link id>/
+        self._send()
+        event = EmailEvent.objects.get(event_type='sent')
+        response = self.client.get(f'/c/{event.id}/1/')
+
+        self.assertEqual(response['Location'], 'https://shop.example.net/a')
+        self.assertEqual(EmailEvent.objects.get(event_type='clicked').subscriber_email, 'reader@example.com')
+        self.assertEqual(self.client.get('/c/not-a-token/1/').status_code, 404)
+
+    def test_legacy_click_url_is_not_an_open_redirect(self):
+        self._send()
+        event = EmailEvent.objects.get(event_type='sent')
+        legacy = f'/analytics/track/click/{event.id}/?email=reader%40example.com&url='
+
+        self.assertEqual(self.client.get(legacy + quote('https://evil.example/')).status_code, 404)
+        response = self.client.get(legacy + quote('https://shop.example.net/a'))
+        self.assertEqual(response.status_code, 302)
+        self.assertEqual(response['Location'], 'https://shop.example.net/a')
+
+    def test_legacy_click_without_link_table_needs_an_exact_href(self):
+        # Messages sent before the link table existed are checked against the template's hrefs
+        self.email.body_html = '<a href="https://shop.example.net/a?x=1&amp;y=2">A</a>'
+        self.email.save()
+        event = EmailEvent.objects.create(email=self.email, subscriber_email='reader@example.com', event_type='sent')
+        legacy = f'/analytics/track/click/{event.id}/?email=reader%40example.com&url='
+
+        for url in ('https://shop.example.net/', 'https://shop.example.net/a', 'https://shop.example.net/a?x=1'):
+            self.assertEqual(self.client.get(legacy + quote(url)).status_code, 404)
+        response = self.client.get(legacy + quote('https://shop.example.net/a?x=1&y=2'))
+        self.assertEqual(response['Location'], 'https://shop.example.net/a?x=1&y=2')
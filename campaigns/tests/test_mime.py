@@ -0,0 +1,80 @@
+import re
+
+from django.contrib.auth.models import User
+from django.core.mail import EmailMultiAlternatives
+from django.test import SimpleTestCase, TestCase
+
+from analytics.models import UserProfile
+from campaigns.mime import CampaignEmail, MessageSkeleton, SerializedMessage
+from campaigns.models import Campaign, Email
+from campaigns.tasks import SendContext
+
+LONG_HTML = '<div>' + ''.join(f'<p>Line {i} café = "quoted" \t</p>' for i in range(80)) + '</div>'
+
+CASES = {
+    'ascii': ('Hello', 'Plain body\nsecond line\n', '<p>Hello</p>'),
+    'eight_bit': ('Grüße', 'Grüße aus Köln\r\n\r\n— Team', '<p>Grüße aus Köln</p>\n'),
+    'quoted_printable': ('Long', 'x' * 1200 + ' \n' + 'y=' * 600, LONG_HTML + '\n' + LONG_HTML + ' '),
+    'line_endings': ('Endings', 'a\rb\r\nc\nd', 'e\x0cf g\r\n' + 'é' * 700),
+    'no_text_body': ('Only HTML', '', '<p>Only HTML</p>'),
+    'long_subject': ('A very long subject line ' * 6, 'Body', '<p>Body</p>'),
+}
+
+
+def _message(subject, text, html, to='reader@example.net', **kwargs):
+    msg = CampaignEmail(subject, text, 'Zoë Example <zoe@brand.example>', [to], **kwargs)
+    msg.extra_headers['Sender'] = 'noreply@example.com'
+    msg.extra_headers['List-Unsubscribe'] = '<https://example.com/unsubscribe/' + 'f' * 64 + '/>'
+    msg.extra_headers['List-Unsubscribe-Post'] = 'List-Unsubscribe=One-Click'
+    msg.attach_alternative(html, 'text/html')
+    return msg
+
+
+def _django_bytes(msg, raw):
+    """What Django's own serializer produces for ``msg``, with the boundary ``raw`` used."""
+    boundary = re.search(rb'boundary="([^"]+)"', raw).group(1).decode('ascii')
+    mime = EmailMultiAlternatives.message(msg)
+    mime.set_boundary(boundary)
+    return mime.as_bytes(linesep='\r\n')
+
+
+class MessageSkeletonTest(SimpleTestCase):
+    def test_byte_identical_to_django(self):
+        skeleton = MessageSkeleton()
+        for name, (subject, text, html) in CASES.items():
+            # Several recipients through one skeleton, so cached pieces are exercised too
+            for to in ('a@example.net', 'Bé <b@example.org>'):
+                with self.subTest(name, to=to):
+                    msg = _message(subject, text, html, to=to, skeleton=skeleton, cc=['c@example.com'])
+                    serialized = msg.message()
+                    self.assertIsInstance(serialized, SerializedMessage)
+                    raw = serialized.as_bytes(linesep='\r\n')
+                    self.assertEqual(raw, _django_bytes(msg, raw))
+
+    def test_headers_pinned_across_serializations(self):
+        msg = _message('Hi', 'Body', '<p>Body</p>', skeleton=MessageSkeleton())
+        first = msg.message()
+
+        self.assertEqual(first['Message-ID'], msg.message()['Message-ID'])
+        self.assertIn(f"Message-ID: {first['Message-ID']}".encode(), first.as_bytes())
+
+    def test_unsupported_messages_use_django(self):
+        msg = _message('Hi', 'Body', '<p>Body</p>', skeleton=MessageSkeleton())
+        msg.attach('notes.txt', 'attached', 'text/plain')
+
+        self.assertNotIsInstance(msg.message(), SerializedMessage)
+
+
+class SendContextSkeletonTest(TestCase):
+    def test_campaign_messages_share_a_skeleton(self):
+        user = User.objects.create_user(username='mime', email='mime@brand.example', password='pass')
+        campaign = Campaign.objects.create(user=user, name='MIME')
+        email = Email.objects.create(campaign=campaign, subject='Hi', body_html='<p>Hi</p>', body_text='Hi')
+        context = SendContext(user, profile=UserProfile.objects.get(user=user))
+
+        first = context.build_message('Hi', 'Body', '<p>Body</p>', 'a@example.net', email=email)
+        second = context.build_message('Hi', 'Body', '<p>Body</p>', 'b@example.net', email=email)
+
+        self.assertIs(first.skeleton, second.skeleton)
+        raw = second.message().as_bytes(linesep='\r\n')
+        self.assertEqual(raw, _django_bytes(second, raw))
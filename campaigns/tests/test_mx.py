@@ -0,0 +1,161 @@
+import smtplib
+import socket
+import unittest
+from types import SimpleNamespace
+from unittest import mock
+
+import dns.exception
+import dns.name
+import dns.resolver
+from django.core import mail
+from django.core.mail import EmailMessage
+from django.test import SimpleTestCase
+
+from campaigns import async_smtp
+from campaigns.mx import MXDeliveryEngine, MXLookupError, MXResolver, recipient_domain
+from campaigns.retry import classify_send_error, PERMANENT
+
+try:
+    from aiosmtpd.controller import Controller
+except ImportError:
+    Controller = None
+
+
+class RecordingHandler:
+    def __init__(self):
+        self.messages = []
+
+    async def handle_DATA(self, server, session, envelope):
+        self.messages.append((envelope.mail_from, list(envelope.rcpt_tos)))
+        return '250 Message accepted'
+
+
+def _free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+class FakeAnswer(list):
+    def __init__(self, ttl, *records):
+        super().__init__(SimpleNamespace(preference=pref, exchange=dns.name.from_text(host)) for pref, host in records)
+        self.rrset = SimpleNamespace(ttl=ttl)
+
+
+class MXResolverTest(SimpleTestCase):
+    def test_hosts_in_preference_order_cached_for_ttl(self):
+        resolver = MXResolver(port=25, min_ttl=60, max_ttl=3600)
+        answer = FakeAnswer(300, (20, 'mx2.example.org.'), (10, 'mx1.example.org.'))
+        with mock.patch('dns.resolver.resolve', return_value=answer) as resolve:
+            self.assertEqual(resolver.resolve('example.org', now=0), [('mx1.example.org', 25), ('mx2.example.org', 25)])
+            resolver.resolve('example.org', now=299)
+            self.assertEqual(resolve.call_count, 1)
+            resolver.resolve('example.org', now=300)
+            self.assertEqual(resolve.call_count, 2)
+
+    def test_ttl_is_clamped(self):
+        resolver = MXResolver(min_ttl=60, max_ttl=600)
+        with mock.patch('dns.resolver.resolve', return_value=FakeAnswer(5, (10, 'mx.example.org.'))) as resolve:
+            resolver.resolve('example.org', now=0)
+            resolver.resolve('example.org', now=59)
+            self.assertEqual(resolve.call_count, 1)
+        with mock.patch('dns.resolver.resolve', return_value=FakeAnswer(86400, (10, 'mx.example.net.'))):
+            resolver.resolve('example.net', now=0)
+        self.assertIsNone(resolver.cached('example.net', now=600))
+
+    def test_missing_mx_and_undeliverable_domains(self):
+        resolver = MXResolver(port=2525)
+        with mock.patch('dns.resolver.resolve', side_effect=dns.resolver.NoAnswer):
+            self.assertEqual(resolver.resolve('plain.example'), [('plain.example', 2525)])
+        with mock.patch('dns.resolver.resolve', side_effect=dns.resolver.NXDOMAIN):
+            with self.assertRaises(MXLookupError) as ctx:
+                resolver.resolve('gone.example')
+        self.assertEqual(classify_send_error(ctx.exception), PERMANENT)
+        with mock.patch('dns.resolver.resolve', return_value=FakeAnswer(300, (0, '.'))):
+            with self.assertRaises(MXLookupError) as ctx:
+                resolver.resolve('nomail.example')
+        self.assertEqual(ctx.exception.smtp_code, 556)
+
+    def test_transient_failures_are_not_cached(self):
+        resolver = MXResolver()
+        with mock.patch('dns.resolver.resolve', side_effect=dns.exception.Timeout) as resolve:
+            for _ in range(2):
+                with self.assertRaises(MXLookupError) as ctx:
+                    resolver.resolve('slow.example')
+            self.assertEqual(resolve.call_count, 2)
+        self.assertEqual(ctx.exception.smtp_code, 451)
+
+    def test_routes_bypass_dns(self):
+        resolver = MXResolver(routes={'Example.org': '127.0.0.1:2525'})
+        with mock.patch('dns.resolver.resolve') as resolve:
+            self.assertEqual(resolver.resolve('example.org'), [('127.0.0.1', 2525)])
+        resolve.assert_not_called()
+        self.assertEqual(recipient_domain('Reader <Reader@Example.ORG>'), 'example.org')
+
+
+@unittest.skipUnless(async_smtp.aiosmtplib and Controller, 'aiosmtplib and aiosmtpd are required')
+class MXDirectBackendTest(SimpleTestCase):
+    def setUp(self):
+        self.servers = {}
+        for domain in ('example.org', 'example.net'):
+            handler, port = RecordingHandler(), _free_port()
+            controller = Controller(handler, hostname='127.0.0.1', port=port)
+            controller.start()
+            self.servers[domain] = (handler, port, controller)
+        routes = {domain: f'127.0.0.1:{port}' for domain, (_handler, port, _controller) in self.servers.items()}
+        self.override = self.settings(MX_DIRECT_ROUTES=routes, MX_DIRECT_POOL_SIZE=2)
+        self.override.enable()
+
+    def tearDown(self):
+        async_smtp.close_delivery_engines()
+        self.override.disable()
+        for _handler, _port, controller in self.servers.values():
+            controller.stop()
+
+    def test_messages_grouped_by_domain_over_warm_sessions(self):
+        backend = mail.get_connection('campaigns.backends.MXDirectBackend')
+        messages = [
+            EmailMessage('Hi', 'Body', 'sender@example.com', [f'reader{i}@{domain}'])
+            for i in range(10) for domain in ('example.org', 'example.net')
+        ]
+
+        self.assertEqual(backend.send_messages(messages), 20)
+        self.assertEqual(backend.send_messages(messages[:4]), 4)
+        for domain, (handler, port, _controller) in self.servers.items():
+            self.assertEqual(len(handler.messages), 12)
+            self.assertTrue(all(rcpt.endswith('@' + domain) for _sender, rcpts in handler.messages for rcpt in rcpts))
+            # At most the per-MX pool size, reused across calls
+            self.assertLessEqual(backend.engine.pools[('127.0.0.1', port)].opened, 2)
+
+    def test_recipients_split_across_domains(self):
+        backend = mail.get_connection('campaigns.backends.MXDirectBackend')
+        message = EmailMessage('Hi', 'Body', 'sender@example.com', ['a@example.org'], bcc=['b@example.net'])
+
+        self.assertEqual(backend.deliver_each([message]), [None])
+        self.assertEqual(self.servers['example.org'][0].messages, [('sender@example.com', ['a@example.org'])])
+        self.assertEqual(self.servers['example.net'][0].messages, [('sender@example.com', ['b@example.net'])])
+
+    def test_falls_back_to_next_mx(self):
+        handler, port, _controller = self.servers['example.org']
+        resolver = mock.Mock()
+        resolver.cached.return_value = [('127.0.0.1', _free_port()), ('127.0.0.1', port)]
+        engine = MXDeliveryEngine(resolver, timeout=5)
+        try:
+            errors = engine.deliver([('sender@example.com', ['a@example.org'], b'Subject: Hi\r\n\r\nBody\r\n')])
+        finally:
+            engine.close()
+
+        self.assertEqual(errors, [None])
+        self.assertEqual(handler.messages, [('sender@example.com', ['a@example.org'])])
+
+    def test_unresolvable_domain_fails_message(self):
+        resolver = mock.Mock()
+        resolver.cached.return_value = MXLookupError(550, b'Domain gone.example does not exist')
+        engine = MXDeliveryEngine(resolver)
+        try:
+            errors = engine.deliver([('sender@example.com', ['a@gone.example'], b'Subject: Hi\r\n\r\nBody\r\n')])
+        finally:
+            engine.close()
+
+        self.assertIsInstance(errors[0], smtplib.SMTPResponseException)
+        self.assertEqual(classify_send_error(errors[0]), PERMANENT)
@@ -0,0 +1,67 @@
+from django.core.cache import cache
+from django.db import connection
+from django.test import TestCase, Client
+from django.test.utils import CaptureQueriesContext
+from django.contrib.auth.models import User
+from django.utils import timezone
+from analytics.models import EmailFooter, UserProfile
+from campaigns.models import Campaign, Email, EmailSendRequest
+from subscribers.models import Subscriber
+
+
+class SendRequestPreviewCacheTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(username='poller', email='poller@example.com', password='pass')
+        self.client = Client()
+        self.client.force_login(self.user)
+        self.footer = EmailFooter.objects.create(user=self.user, name='Footer', html_content='<p>Old footer</p>')
+        self.campaign = Campaign.objects.create(user=self.user, name='Preview Campaign')
+        self.email = Email.objects.create(
+            campaign=self.campaign, subject='Hi {{first_name}}', body_html='<p>Hi {{first_name}}</p>',
+            body_text='', footer=self.footer,
+        )
+        for i in range(10):
+            subscriber = Subscriber.objects.create(email=f'reader{i}@example.com', first_name=f'R{i}')
+            EmailSendRequest.objects.create(
+                user=self.user, campaign=self.campaign, email=self.email, subscriber=subscriber,
+                subscriber_email=subscriber.email, variables={'first_name': f'R{i}'},
+                scheduled_for=timezone.now() + timezone.timedelta(days=1), status='pending',
+            )
+
+    def _poll(self):
+        response = self.client.get('/api/send-email/requests/')
+        self.assertEqual(response.status_code, 200, msg=response.content)
+        return response.json()['requests']
+
+    def test_repeat_polls_hit_the_cache(self):
+        first = self._poll()
+        with CaptureQueriesContext(connection) as queries:
+            second = self._poll()
+
+        self.assertEqual(first, second)
+        self.assertIn('Hi R', second[0]['email_preview_html'])
+        # Session, user, profile and the requests themselves
+        self.assertLessEqual(len(queries), 4)
+
+    def test_footer_and_profile_saves_invalidate(self):
+        self._poll()
+        self.footer.html_content = '<p>New footer</p>'
+        self.footer.save()
+        self.assertIn('New footer', self._poll()[0]['email_preview_html'])
+
+        profile = UserProfile.objects.get(user=self.user)
+        profile.has_verified_promo = True
+        profile.save()
+        self.assertNotIn('This email was sent using', self._poll()[0]['email_preview_html'])
+
+    def test_saves_in_other_processes_invalidate(self):
+        # Keys come from the rows' updated_at, not from anything in this process's cache
+        self._poll()
+        EmailFooter.objects.filter(pk=self.footer.pk).update(html_content='<p>Other footer</p>', updated_at=timezone.now())
+        self.assertIn('Other footer', self._poll()[0]['email_preview_html'])
+
+        profile = UserProfile.objects.get(user=self.user)
+        profile.has_verified_promo = True
+        profile.save(update_fields=['has_verified_promo'])
+        self.assertNotIn('This email was sent using', self._poll()[0]['email_preview_html'])
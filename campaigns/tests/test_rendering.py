@@ -0,0 +1,129 @@
+import re
+
+from django.core import mail
+from django.test import TestCase
+from django.contrib.auth.models import User
+from analytics.models import EmailFooter, UserProfile
+from campaigns.models import Campaign, Email, EmailLink
+from campaigns.rendering import get_render_plan, clear_render_plans, safe_variable_str
+from campaigns.tasks import (
+    _normalize_html_line_breaks,
+    _replace_hr_with_separator,
+    _wrap_links_with_tracking,
+    _add_tracking_pixel,
+    _send_test_email_sync,
+    send_email_batch,
+)
+from core.views import generate_email_preview
+from subscribers.models import Subscriber
+
+SITE_URL = 'https://dripemails.org'
+BODY = (
+    '<p>Hi {{ First_Name }},</p><p>Visit <a href="https://example.com/a?b=1&c={{first_name}}">our site</a> '
+    'or <a href="{{site_url}}/pricing/">pricing</a> or <a href="#top">top</a>.</p><hr/>'
+    '<p>Mail <a href="mailto:{{sender_email}}">us</a>. {{unknown}} {{last_name}}</p>'
+    '<p><a href="https://example.com/docs?x=1&amp;y=2">Docs</a> <a href="https://example.com/docs?x=1&amp;y=2">again</a></p>'
+)
+
+
+def legacy_html(body, variables, tracking_id, subscriber_email, loose, link_ids):
+    """The per-send chain the plan replaces."""
+    html_content = _normalize_html_line_breaks(body) if loose else body
+    for key, value in variables.items():
+        value = safe_variable_str(value)
+        if loose:
+            pattern = re.compile(r"\{\{\s*" + re.escape(key) + r"\s*\}\}", re.IGNORECASE)
+            html_content = pattern.sub(value, html_content)
+        else:
+            html_content = html_content.replace(f"{{{{{key}}}}}", value)
+    html_content = _replace_hr_with_separator(html_content, tracking_id, subscriber_email, base_url=SITE_URL)
+    html_content = _wrap_links_with_tracking(html_content, tracking_id, link_ids, base_url=SITE_URL)
+    return _add_tracking_pixel(html_content, tracking_id, subscriber_email, base_url=SITE_URL)
+
+
+class RenderPlanTest(TestCase):
+    def setUp(self):
+        clear_render_plans()
+        self.user = User.objects.create_user(username='plan', email='sender@example.com', password='pass')
+        self.campaign = Campaign.objects.create(user=self.user, name='Plan Campaign')
+        self.email = Email.objects.create(
+            campaign=self.campaign,
+            subject='Hello {{ first_name }}',
+            body_html=BODY,
+            body_text='',
+        )
+        self.variables = {'first_name': 'Ann & Co', 'last_name': float('nan')}
+        self.static = {'site_name': 'DripEmails', 'site_url': SITE_URL, 'sender_email': 'sender@example.com'}
+
+    def _plan(self, loose):
+        return get_render_plan(
+            self.email, site_url=SITE_URL, site_name='DripEmails', sender_email='sender@example.com',
+            loose=loose, normalize_breaks=loose,
+        )
+
+    def test_plan_matches_legacy_chain(self):
+        tracking_id = '6a1f4c2e-0000-4000-8000-000000000001'
+        recipient = 'reader+tag@example.com'
+        for loose in (True, False):
+            plan = self._plan(loose)
+            # Personalised links stay untracked; static ones go through the link table
+            link_ids = dict(EmailLink.objects.filter(email=self.email).values_list('url', 'link_id'))
+            self.assertEqual(link_ids, {'https://example.com/docs?x=1&y=2': 1})
+            all_vars = dict(self.variables, **self.static)
+            expected = legacy_html(BODY, all_vars, tracking_id, recipient, loose, link_ids)
+            self.assertEqual(plan.render_html(self.variables, tracking_id, recipient), expected)
+            self.assertIn(f'{SITE_URL}/c/{tracking_id}/1/', expected)
+            self.assertIn('href="https://example.com/a?b=1&c=Ann & Co"', expected)
+
+    def test_subject_and_missing_variables(self):
+        plan = self._plan(True)
+        self.assertEqual(plan.render_subject({'FIRST_NAME': 'Bo'}), 'Hello Bo')
+        self.assertIn('{{unknown}}', plan.render_html({}, 't', 'x@example.com'))
+
+    def test_plan_is_cached_until_email_changes(self):
+        plan = self._plan(True)
+        self.assertIs(self._plan(True), plan)
+        self.email.subject = 'Changed'
+        self.email.save()
+        self.assertIsNot(self._plan(True), plan)
+
+
+class RenderPipelineTest(TestCase):
+    def setUp(self):
+        clear_render_plans()
+        self.user = User.objects.create_user(username='pipe', email='pipe@example.com', password='pass')
+        UserProfile.objects.update_or_create(
+            user=self.user, defaults={'full_name': 'Pat Pipe', 'city': 'Springfield', 'auto_bcc_enabled': False},
+        )
+        footer = EmailFooter.objects.create(user=self.user, name='Footer', html_content='<p>Sent by {{ sender_email }}</p>')
+        self.campaign = Campaign.objects.create(user=self.user, name='Pipeline Campaign')
+        self.email = Email.objects.create(
+            campaign=self.campaign, subject='Hi {{first_name}}', footer=footer,
+            body_html='<p>Hello {{ First_Name }},</p><p>News for {{site_name}}.</p>', body_text='',
+        )
+        self.subscriber = Subscriber.objects.create(email='reader@example.com', first_name='Ann')
+
+    def test_preview_matches_sent_message(self):
+        send_email_batch([(self.email, self.subscriber)])
+        sent = mail.outbox[0]
+        preview = generate_email_preview(self.email, {'first_name': 'Ann'}, self.subscriber)
+
+        self.assertEqual(preview['subject'], sent.subject)
+        # The body has no links, so the only difference is the tracking images
+        sent_html = re.sub(r'<img src="[^"]*/analytics/message_split\.gif[^>]*>', '', sent.alternatives[0][0])
+        self.assertEqual(preview['html'], sent_html)
+        self.assertEqual(preview['text'], sent.body)
+        # Body, footer, unsubscribe block (with address), then the ad footer
+        html = preview['html']
+        self.assertLess(html.index('Hello Ann'), html.index('Sent by pipe@example.com'))
+        self.assertLess(html.index('Sent by pipe@example.com'), html.index(f'/unsubscribe/{self.subscriber.uuid}/'))
+        self.assertLess(html.index('Springfield'), html.index('This email was sent using'))
+
+    def test_test_send_uses_pipeline_without_tracking(self):
+        _send_test_email_sync(str(self.email.id), 'owner@example.com', {'first_name': 'Ann'})
+        html = mail.outbox[0].alternatives[0][0]
+
+        self.assertEqual(mail.outbox[0].subject, 'Hi Ann')
+        self.assertIn('Sent by pipe@example.com', html)
+        self.assertIn('/unsubscribe/"', html)
+        self.assertNotIn('message_split.gif', html)
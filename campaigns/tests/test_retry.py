@@ -0,0 +1,89 @@
+import smtplib
+from unittest import mock
+
+from django.core import mail
+from django.core.mail.backends.locmem import EmailBackend
+from django.db import DatabaseError
+from django.test import TestCase, override_settings
+from django.contrib.auth.models import User
+from django.utils import timezone
+from campaigns.models import Campaign, Email, EmailEvent, EmailSendRequest
+from campaigns.retry import classify_send_error, retry_delay, TRANSIENT, PERMANENT
+from campaigns.tasks import _send_single_email_sync, send_email_batch
+
+
+class RefusingBackend(EmailBackend):
+    """locmem backend that refuses every message with a fixed SMTP error."""
+
+    def __init__(self, error, **kwargs):
+        super().__init__(**kwargs)
+        self.error = error
+
+    def send_messages(self, messages):
+        raise self.error
+
+
+class ClassifySendErrorTest(TestCase):
+    def test_classification(self):
+        self.assertEqual(classify_send_error(smtplib.SMTPDataError(451, b'Try again later')), TRANSIENT)
+        self.assertEqual(classify_send_error(smtplib.SMTPDataError(554, b'Rejected')), PERMANENT)
+        self.assertEqual(classify_send_error(smtplib.SMTPServerDisconnected('gone')), TRANSIENT)
+        self.assertEqual(classify_send_error(ConnectionResetError()), TRANSIENT)
+        self.assertEqual(classify_send_error(ValueError('bad template')), PERMANENT)
+        refused = smtplib.SMTPRecipientsRefused({'a@example.com': (450, b'Mailbox busy')})
+        self.assertEqual(classify_send_error(refused), TRANSIENT)
+        refused = smtplib.SMTPRecipientsRefused({'a@example.com': (550, b'No such user')})
+        self.assertEqual(classify_send_error(refused), PERMANENT)
+
+    @override_settings(SEND_RETRY_BASE_SECONDS=60, SEND_RETRY_MAX_SECONDS=300)
+    def test_backoff_is_jittered_and_capped(self):
+        for attempts, high in ((1, 60), (2, 120), (3, 240), (8, 300)):
+            delay = retry_delay(attempts)
+            self.assertGreaterEqual(delay, high / 2)
+            self.assertLessEqual(delay, high)
+
+
+@override_settings(SEND_RETRY_MAX_ATTEMPTS=2)
+class RetrySendTest(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='retry', email='retry@example.com', password='pass')
+        self.campaign = Campaign.objects.create(user=self.user, name='Retry Campaign')
+        self.email = Email.objects.create(campaign=self.campaign, subject='Hi', body_html='<p>Hi</p>', body_text='Hi')
+        self.request = EmailSendRequest.objects.create(
+            user=self.user, campaign=self.campaign, email=self.email,
+            subscriber_email='reader@example.com', scheduled_for=timezone.now(), status='queued',
+        )
+
+    def test_transient_failure_is_requeued_then_failed(self):
+        connection = RefusingBackend(smtplib.SMTPDataError(421, b'Service not available'))
+        send_email_batch([self.request], connection=connection)
+
+        self.request.refresh_from_db()
+        self.assertEqual(self.request.status, 'pending')
+        self.assertEqual(self.request.attempts, 1)
+        self.assertEqual(self.request.scheduled_for, self.request.next_attempt_at)
+        self.assertGreater(self.request.next_attempt_at, timezone.now())
+        self.assertFalse(EmailEvent.objects.filter(event_type='sent').exists())
+        self.campaign.refresh_from_db()
+        self.assertEqual(self.campaign.sent_count, 0)
+
+        send_email_batch([self.request], connection=connection)
+        self.request.refresh_from_db()
+        self.assertEqual(self.request.status, 'failed')
+        self.assertEqual(self.request.attempts, 2)
+
+    def test_permanent_failure_is_not_retried(self):
+        send_email_batch([self.request], connection=RefusingBackend(smtplib.SMTPDataError(550, b'Rejected')))
+        self.request.refresh_from_db()
+        self.assertEqual(self.request.status, 'failed')
+        self.assertIsNone(self.request.next_attempt_at)
+
+    def test_recording_error_after_send_is_not_retried(self):
+        with mock.patch('campaigns.tasks._record_single_email_sent', side_effect=DatabaseError('connection lost')):
+            with self.assertLogs('campaigns.tasks', 'ERROR'):
+                _send_single_email_sync(self.email.id, 'reader@example.com', request_id=self.request.id)
+
+        self.assertEqual(len(mail.outbox), 1)
+        self.request.refresh_from_db()
+        self.assertEqual(self.request.attempts, 0)
+        self.assertIsNone(self.request.next_attempt_at)
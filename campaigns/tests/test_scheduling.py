@@ -0,0 +1,122 @@
+from datetime import datetime, time, timedelta
+
+import pytz
+from django.test import TestCase, override_settings
+from django.contrib.auth.models import User
+from analytics.models import UserProfile
+from campaigns.models import Campaign, Email
+from campaigns.scheduling import (
+    SendWindow, StepTable, add_months, apply_send_window, invalidate_step_table, next_step, step_table, wait_delay,
+)
+
+
+UTC = pytz.UTC
+
+
+@override_settings(SEND_WINDOW_SLOT_SECONDS=300)
+class SendWindowTest(TestCase):
+    def test_inside_window_is_unchanged(self):
+        window = SendWindow(time(9), time(17))
+        due = UTC.localize(datetime(2026, 3, 2, 12, 0))
+        self.assertEqual(window.place(due, 'a@example.com:1', now=due), due)
+
+    def test_outside_window_is_spread_over_next_window(self):
+        window = SendWindow(time(9), time(17))
+        due = UTC.localize(datetime(2026, 3, 2, 20, 0))
+        placed = {window.place(due, f'r{i}@example.com:1', now=due) for i in range(50)}
+
+        opens = UTC.localize(datetime(2026, 3, 3, 9, 0))
+        self.assertTrue(all(opens <= p < opens + timedelta(hours=8) for p in placed))
+        self.assertGreater(len(placed), 10)
+        # Slot choice is stable per key
+        self.assertEqual(window.place(due, 'r0@example.com:1', now=due), window.place(due, 'r0@example.com:1', now=due))
+
+    def test_window_spanning_midnight(self):
+        window = SendWindow(time(22), time(2))
+        due = UTC.localize(datetime(2026, 3, 2, 1, 0))
+        self.assertEqual(window.place(due, 'a@example.com:1', now=due), due)
+        later = UTC.localize(datetime(2026, 3, 2, 12, 0))
+        placed = window.place(later, 'a@example.com:1', now=later)
+        self.assertTrue(UTC.localize(datetime(2026, 3, 2, 22, 0)) <= placed < UTC.localize(datetime(2026, 3, 3, 2, 0)))
+
+    def test_subscriber_timezone(self):
+        window = SendWindow(time(9), time(17), 'UTC', per_subscriber=True)
+        due = UTC.localize(datetime(2026, 3, 2, 12, 0))
+        # 12:00 UTC is 04:00 in Los Angeles, so the send moves into that day's local window
+        placed = window.place(due, 'a@example.com:1', 'America/Los_Angeles', now=due)
+        local = placed.astimezone(pytz.timezone('America/Los_Angeles'))
+        self.assertEqual(local.date(), datetime(2026, 3, 2).date())
+        self.assertTrue(time(9) <= local.time() < time(17))
+
+    def test_spread_day_never_schedules_in_the_past(self):
+        window = SendWindow(time(9), time(17))
+        now = UTC.localize(datetime(2026, 3, 2, 16, 0))
+        due = UTC.localize(datetime(2026, 3, 2, 16, 30))
+        for i in range(20):
+            self.assertGreaterEqual(window.place(due, f'r{i}@example.com:1', spread_day=True, now=now), now)
+
+    def test_campaign_without_window(self):
+        user = User.objects.create_user(username='window', email='window@example.com', password='pass')
+        campaign = Campaign.objects.create(user=user, name='No Window')
+        due = UTC.localize(datetime(2026, 3, 2, 3, 0))
+        self.assertIsNone(SendWindow.for_campaign(campaign))
+        self.assertEqual(apply_send_window(campaign, due, 'a@example.com:1'), due)
+
+    def test_campaign_window_uses_profile_timezone(self):
+        user = User.objects.create_user(username='window2', email='window2@example.com', password='pass')
+        UserProfile.objects.update_or_create(user=user, defaults={'timezone': 'Europe/Berlin'})
+        campaign = Campaign.objects.create(user=user, name='Window', send_window_start=time(9), send_window_end=time(17))
+
+        window = SendWindow.for_campaign(campaign)
+        self.assertEqual(window.zone.zone, 'Europe/Berlin')
+
+
+class DelayTest(TestCase):
+    def test_months_are_calendar_months(self):
+        self.assertEqual(add_months(datetime(2026, 1, 31), 1), datetime(2026, 2, 28))
+        self.assertEqual(add_months(datetime(2024, 1, 31), 1), datetime(2024, 2, 29))
+        self.assertEqual(add_months(datetime(2026, 11, 15), 3), datetime(2027, 2, 15))
+        self.assertEqual(wait_delay(1, 'months').after(datetime(2026, 3, 31)), datetime(2026, 4, 30))
+
+    def test_units(self):
+        start = datetime(2026, 3, 2)
+        self.assertEqual(wait_delay(30, 'seconds').after(start), start + timedelta(seconds=30))
+        self.assertEqual(wait_delay(2, 'weeks').after(start), start + timedelta(days=14))
+        self.assertEqual(wait_delay(0, 'days').after(start), start)
+        self.assertEqual(wait_delay(None, 'days').after(start), start)
+        self.assertEqual(wait_delay(3, 'fortnights').after(start), start)
+
+    def test_step_table_schedule(self):
+        table = StepTable(1, [
+            ('a', 0, 'A', 1, 'days'),
+            ('b', 1, 'B', 1, 'months'),
+            ('c', 2, 'C', 2, 'hours'),
+        ])
+        self.assertEqual(table.next_after('a').email_id, 'b')
+        self.assertIsNone(table.next_after('c'))
+        dues = [(step.email_id, due) for step, due in table.schedule(datetime(2026, 1, 31), 'reader@example.com')]
+        self.assertEqual(dues, [
+            ('a', datetime(2026, 1, 31)),
+            ('b', datetime(2026, 2, 28)),
+            ('c', datetime(2026, 2, 28, 2)),
+        ])
+
+    def test_next_step_skips_emails_with_the_same_order(self):
+        table = StepTable(1, [('a', 0, 'A', 1, 'days'), ('b', 0, 'B', 1, 'days'), ('c', 1, 'C', 1, 'days')])
+        self.assertEqual(table.next_after('a').email_id, 'c')
+        self.assertEqual(table.next_after('b').email_id, 'c')
+
+    def test_step_table_is_cached_and_invalidated_on_save(self):
+        user = User.objects.create_user(username='steps', email='steps@example.com', password='pass')
+        campaign = Campaign.objects.create(user=user, name='Steps')
+        first = Email.objects.create(campaign=campaign, subject='1', body_html='1', body_text='1', order=0)
+        invalidate_step_table()
+
+        self.assertIsNone(next_step(campaign.pk, first.pk))
+        with self.assertNumQueries(0):
+            step_table(campaign.pk)
+
+        second = Email.objects.create(campaign=campaign, subject='2', body_html='2', body_text='2', order=1, wait_unit='weeks')
+        step = next_step(campaign.pk, first.pk)
+        self.assertEqual(step.email_id, second.pk)
+        self.assertEqual(step.delay, wait_delay(1, 'weeks'))
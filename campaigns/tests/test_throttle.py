@@ -0,0 +1,43 @@
+from datetime import timedelta
+
+from django.test import TestCase
+from django.contrib.auth.models import User
+from django.utils import timezone
+from campaigns.models import Campaign, Email, EmailSendRequest
+from campaigns.throttle import SendThrottle
+
+
+class SendThrottleTest(TestCase):
+    def test_domain_and_global_buckets(self):
+        throttle = SendThrottle(global_rate=10, domain_rate=2, domain_rates={'Gmail.com': 1})
+
+        self.assertEqual(throttle.acquire('a@gmail.com', now=0), 0)
+        self.assertEqual(throttle.acquire('b@gmail.com', now=0), 1)
+        # Further gmail deferrals queue behind the first one
+        self.assertEqual(throttle.acquire('c@gmail.com', now=0), 2)
+        self.assertEqual(throttle.acquire('a@example.com', now=0), 0)
+        self.assertEqual(throttle.acquire('b@example.com', now=0), 0)
+        self.assertEqual(throttle.acquire('a@gmail.com', now=1), 0)
+
+    def test_disabled_by_default(self):
+        self.assertFalse(SendThrottle().enabled)
+        self.assertEqual(SendThrottle().acquire('a@gmail.com'), 0)
+
+    def test_throttled_requests_are_rescheduled(self):
+        user = User.objects.create_user(username='throttle', email='throttle@example.com', password='pass')
+        campaign = Campaign.objects.create(user=user, name='Throttle Campaign')
+        email = Email.objects.create(campaign=campaign, subject='Hi', body_html='<p>Hi</p>', body_text='Hi')
+        requests = [
+            EmailSendRequest.objects.create(
+                user=user, campaign=campaign, email=email, subscriber_email=f'r{i}@gmail.com',
+                scheduled_for=timezone.now() - timedelta(minutes=1), status='queued',
+            )
+            for i in range(3)
+        ]
+
+        admitted, deferred = SendThrottle(domain_rates={'gmail.com': 1}).admit(requests)
+        self.assertEqual(admitted, requests[:1])
+        self.assertEqual(len(deferred), 2)
+        for row in EmailSendRequest.objects.filter(id__in=[r.id for r in deferred]):
+            self.assertEqual(row.status, 'pending')
+            self.assertGreater(row.scheduled_for, timezone.now())
@@ -0,0 +1,86 @@
+import base64
+import os
+import tempfile
+import uuid
+
+from django.test import TestCase, Client, override_settings
+from django.contrib.auth.models import User
+from campaigns.dedupe import reset_recent_opens
+from campaigns.links import clear_link_cache
+from campaigns.models import Campaign, Email, EmailEvent, EmailLink
+from campaigns.tokens import MIN_TOKEN_LENGTH, matches_subscriber, mint_token, verify_token
+
+
+class TrackingTokenTest(TestCase):
+    def setUp(self):
+        self.ids = (uuid.uuid4(), uuid.uuid4(), uuid.uuid4())
+
+    def test_round_trip(self):
+        token = mint_token(*self.ids, 'Reader@Example.com')
+        self.assertNotIn('Reader', base64.urlsafe_b64decode(token + '=' * (-len(token) % 4)).decode('latin-1'))
+        claims = verify_token(token)
+        self.assertEqual((claims.tracking_id, claims.email_id, claims.campaign_id), tuple(str(i) for i in self.ids))
+        self.assertEqual(claims.subscriber_email, 'Reader@Example.com')
+        self.assertTrue(matches_subscriber(claims, 'reader@example.com'))
+        self.assertFalse(matches_subscriber(claims, 'someone@example.com'))
+
+    def test_tampered_tokens_are_rejected(self):
+        token = mint_token(*self.ids, 'reader@example.com')
+        tampered = token[:10] + ('A' if token[10] != 'A' else 'B') + token[11:]
+        self.assertIsNone(verify_token(tampered))
+        self.assertIsNone(verify_token(token[:-1]))
+        self.assertIsNone(verify_token('!' * MIN_TOKEN_LENGTH))
+        self.assertIsNone(verify_token(str(self.ids[0])))
+
+        with override_settings(SECRET_KEY='another-secret-key-for-tracking-tokens'):
+            self.assertIsNone(verify_token(token))
+
+
+@override_settings(EVENT_INGEST_MODE='sync')
+class TokenTrackingEndpointTest(TestCase):
+    def setUp(self):
+        clear_link_cache()
+        reset_recent_opens()
+        self.client = Client()
+        self.user = User.objects.create_user(username='tokens', email='tokens@example.com', password='pass')
+        self.campaign = Campaign.objects.create(user=self.user, name='Token Campaign')
+        self.email = Email.objects.create(campaign=self.campaign, subject='Hi', body_html='<p>Hi</p>', body_text='Hi')
+        self.sent = EmailEvent.objects.create(email=self.email, subscriber_email='reader@example.com', event_type='sent')
+        EmailLink.objects.create(email=self.email, link_id=1, url='https://shop.example.net/a', url_hash='a')
+        self.token = mint_token(self.sent.id, self.email.id, self.campaign.id, 'reader@example.com')
+
+    def _open(self, token, address='reader%40example.com'):
+        return self.client.get(f'/analytics/message_split.gif?t={token}&e={address}')
+
+    def test_open_skips_sent_lookup(self):
+        # Existence check for the Email, the first-open check, the insert and the counter update
+        with self.assertNumQueries(4):
+            self._open(self.token)
+        self.assertTrue(EmailEvent.objects.filter(event_type='opened', subscriber_email='reader@example.com').exists())
+
+    def test_forged_or_mismatched_opens_are_ignored(self):
+        with self.assertNumQueries(0):
+            self._open(self.token, 'someone%40example.com')
+        with override_settings(SECRET_KEY='another-secret-key-for-tracking-tokens'):
+            forged = mint_token(self.sent.id, self.email.id, self.campaign.id, 'reader@example.com')
+        with self.assertNumQueries(0):
+            self._open(forged)
+        self.assertFalse(EmailEvent.objects.filter(event_type='opened').exists())
+
+    def test_click_redirect_is_cached(self):
+        path = f'/c/{self.token}/1/'
+        self.assertEqual(self.client.get(path)['Location'], 'https://shop.example.net/a')
+        self.assertEqual(EmailEvent.objects.get(event_type='clicked').subscriber_email, 'reader@example.com')
+
+        with tempfile.TemporaryDirectory() as spool_dir:
+            with override_settings(EVENT_INGEST_MODE='spool', EVENT_SPOOL_PATH=os.path.join(spool_dir, 'events.spool')):
+                with self.assertNumQueries(0):
+                    response = self.client.get(path)
+        self.assertEqual(response['Location'], 'https://shop.example.net/a')
+        self.assertEqual(self.client.get(f'/c/{self.token}/2/').status_code, 404)
+
+    def test_signed_click_needs_no_sent_event(self):
+        self.sent.delete()
+        self.assertEqual(self.client.get(f'/c/{self.token}/1/')['Location'], 'https://shop.example.net/a')
+        click = EmailEvent.objects.get(event_type='clicked')
+        self.assertEqual((click.email_id, click.subscriber_email), (self.email.id, 'reader@example.com'))
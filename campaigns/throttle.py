@@ -0,0 +1,178 @@
+"""
+Outbound rate limiting for scheduled sends.
+
+Big providers (gmail.com, outlook.com, ...) defer mail that arrives in
+bursts, so claimed EmailSendRequest rows pass through token buckets keyed by
+recipient domain, plus one global bucket, before they are delivered. Rows
+over the limit are not failed: their scheduled_for is pushed forward to when
+a token will be available and they go back to 'pending'.
+
+Buckets live in the sending process. With several sender hosts the
+configured rates apply per host.
+"""
+
+import logging
+import threading
+import time
+from collections import Counter
+from datetime import timedelta
+
+from django.conf import settings
+from django.utils import timezone as tz
+
+logger = logging.getLogger(__name__)
+
+
+class TokenBucket:
+    """Classic token bucket: ``rate`` tokens per second, holding at most ``burst``."""
+
+    def __init__(self, rate, burst):
+        self.rate = float(rate)
+        self.burst = max(float(burst), 1.0)
+        self.tokens = self.burst
+        self.updated = None
+        # Where the next deferred message should be slotted, so a throttled
+        # backlog is spread out at ``rate`` instead of all retrying at once
+        self.deferred_until = 0.0
+
+    def refill(self, now):
+        if self.updated is not None and now > self.updated:
+            self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now if self.updated is None else max(self.updated, now)
+
+    def wait_time(self, now):
+        """Seconds until a token is free (0 if one is available now)."""
+        if self.tokens >= 1:
+            return 0.0
+        return (1 - self.tokens) / self.rate
+
+    def defer(self, now):
+        """Reserve a later slot for a throttled message; returns its delay in seconds."""
+        slot = max(self.deferred_until, now + self.wait_time(now))
+        self.deferred_until = slot + 1 / self.rate
+        return slot - now
+
+
+def _recipient_domain(email_address):
+    return (email_address or '').rsplit('@', 1)[-1].strip().lower()
+
+
+class SendThrottle:
+    """
+    Per-recipient-domain and global token buckets.
+
+    Rates are messages per second; 0 disables that limit. Each bucket may
+    burst up to ``burst_seconds`` worth of its rate.
+    """
+
+    def __init__(self, global_rate=0, domain_rate=0, domain_rates=None, burst_seconds=1):
+        self.global_rate = float(global_rate or 0)
+        self.domain_rate = float(domain_rate or 0)
+        self.domain_rates = {k.lower(): float(v) for k, v in (domain_rates or {}).items()}
+        self.burst_seconds = float(burst_seconds or 1)
+        self._global = self._bucket(self.global_rate)
+        self._domains = {}
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_settings(cls):
+        return cls(
+            global_rate=getattr(settings, 'SEND_RATE_GLOBAL', 0),
+            domain_rate=getattr(settings, 'SEND_RATE_PER_DOMAIN', 0),
+            domain_rates=getattr(settings, 'SEND_RATE_DOMAINS', {}),
+            burst_seconds=getattr(settings, 'SEND_RATE_BURST_SECONDS', 1),
+        )
+
+    @property
+    def enabled(self):
+        return bool(self.global_rate or self.domain_rate or any(self.domain_rates.values()))
+
+    def describe(self):
+        overrides = ', '.join(f"{domain}={rate:g}/s" for domain, rate in sorted(self.domain_rates.items()))
+        return (
+            f"global={self.global_rate:g}/s, per-domain={self.domain_rate:g}/s"
+            f"{', ' + overrides if overrides else ''} (burst {self.burst_seconds:g}s; 0 = unlimited)"
+        )
+
+    def _bucket(self, rate):
+        if not rate:
+            return None
+        return TokenBucket(rate, rate * self.burst_seconds)
+
+    def _domain_bucket(self, domain):
+        if domain not in self._domains:
+            self._domains[domain] = self._bucket(self.domain_rates.get(domain, self.domain_rate))
+        return self._domains[domain]
+
+    def acquire(self, email_address, now=None):
+        """
+        Take a token for one message to ``email_address``.
+
+        Returns 0 if the message may go now, otherwise the number of seconds it
+        should be pushed back by.
+        """
+        now = time.monotonic() if now is None else now
+        with self._lock:
+            buckets = [b for b in (self._domain_bucket(_recipient_domain(email_address)), self._global) if b]
+            for bucket in buckets:
+                bucket.refill(now)
+            limiting = [b for b in buckets if b.wait_time(now) > 0]
+            if not limiting:
+                for bucket in buckets:
+                    bucket.tokens -= 1
+                return 0.0
+            return max(bucket.defer(now) for bucket in limiting)
+
+    def admit(self, send_requests):
+        """
+        Split claimed send requests into those that may go now and those that
+        were rescheduled. Rescheduled rows are saved back as 'pending'.
+        """
+        if not self.enabled:
+            return list(send_requests), []
+
+        admitted = []
+        deferred = []
+        by_domain = Counter()
+        now = tz.now()
+        for send_request in send_requests:
+            delay = self.acquire(send_request.subscriber_email)
+            if not delay:
+                admitted.append(send_request)
+                continue
+            send_request.status = 'pending'
+            send_request.scheduled_for = now + timedelta(seconds=delay)
+            send_request.save(update_fields=['status', 'scheduled_for', 'updated_at'])
+            deferred.append(send_request)
+            by_domain[_recipient_domain(send_request.subscriber_email)] += 1
+
+        if deferred:
+            top = ', '.join(f"{domain}: {count}" for domain, count in by_domain.most_common(5))
+            latest = max(r.scheduled_for for r in deferred)
+            logger.info(
+                f"Throttled {len(deferred)} of {len(admitted) + len(deferred)} sends ({top}); "
+                f"rescheduled up to {(latest - now).total_seconds():.0f}s ahead"
+            )
+        return admitted, deferred
+
+
+_send_throttle = None
+_send_throttle_lock = threading.Lock()
+
+
+def get_send_throttle():
+    """Process-wide SendThrottle built from settings (logs the active rates once)."""
+    global _send_throttle
+    with _send_throttle_lock:
+        if _send_throttle is None:
+            _send_throttle = SendThrottle.from_settings()
+            if _send_throttle.enabled:
+                logger.info(f"Send throttling enabled: {_send_throttle.describe()}")
+        return _send_throttle
+
+
+def reset_send_throttle():
+    """Forget the process-wide throttle (rebuilt from settings on next use)."""
+    global _send_throttle
+    with _send_throttle_lock:
+        _send_throttle = None
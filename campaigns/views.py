@@ -9,6 +9,7 @@ from rest_framework.permissions import IsAuthenticated
 from rest_framework.authentication import SessionAuthentication, TokenAuthentication
 from core.authentication import BearerTokenAuthentication
 from rest_framework.response import Response
+from .counters import load_counts
 from .models import Campaign, Email, EmailEvent, EmailAIAnalysis
 from django.urls import reverse
 from django.template import TemplateDoesNotExist
@@ -21,6 +22,7 @@ import io
 import logging
 from openpyxl import load_workbook
 from .ai_utils import generate_email_content
+from .scheduling import SendWindow, apply_send_window, due_after, spreads_over_day, wait_delay
 
 logger = logging.getLogger(__name__)
 
@@ -66,7 +68,8 @@ def _build_upload_column_map(columns):
 def campaign_list_create(request):
     """List all campaigns or create a new one."""
     if request.method == 'GET':
-        campaigns = Campaign.objects.filter(user=request.user)
+        campaigns = list(Campaign.objects.filter(user=request.user))
+        load_counts(campaigns)
         serializer = CampaignSerializer(campaigns, many=True)
         return Response(serializer.data)
     
@@ -104,7 +107,6 @@ def campaign_detail(request, campaign_id):
 def email_list_create(request, campaign_id):
     """List all emails in a campaign or create a new one."""
     from django.utils import timezone
-    from datetime import timedelta
     from campaigns.models import EmailSendRequest
     from subscribers.models import Subscriber
     import logging
@@ -141,27 +143,9 @@ def email_list_create(request, campaign_id):
                 ).distinct()
                 
                 if active_subscribers.exists():
-                    # Calculate scheduled_for time based on email's wait_time and wait_unit
-                    # Use 0 as default if wait_time is None, but allow 0 to mean immediate sending
-                    wait_time = email.wait_time if email.wait_time is not None else 0
-                    wait_unit = email.wait_unit or 'days'
-                    
-                    send_delay = timedelta(0)
-                    if wait_time > 0:
-                        if wait_unit == 'seconds':
-                            send_delay = timedelta(seconds=wait_time)
-                        elif wait_unit == 'minutes':
-                            send_delay = timedelta(minutes=wait_time)
-                        elif wait_unit == 'hours':
-                            send_delay = timedelta(hours=wait_time)
-                        elif wait_unit == 'days':
-                            send_delay = timedelta(days=wait_time)
-                        elif wait_unit == 'weeks':
-                            send_delay = timedelta(weeks=wait_time)
-                        elif wait_unit == 'months':
-                            send_delay = timedelta(days=wait_time * 30)
-                    
-                    scheduled_for = timezone.now() + send_delay
+                    # Scheduled for the email's wait_time/wait_unit from now (0 means immediate sending)
+                    scheduled_for = due_after(email)
+                    window = SendWindow.for_campaign(campaign)
                     
                     # Create EmailSendRequest for each active subscriber
                     send_requests = []
@@ -171,6 +155,10 @@ def email_list_create(request, campaign_id):
                             'last_name': subscriber.last_name or '',
                             'email': subscriber.email
                         }
+                        subscriber_scheduled_for = apply_send_window(
+                            campaign, scheduled_for, f"{subscriber.email}:{email.pk}",
+                            subscriber.timezone, spread_day=spreads_over_day(email), window=window,
+                        ) if window else scheduled_for
                         
                         send_request = EmailSendRequest.objects.create(
                             user=request.user,
@@ -179,7 +167,7 @@ def email_list_create(request, campaign_id):
                             subscriber=subscriber,
                             subscriber_email=subscriber.email,
                             variables=variables,
-                            scheduled_for=scheduled_for,
+                            scheduled_for=subscriber_scheduled_for,
                             status='pending'
                         )
                         send_requests.append(send_request)
@@ -205,7 +193,6 @@ def email_detail(request, campaign_id, email_id):
         from .models import EmailSendRequest
         from subscribers.models import Subscriber
         from django.utils import timezone
-        from datetime import timedelta
         import logging
         
         logger = logging.getLogger(__name__)
@@ -241,27 +228,9 @@ def email_detail(request, campaign_id, email_id):
                     subscribers_to_schedule = active_subscribers.exclude(id__in=existing_requests)
                     
                     if subscribers_to_schedule.exists():
-                        # Calculate scheduled_for time based on email's wait_time and wait_unit
-                        # Use 0 as default if wait_time is None, but allow 0 to mean immediate sending
-                        wait_time = email.wait_time if email.wait_time is not None else 0
-                        wait_unit = email.wait_unit or 'days'
-                        
-                        send_delay = timedelta(0)
-                        if wait_time > 0:
-                            if wait_unit == 'seconds':
-                                send_delay = timedelta(seconds=wait_time)
-                            elif wait_unit == 'minutes':
-                                send_delay = timedelta(minutes=wait_time)
-                            elif wait_unit == 'hours':
-                                send_delay = timedelta(hours=wait_time)
-                            elif wait_unit == 'days':
-                                send_delay = timedelta(days=wait_time)
-                            elif wait_unit == 'weeks':
-                                send_delay = timedelta(weeks=wait_time)
-                            elif wait_unit == 'months':
-                                send_delay = timedelta(days=wait_time * 30)
-                        
-                        scheduled_for = timezone.now() + send_delay
+                        # Scheduled for the email's wait_time/wait_unit from now (0 means immediate sending)
+                        scheduled_for = due_after(email)
+                        window = SendWindow.for_campaign(campaign)
                         
                         # Create EmailSendRequest for each subscriber who hasn't received this email
                         send_requests = []
@@ -271,6 +240,10 @@ def email_detail(request, campaign_id, email_id):
                                 'last_name': subscriber.last_name or '',
                                 'email': subscriber.email
                             }
+                            subscriber_scheduled_for = apply_send_window(
+                                campaign, scheduled_for, f"{subscriber.email}:{email.pk}",
+                                subscriber.timezone, spread_day=spreads_over_day(email), window=window,
+                            ) if window else scheduled_for
                             
                             send_request = EmailSendRequest.objects.create(
                                 user=request.user,
@@ -279,7 +252,7 @@ def email_detail(request, campaign_id, email_id):
                                 subscriber=subscriber,
                                 subscriber_email=subscriber.email,
                                 variables=variables,
-                                scheduled_for=scheduled_for,
+                                scheduled_for=subscriber_scheduled_for,
                                 status='pending'
                             )
                             send_requests.append(send_request)
@@ -392,7 +365,6 @@ def send_email(request, campaign_id, email_id):
     # Create EmailSendRequest record with scheduled time based on email's wait_time
     from campaigns.models import EmailSendRequest
     from django.utils import timezone
-    from datetime import timedelta
     from .tasks import _send_single_email_sync
     
     # Calculate scheduled_for time based on email's wait_time and wait_unit
@@ -400,22 +372,12 @@ def send_email(request, campaign_id, email_id):
     if send_immediately:
         scheduled_for = timezone.now()
     else:
-        wait_time = email.wait_time or 1
-        wait_unit = email.wait_unit or 'days'
-        
-        send_delay = timedelta(0)
-        if wait_unit == 'minutes':
-            send_delay = timedelta(minutes=wait_time)
-        elif wait_unit == 'hours':
-            send_delay = timedelta(hours=wait_time)
-        elif wait_unit == 'days':
-            send_delay = timedelta(days=wait_time)
-        elif wait_unit == 'weeks':
-            send_delay = timedelta(weeks=wait_time)
-        elif wait_unit == 'months':
-            send_delay = timedelta(days=wait_time * 30)
+        send_delay = wait_delay(email.wait_time or 1, email.wait_unit)
         
-        scheduled_for = timezone.now() + send_delay
+        scheduled_for = apply_send_window(
+            campaign, send_delay.after(timezone.now()), f"{subscriber_email}:{email.pk}",
+            getattr(subscriber, 'timezone', ''), spread_day=spreads_over_day(email),
+        )
     
     send_request = EmailSendRequest.objects.create(
         user=request.user,
@@ -442,6 +404,14 @@ def send_email(request, campaign_id, email_id):
                 'status': send_request.status
             })
         except Exception as sync_error:
+            send_request.refresh_from_db()
+            if send_request.status == 'pending' and send_request.next_attempt_at:
+                # Transient failure; the scheduler will retry it
+                return Response({
+                    'message': _('Temporary delivery failure, will retry at {}').format(send_request.next_attempt_at.isoformat()),
+                    'request_id': str(send_request.id),
+                    'status': send_request.status
+                }, status=202)
             send_request.status = 'failed'
             send_request.error_message = str(sync_error)
             send_request.save(update_fields=['status', 'error_message', 'updated_at'])
@@ -941,10 +911,9 @@ def campaign_stats_api(request, campaign_id):
         event_type='complained'
     ).count()
     
-    # Get opens and clicks from campaign model (these are incremented via signals)
-    campaign.refresh_from_db()
-    open_count = campaign.open_count
-    click_count = campaign.click_count
+    # Get opens and clicks from campaign counters (these are incremented via signals)
+    open_count = campaign.counts['open_count']
+    click_count = campaign.counts['click_count']
     
     # Calculate rates
     delivered_count = sent_count - bounce_count
@@ -1244,6 +1213,12 @@ def send_pending_email(request, request_id):
     
     except Exception as e:
         logger.error(f"Error sending pending email {request_id}: {str(e)}")
+        send_request.refresh_from_db()
+        if send_request.status == 'pending' and send_request.next_attempt_at:
+            # Transient failure; the scheduler will retry it
+            return Response({
+                'error': f'Temporary delivery failure, will retry at {send_request.next_attempt_at.isoformat()}'
+            }, status=503)
         send_request.status = 'failed'
         send_request.error_message = str(e)
         send_request.save(update_fields=['status', 'error_message', 'updated_at'])
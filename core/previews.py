@@ -0,0 +1,84 @@
+"""
+Cached previews for the send requests list.
+
+The dashboard polls send_email_requests_list, which shows a rendered preview
+of each of the latest send requests. Rendering needs the sender's profile,
+the site and the ad footer, so previews are kept in the Django cache, keyed
+by the request variables, the recipient and the updated_at of everything the
+preview renders: the Email, its footer and the sender's UserProfile. Those
+versions come from the database rows the view loads anyway, so a save in any
+process changes the key everywhere, even with a per-process cache backend.
+"""
+
+import hashlib
+import json
+import re
+
+from django.conf import settings
+from django.core.cache import cache
+
+_TAG_RE = re.compile(r'<[^>]+>')
+
+
+def _timestamp(value):
+    return str(value.timestamp()) if value else ''
+
+
+def _variables_hash(variables):
+    payload = json.dumps(variables or {}, sort_keys=True, default=str)
+    return hashlib.sha1(payload.encode('utf-8')).hexdigest()
+
+
+def preview_cache_key(email, variables, subscriber, profile):
+    footer = email.footer
+    return ':'.join((
+        'email_preview',
+        str(email.pk),
+        _timestamp(email.updated_at),
+        str(footer.pk) if footer else '',
+        _timestamp(footer.updated_at) if footer else '',
+        _timestamp(profile.updated_at) if profile else '',
+        _variables_hash(variables),
+        str(subscriber.uuid if subscriber else ''),
+    ))
+
+
+def get_email_previews(send_requests, user, profile=None):
+    """
+    Previews for many EmailSendRequests of ``user``, keyed by request id.
+
+    Cached previews come back with one cache round-trip; the rest are rendered
+    with one shared SendContext (a single profile/site lookup) and stored.
+    Each preview is a dict with 'html', 'text', 'subject' and 'snippet'.
+    """
+    from analytics.models import UserProfile
+    from campaigns.tasks import SendContext
+    from .views import generate_email_preview
+
+    if profile is None:
+        profile, _created = UserProfile.objects.get_or_create(user=user)
+    keys = {
+        req.id: preview_cache_key(req.email, req.variables, req.subscriber, profile)
+        for req in send_requests
+    }
+    cached = cache.get_many(list(set(keys.values())))
+
+    previews = {}
+    missing = {}
+    context = None
+    for req in send_requests:
+        key = keys[req.id]
+        preview = cached.get(key) or missing.get(key)
+        if preview is None:
+            if context is None:
+                context = SendContext(user, profile=profile)
+            preview = generate_email_preview(req.email, req.variables, req.subscriber, context=context)
+            # Snippet: first 200 chars with the HTML stripped
+            preview_text = _TAG_RE.sub('', preview['html'])
+            preview['snippet'] = preview_text[:200] + ('...' if len(preview_text) > 200 else '')
+            missing[key] = preview
+        previews[req.id] = preview
+
+    if missing:
+        cache.set_many(missing, timeout=getattr(settings, 'EMAIL_PREVIEW_CACHE_SECONDS', 3600))
+    return previews
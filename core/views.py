@@ -8,10 +8,10 @@ from django.http import JsonResponse
 from django.utils.translation import gettext as _
 from django.utils import timezone
 from django.db import transaction
-from django.template.loader import render_to_string
 from rest_framework.decorators import api_view, permission_classes
 from rest_framework.permissions import IsAuthenticated
 from rest_framework.response import Response
+from campaigns.counters import load_counts
 from campaigns.models import Campaign, Email, EmailSendRequest
 from subscribers.models import List, Subscriber
 from analytics.models import UserProfile
@@ -21,6 +21,7 @@ import pytz
 import logging
 import uuid
 from .models import BlogPost, ForumPost, SuccessStory
+from .previews import get_email_previews
 from .forms import ForumPostForm, SuccessStoryForm
 
 logger = logging.getLogger(__name__)
@@ -32,13 +33,14 @@ def dashboard_api(request):
     """API endpoint for dashboard data."""
     # Get user's campaigns
     campaigns = Campaign.objects.filter(user=request.user).order_by('-created_at')
+    load_counts(campaigns)
     campaign_data = [{
         'id': str(campaign.id),
         'name': campaign.name,
         'description': campaign.description,
         'is_active': campaign.is_active,
         'emails_count': campaign.emails_count,
-        'sent_count': campaign.sent_count,
+        'sent_count': campaign.counts['sent_count'],
         'created_at': campaign.created_at
     } for campaign in campaigns]
 
@@ -66,7 +68,7 @@ def dashboard_api(request):
             'campaigns_count': len(campaign_data),
             'lists_count': len(list_data),
             'subscribers_count': subscribers_count,
-            'sent_emails_count': sum(campaign.sent_count for campaign in campaigns),
+            'sent_emails_count': sum(campaign.counts['sent_count'] for campaign in campaigns),
         },
         'profile': {
             'has_verified_promo': profile.has_verified_promo,
@@ -93,7 +95,8 @@ def dashboard(request):
     lists_count = lists.count()
     # Count unique subscribers across all user's lists (avoid double counting)
     subscribers_count = Subscriber.objects.filter(lists__user=request.user).distinct().count()
-    sent_emails_count = sum(campaign.sent_count for campaign in campaigns)
+    load_counts(campaigns)
+    sent_emails_count = sum(campaign.counts['sent_count'] for campaign in campaigns)
 
     profile, _created = UserProfile.objects.get_or_create(user=request.user)
     user_timezone = profile.timezone or 'UTC'
@@ -789,30 +792,21 @@ def send_email_api(request):
             }, status=500)
         
         # Parse the schedule
-        from datetime import timedelta
         from campaigns.tasks import send_single_email, _send_single_email_sync
+        from campaigns.scheduling import DAY_UNITS, NO_DELAY, apply_send_window, wait_delay
         
-        send_delay = timedelta(0)
         if schedule == 'now':
-            send_delay = timedelta(0)
+            send_delay = NO_DELAY
         else:
-            value = int(schedule_value) if schedule_value else 0
-            if schedule == 'minutes':
-                send_delay = timedelta(minutes=value)
-            elif schedule == 'hours':
-                send_delay = timedelta(hours=value)
-            elif schedule == 'days':
-                send_delay = timedelta(days=value)
-            elif schedule == 'weeks':
-                send_delay = timedelta(weeks=value)
-            elif schedule == 'months':
-                send_delay = timedelta(days=value * 30)
-            elif schedule == 'seconds':
-                send_delay = timedelta(seconds=value)
-            else:
-                send_delay = timedelta(0)
+            send_delay = wait_delay(int(schedule_value) if schedule_value else 0, schedule)
         
-        scheduled_for = timezone.now() + send_delay
+        now = timezone.now()
+        scheduled_for = send_delay.after(now)
+        if schedule != 'now':
+            scheduled_for = apply_send_window(
+                campaign, scheduled_for, f"{email}:{email_obj.pk}", subscriber.timezone,
+                spread_day=schedule in DAY_UNITS and bool(send_delay),
+            )
         
         # Prepare sending helpers
         import logging
@@ -890,7 +884,7 @@ def send_email_api(request):
                     }, status=500)
 
         # Scheduled for future
-        countdown_seconds = max(int(send_delay.total_seconds()), 0)
+        countdown_seconds = max(int((scheduled_for - now).total_seconds()), 0)
         scheduled_for_local = scheduled_for
         if timezone.is_naive(scheduled_for_local):
             scheduled_for_local = timezone.make_aware(scheduled_for_local, timezone.get_current_timezone())
@@ -941,104 +935,34 @@ def send_email_api(request):
             'traceback': error_trace if settings.DEBUG else None
         }, status=400)
 
-def generate_email_preview(email_obj, variables=None, subscriber=None, request_obj=None):
+def generate_email_preview(email_obj, variables=None, subscriber=None, request_obj=None, context=None):
     """
     Generate the full email preview including footer and advertisement.
     Returns both HTML and text versions.
+
+    Rendered by the same pipeline as real sends (campaigns.rendering.render_email),
+    minus click/open tracking, so the preview shows what the recipient gets.
+    ``context`` is an optional SendContext shared by callers previewing many.
     """
-    from campaigns.tasks import _get_site_info, _html_to_plain_text
-
-    # Get site information (use request if it has get_host, e.g. HttpRequest; else MockRequest)
-    request_for_site = request_obj if (request_obj is not None and hasattr(request_obj, 'get_host')) else None
-    site_url, site_name, site_logo = _get_site_info(request=request_for_site)
-
-    # Build vars with site_name/site_url/sender_email so {{site_name}}, {{site_url}} work in emails
-    user = request_obj.user if request_obj else email_obj.campaign.user
-    user_profile, _ = UserProfile.objects.get_or_create(user=user)
-    user_email = user.email if user else ''
-    vars_for_replace = dict(variables) if variables else {}
-    vars_for_replace['site_name'] = site_name
-    vars_for_replace['site_url'] = site_url
-    vars_for_replace['sender_email'] = user_email
-
-    # Replace variables in content
-    html_content = email_obj.body_html or ''
-    text_content = email_obj.body_text or ''
-    subject = email_obj.subject or ''
-    for key, value in vars_for_replace.items():
-        placeholder = f"{{{{{key}}}}}"
-        html_content = html_content.replace(placeholder, str(value))
-        text_content = text_content.replace(placeholder, str(value))
-        subject = subject.replace(placeholder, str(value))
-
-    show_ads = not user_profile.has_verified_promo
-    show_unsubscribe = not user_profile.send_without_unsubscribe
-
-    # Add email footer if one is assigned
-    if email_obj.footer:
-        footer_html = email_obj.footer.html_content
-        for key, value in vars_for_replace.items():
-            placeholder = f"{{{{{key}}}}}"
-            footer_html = footer_html.replace(placeholder, str(value))
-        html_content += footer_html
-    
-    # Generate unsubscribe link
-    if subscriber and hasattr(subscriber, 'uuid'):
-        unsubscribe_link = f"{site_url}/unsubscribe/{subscriber.uuid}/"
-    else:
-        unsubscribe_link = f"{site_url}/unsubscribe/"
-    
-    # Add ads if required
-    if show_ads:
-        # Render ad footer with site context; use RequestContext when request available
-        ctx = {'site_url': site_url, 'site_name': site_name, 'site_logo': site_logo}
-        ads_html = render_to_string(
-            'emails/ad_footer.html',
-            ctx,
-            request=request_obj if (request_obj is not None and hasattr(request_obj, 'get_host')) else None,
-        )
-        html_content += ads_html
-    
-    # Add unsubscribe link if required
-    if show_unsubscribe:
-        # Format user address for footer (required by CAN-SPAM, GDPR, etc.)
-        address_lines = []
-        # Add full name first if available
-        if user_profile.full_name:
-            address_lines.append(user_profile.full_name)
-        if user_profile.address_line1:
-            address_lines.append(user_profile.address_line1)
-        if user_profile.address_line2:
-            address_lines.append(user_profile.address_line2)
-        city_state = []
-        if user_profile.city:
-            city_state.append(user_profile.city)
-        if user_profile.state:
-            city_state.append(user_profile.state)
-        if city_state:
-            address_lines.append(', '.join(city_state))
-        postal_country = []
-        if user_profile.postal_code:
-            postal_country.append(user_profile.postal_code)
-        if user_profile.country:
-            postal_country.append(user_profile.country)
-        if postal_country:
-            address_lines.append(' '.join(postal_country))
-        
-        address_html = ''
-        if address_lines:
-            address_html = '<p style="font-size: 11px; color: #999; margin-top: 10px; line-height: 1.4;">' + '<br>'.join(address_lines) + '</p>'
-        
-        unsubscribe_html = f'<hr style="border: none; border-top: 1px solid #e0e0e0; margin: 20px 0;"><p style="font-size: 12px; color: #666; margin-top: 20px;">If you no longer wish to receive these emails, you can <a href="{unsubscribe_link}">unsubscribe here</a>.</p>{address_html}'
-        html_content += unsubscribe_html
-    
-    if html_content.strip():
-        text_content = _html_to_plain_text(html_content)
-    
+    from campaigns.rendering import render_email
+    from campaigns.tasks import SendContext
+
+    if context is None:
+        user = request_obj.user if request_obj else email_obj.campaign.user
+        context = SendContext(user, email_obj.campaign)
+    rendered = render_email(
+        email_obj,
+        context,
+        variables,
+        subscriber_email=subscriber.email if subscriber else '',
+        subscriber_uuid=getattr(subscriber, 'uuid', None),
+        preview=True,
+    )
+
     return {
-        'html': html_content,
-        'text': text_content,
-        'subject': subject,
+        'html': rendered.html,
+        'text': rendered.text,
+        'subject': rendered.subject,
     }
 
 
@@ -1055,7 +979,13 @@ def send_email_requests_list(request):
         profile.timezone = 'UTC'
         profile.save(update_fields=['timezone'])
 
-    requests_qs = EmailSendRequest.objects.filter(user=request.user).select_related('campaign', 'email', 'subscriber').order_by('-created_at')[:10]
+    requests_qs = list(
+        EmailSendRequest.objects.filter(user=request.user)
+        .select_related('campaign', 'email', 'email__campaign', 'email__footer', 'subscriber')
+        .order_by('-created_at')[:10]
+    )
+    # Cached per Email version, variables and recipient; only misses are rendered
+    previews = get_email_previews(requests_qs, request.user, profile)
 
     def format_datetime(dt):
         if not dt:
@@ -1070,13 +1000,7 @@ def send_email_requests_list(request):
         scheduled_iso, scheduled_display = format_datetime(req.scheduled_for)
         sent_iso, sent_display = format_datetime(req.sent_at)
         
-        # Generate email preview
-        preview = generate_email_preview(req.email, req.variables, req.subscriber, request)
-        
-        # Create preview snippet (first 200 chars of text, strip HTML)
-        import re as re_module
-        preview_text = re_module.sub(r'<[^>]+>', '', preview['html'])
-        preview_snippet = preview_text[:200] + ('...' if len(preview_text) > 200 else '')
+        preview = previews[req.id]
         
         data.append({
             'id': str(req.id),
@@ -1092,7 +1016,7 @@ def send_email_requests_list(request):
             'error_message': req.error_message or '',
             'email_preview_html': preview['html'],
             'email_preview_text': preview['text'],
-            'email_preview_snippet': preview_snippet,
+            'email_preview_snippet': preview['snippet'],
         })
 
     return Response({'requests': data, 'timezone': profile.timezone or 'UTC'})
@@ -16,6 +16,23 @@ Usage:
     python cron.py send_scheduled_emails
     python cron.py send_scheduled_emails --settings=dripemails.live
     python cron.py send_scheduled_emails --limit 100
+    python cron.py send_scheduled_emails --workers 8
+    
+    # Resident Send Scheduler (replaces polling send_scheduled_emails)
+    python cron.py run_scheduler
+    python cron.py run_scheduler --settings=dripemails.live --workers 4
+    
+    # Forecast Send Load (pending sends per hour ahead)
+    python cron.py forecast_sends
+    python cron.py forecast_sends --hours 48
+    
+    # Write Spooled Open/Click Events (EVENT_INGEST_MODE=spool)
+    python cron.py flush_events
+    python cron.py flush_events --periodic --interval 5
+    
+    # Recompute Campaign Counters From Tracking Events
+    python cron.py reconcile_counters
+    python cron.py reconcile_counters --campaign-id 3fa85f64-5717-4562-b3fc-2c963f66afa6
     
     # Process Gmail Emails
     python cron.py process_gmail_emails
@@ -52,6 +69,7 @@ import logging
 from datetime import datetime
 from logging.handlers import RotatingFileHandler
 import argparse
+import signal
 import time
 
 # Setup Django - Parse settings argument first
@@ -79,7 +97,7 @@ from django.contrib.auth.models import User
 from django.utils import timezone
 from analytics.models import UserProfile
 from campaigns.models import EmailSendRequest
-from campaigns.tasks import _send_single_email_sync
+from campaigns.dispatch import forecast_send_load, send_due_requests, SendScheduler
 
 # Import SPF utilities from core module
 try:
@@ -105,6 +123,10 @@ def detect_invoked_command(argv: List[str]) -> str:
     valid_commands = {
         'check_spf',
         'send_scheduled_emails',
+        'run_scheduler',
+        'forecast_sends',
+        'flush_events',
+        'reconcile_counters',
         'process_gmail_emails',
         'crawl_imap',
         'garbage_collect',
@@ -1075,81 +1097,101 @@ def crawl_imap(limit=None, email=None):
     logger.info(f"=" * 80)
 
 
-def send_scheduled_emails(limit=None):
+def send_scheduled_emails(limit=None, workers=1):
     """
     Process and send scheduled emails that are due to be sent.
     
-    Finds EmailSendRequest objects with status 'pending' or 'queued'
-    where scheduled_for <= now() and sends them.
-    """
-    now = timezone.now()
-    
-    # Find emails that are due to be sent
-    due_emails = EmailSendRequest.objects.filter(
-        status__in=['pending', 'queued'],
-        scheduled_for__lte=now
-    ).select_related('email', 'campaign', 'user', 'subscriber').order_by('scheduled_for')
+    Claims EmailSendRequest objects with status 'pending' (or 'queued' rows whose
+    claim has expired) where scheduled_for <= now() and sends them. Claims are
+    atomic, so several cron hosts can drain the same queue without double-sending;
+    they are taken one round (a batch per worker) at a time, so none outlives its
+    lease while earlier rounds are still being sent.
     
-    if limit:
-        due_emails = due_emails[:limit]
-    
-    total = due_emails.count()
-    logger.info(f"Found {total} scheduled emails due to be sent")
+    Args:
+        limit: Optional maximum number of requests to claim
+        workers: Number of sender threads; each delivers its own batches
+    """
+    # Claim emails that are due ('pending' -> 'queued') and render and deliver
+    # them over shared SMTP connections, round by round; each request is marked
+    # 'sent' or 'failed' and the next email in its sequence is scheduled
+    result = send_due_requests(limit=limit, workers=workers)
     
+    total = result['claimed']
     if total == 0:
         logger.info("No scheduled emails to send")
         return
     
-    sent_count = 0
-    failed_count = 0
-    
-    for send_request in due_emails:
-        try:
-            # Update status to 'queued' to prevent duplicate processing
-            send_request.status = 'queued'
-            send_request.save(update_fields=['status', 'updated_at'])
-            
-            # For IMAP auto-reply campaigns, retrieve the original email message
-            # so subsequent emails in the sequence can include the original email content
-            original_email_message = None
-            campaign_name_lower = send_request.campaign.name.lower() if send_request.campaign else ''
-            is_auto_reply = 'auto' in campaign_name_lower or 'reply' in campaign_name_lower
-            if is_auto_reply and send_request.variables:
-                original_email_id = send_request.variables.get('_original_email_id')
-                if original_email_id:
-                    from gmail.models import EmailMessage
-                    try:
-                        original_email_message = EmailMessage.objects.get(id=original_email_id)
-                        logger.info(f"Retrieved original email message {original_email_id} for scheduled email {send_request.id}")
-                    except EmailMessage.DoesNotExist:
-                        logger.warning(f"Original email message {original_email_id} not found for scheduled email {send_request.id}")
-            
-            # Send the email using the sync function
-            _send_single_email_sync(
-                str(send_request.email.id),
-                send_request.subscriber_email,
-                send_request.variables,
-                request_id=str(send_request.id),
-                original_email_message=original_email_message
-            )
-            
-            # The _send_single_email_sync function updates the status to 'sent' on success
-            sent_count += 1
-            logger.info(f"Sent scheduled email {send_request.id} to {send_request.subscriber_email}")
-            
-        except Exception as e:
-            # Update status to 'failed' on error
-            send_request.status = 'failed'
-            send_request.error_message = str(e)
-            send_request.save(update_fields=['status', 'error_message', 'updated_at'])
-            
-            failed_count += 1
-            logger.error(f"Failed to send scheduled email {send_request.id} to {send_request.subscriber_email}: {str(e)}")
-    
     logger.info(f"Scheduled Email Processing Summary:")
     logger.info(f"  Total due: {total}")
-    logger.info(f"  Successfully sent: {sent_count}")
-    logger.info(f"  Failed: {failed_count}")
+    logger.info(f"  Workers: {workers}")
+    logger.info(f"  Successfully sent: {result['sent']}")
+    logger.info(f"  Failed: {result['failed']}")
+    logger.info(f"  Throttled (rescheduled): {result['throttled']}")
+
+
+def run_scheduler(workers=1):
+    """
+    Run the resident send scheduler until SIGTERM/SIGINT.
+    
+    Keeps upcoming EmailSendRequest rows in memory and sends each one as soon as
+    it is due, instead of polling the table every cron interval. New requests are
+    picked up through the EmailSendRequest post_save notification hook.
+    
+    Args:
+        workers: Number of sender threads; each delivers its own batches
+    """
+    scheduler = SendScheduler(workers=workers)
+
+    def _handle_term(signum, frame):
+        logger.info("Received SIGTERM. Stopping send scheduler.")
+        scheduler.stop()
+
+    signal.signal(signal.SIGTERM, _handle_term)
+    try:
+        scheduler.run()
+    except KeyboardInterrupt:
+        logger.info("Send scheduler stopped by user")
+
+
+def forecast_sends(hours=24):
+    """
+    Log how many pending emails are due in each of the next ``hours`` hours.
+    
+    Campaigns that schedule their whole sequence at enrolment show up with
+    every future step, so the forecast covers whole drips.
+    """
+    forecast = forecast_send_load(hours=hours)
+    total = sum(count for _hour, count in forecast)
+    logger.info(f"Pending sends over the next {hours} hours: {total}")
+    for hour, count in forecast:
+        logger.info(f"  {hour:%Y-%m-%d %H:00} UTC  {count}")
+
+
+def flush_events():
+    """
+    Write the open/click events queued by the tracking endpoints.
+    
+    With EVENT_INGEST_MODE=spool the web processes only append events to the
+    spool file; this drains it into EmailEvent rows and campaign counters.
+    """
+    from campaigns.ingest import flush_events as flush_tracked_events
+
+    created = flush_tracked_events()
+    logger.info(f"Wrote {created} tracking events")
+
+
+def reconcile_counters(campaign_id=None):
+    """
+    Recompute campaign counters from EmailEvent rows.
+    
+    Fixes counters that drifted (increments lost to a crash while
+    CAMPAIGN_COUNTER_FLUSH_INTERVAL buffering was on, or double counting by
+    older code).
+    """
+    from campaigns.counters import reconcile_counters as reconcile_campaign_counters
+
+    corrected = reconcile_campaign_counters([campaign_id] if campaign_id else None)
+    logger.info(f"Reconciled counters of {len(corrected)} campaigns")
 
 
 def garbage_collect(limit=None):
@@ -1252,6 +1294,10 @@ def main():
 Available Commands:
   check_spf              Check SPF records for user domains to ensure email delivery
   send_scheduled_emails  Send queued emails that are ready to be delivered
+  run_scheduler          Stay resident and send each queued email as soon as it is due
+  forecast_sends         Show how many queued emails are due in each coming hour
+  flush_events           Write spooled open/click tracking events to the database
+  reconcile_counters     Recompute campaign sent/open/click/... counters from tracking events
   process_gmail_emails   Fetch Gmail emails and send auto-replies (Gmail Auto-Reply campaigns)
   crawl_imap             Fetch IMAP emails and send auto-replies (IMAP Auto-Reply campaigns)
   garbage_collect        Clean up old database records and optimize storage
@@ -1260,6 +1306,7 @@ Examples:
   python cron.py check_spf --all-users
   python cron.py send_scheduled_emails
     python cron.py send_scheduled_emails --periodic --interval 120
+  python cron.py run_scheduler --workers 4
   python cron.py process_gmail_emails --periodic --interval 120
   python cron.py crawl_imap --periodic --interval 120
   python cron.py garbage_collect --periodic --interval 86400
@@ -1268,14 +1315,17 @@ Examples:
     parser.add_argument('--settings', type=str, default='dripemails.settings',
                         help='Django settings module (default: dripemails.settings)')
     parser.add_argument('command', nargs='?', 
-                        choices=['check_spf', 'send_scheduled_emails', 'process_gmail_emails', 'crawl_imap', 'garbage_collect'],
+                        choices=['check_spf', 'send_scheduled_emails', 'run_scheduler', 'forecast_sends', 'flush_events', 'reconcile_counters', 'process_gmail_emails', 'crawl_imap', 'garbage_collect'],
                         help='Command to run')
     parser.add_argument('--user-id', type=int, help='Check SPF for specific user ID (check_spf only)')
     parser.add_argument('--all-users', action='store_true', help='Check SPF for all users (check_spf only)')
     parser.add_argument('--limit', type=int, help='Limit number of items to process')
     parser.add_argument('--email', type=str, help='Only process credentials for this email address (process_gmail_emails, crawl_imap)')
-    parser.add_argument('--periodic', action='store_true', help='Run continuously with periodic execution (send_scheduled_emails, process_gmail_emails, crawl_imap, garbage_collect)')
+    parser.add_argument('--periodic', action='store_true', help='Run continuously with periodic execution (send_scheduled_emails, flush_events, process_gmail_emails, crawl_imap, garbage_collect)')
     parser.add_argument('--interval', type=int, default=120, help='Interval in seconds between executions when using --periodic (default: 120 = 2 minutes)')
+    parser.add_argument('--workers', type=int, default=1, help='Number of parallel sender threads (send_scheduled_emails, run_scheduler; default: 1)')
+    parser.add_argument('--hours', type=int, default=24, help='Hours ahead to forecast (forecast_sends only; default: 24)')
+    parser.add_argument('--campaign-id', type=str, help='Only reconcile this campaign (reconcile_counters only)')
     
     args = parser.parse_args()
     
@@ -1300,7 +1350,7 @@ Examples:
                 while True:
                     try:
                         logger.info(f"Running scheduled email send cycle at {timezone.now()}")
-                        send_scheduled_emails(limit=args.limit)
+                        send_scheduled_emails(limit=args.limit, workers=args.workers)
                         logger.info(f"Completed scheduled email send cycle. Sleeping for {args.interval} seconds...")
                     except KeyboardInterrupt:
                         logger.info("Received interrupt signal. Stopping periodic execution.")
@@ -1314,7 +1364,33 @@ Examples:
                 logger.info("Periodic scheduled email sending stopped by user")
                 sys.exit(0)
         else:
-            send_scheduled_emails(limit=args.limit)
+            send_scheduled_emails(limit=args.limit, workers=args.workers)
+    elif args.command == 'run_scheduler':
+        run_scheduler(workers=args.workers)
+    elif args.command == 'forecast_sends':
+        forecast_sends(hours=max(args.hours, 1))
+    elif args.command == 'flush_events':
+        if args.periodic:
+            logger.info(f"Starting periodic event flushing (interval: {args.interval} seconds)")
+            try:
+                while True:
+                    try:
+                        flush_events()
+                    except KeyboardInterrupt:
+                        logger.info("Received interrupt signal. Stopping periodic execution.")
+                        raise
+                    except Exception as e:
+                        logger.error(f"Error in periodic event flush cycle: {str(e)}", exc_info=True)
+                        logger.info(f"Continuing despite error. Will retry in {args.interval} seconds...")
+                    
+                    time.sleep(args.interval)
+            except KeyboardInterrupt:
+                logger.info("Periodic event flushing stopped by user")
+                sys.exit(0)
+        else:
+            flush_events()
+    elif args.command == 'reconcile_counters':
+        reconcile_counters(campaign_id=args.campaign_id)
     elif args.command == 'process_gmail_emails':
         if args.periodic:
             logger.info(f"Starting periodic Gmail email processing (interval: {args.interval} seconds)")
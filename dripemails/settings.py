@@ -19,6 +19,38 @@ env = environ.Env(
     EMAIL_HOST_USER=(str, ''),
     EMAIL_HOST_PASSWORD=(str, ''),
     EMAIL_USE_TLS=(bool, False),
+    EMAIL_BATCH_SIZE=(int, 100),  # Messages delivered per SMTP session by the batch sender
+    ASYNC_SMTP_POOL_SIZE=(int, 10),  # Concurrent relay sessions of campaigns.backends.AsyncSMTPBackend
+    ASYNC_SMTP_SESSION_MESSAGES=(int, 100),  # Messages per async session before it is recycled
+    MX_DIRECT_PORT=(int, 25),  # SMTP port of MX hosts for campaigns.backends.MXDirectBackend
+    MX_DIRECT_POOL_SIZE=(int, 2),  # Warm sessions kept per MX host
+    MX_DIRECT_ROUTES=(dict, {}),  # domain=host:port routes that bypass MX lookups
+    MX_DIRECT_HELO_HOSTNAME=(str, ''),  # EHLO name for direct delivery (defaults to this host's FQDN)
+    MX_CACHE_MIN_TTL=(int, 60),  # Bounds on how long MX answers are cached (seconds)
+    MX_CACHE_MAX_TTL=(int, 3600),
+    SEND_CLAIM_LEASE_SECONDS=(int, 900),  # Reclaim 'queued' send requests after this long
+    SEND_SCHEDULER_WINDOW_SECONDS=(int, 600),  # How far ahead run_scheduler loads send requests
+    SEND_SCHEDULER_WINDOW_LIMIT=(int, 5000),  # Max send requests run_scheduler holds in memory
+    SEND_SCHEDULER_REFRESH_SECONDS=(int, 60),  # How often run_scheduler reloads its window
+    SEND_SCHEDULER_NOTIFY=(bool, True),  # Use PostgreSQL LISTEN/NOTIFY to wake run_scheduler
+    SEND_RATE_GLOBAL=(float, 0),  # Max messages/second across all recipients (0 = unlimited)
+    SEND_RATE_PER_DOMAIN=(float, 0),  # Default max messages/second per recipient domain (0 = unlimited)
+    SEND_RATE_DOMAINS=(dict, {}),  # Per-domain overrides, e.g. "gmail.com=5,outlook.com=3"
+    SEND_RATE_BURST_SECONDS=(float, 1),  # Seconds of rate a bucket may send in one burst
+    SEND_WINDOW_SLOT_SECONDS=(int, 300),  # Slot size (seconds) used to spread sends over a campaign's send window
+    SEND_RETRY_MAX_ATTEMPTS=(int, 5),  # Delivery attempts before a transient failure is final
+    SEND_RETRY_BASE_SECONDS=(int, 60),  # Backoff after the first transient failure
+    SEND_RETRY_MAX_SECONDS=(int, 3600),  # Backoff cap between retries
+    EMAIL_PREVIEW_CACHE_SECONDS=(int, 3600),  # How long rendered send-request previews are cached
+    EVENT_INGEST_MODE=(str, 'memory'),  # How open/click events reach the database: 'memory', 'spool' or 'sync'
+    EVENT_SPOOL_PATH=(str, ''),  # Spool file for EVENT_INGEST_MODE=spool (default: logs/events.spool)
+    EVENT_FLUSH_INTERVAL=(float, 2),  # Seconds between flushes of buffered events
+    EVENT_FLUSH_BATCH=(int, 500),  # Events written per batch (and buffered events that trigger an early flush)
+    EVENT_BUFFER_SIZE=(int, 100000),  # Max events buffered per process before the oldest are dropped
+    OPEN_DEDUPE_LRU_SIZE=(int, 50000),  # Recent (Email, recipient) opens remembered exactly per process
+    CAMPAIGN_COUNTER_FLUSH_INTERVAL=(float, 0),  # Seconds to sum campaign counter increments in memory before writing (0 = write each)
+    CAMPAIGN_COUNTER_SHARDS=(int, 0),  # Counter rows per campaign that increments are spread over (0 = the Campaign row itself)
+    CAMPAIGN_COUNTER_CACHE_SECONDS=(int, 5),  # How long summed counter shards are cached for reads
     DEFAULT_FROM_EMAIL=(str, 'DripEmails <noreply@dripemails.org>'),
     FOUNDERS_EMAIL=(str, 'founders@dripemails.org'),
     SITE_URL=(str, 'http://localhost:8000'),
@@ -301,6 +333,51 @@ EMAIL_HOST_USER = env('EMAIL_HOST_USER', default='')
 EMAIL_HOST_PASSWORD = env('EMAIL_HOST_PASSWORD', default='')
 EMAIL_USE_TLS = env('EMAIL_USE_TLS')
 DEFAULT_FROM_EMAIL = env('DEFAULT_FROM_EMAIL')
+# Batch sends reuse one SMTP connection for this many messages before reconnecting
+EMAIL_BATCH_SIZE = env('EMAIL_BATCH_SIZE')
+# EMAIL_BACKEND=campaigns.backends.AsyncSMTPBackend delivers batches concurrently over pooled sessions
+ASYNC_SMTP_POOL_SIZE = env('ASYNC_SMTP_POOL_SIZE')
+ASYNC_SMTP_SESSION_MESSAGES = env('ASYNC_SMTP_SESSION_MESSAGES')
+# EMAIL_BACKEND=campaigns.backends.MXDirectBackend delivers straight to recipient MX hosts
+MX_DIRECT_PORT = env('MX_DIRECT_PORT')
+MX_DIRECT_POOL_SIZE = env('MX_DIRECT_POOL_SIZE')
+MX_DIRECT_ROUTES = env('MX_DIRECT_ROUTES')
+MX_DIRECT_HELO_HOSTNAME = env('MX_DIRECT_HELO_HOSTNAME')
+MX_CACHE_MIN_TTL = env('MX_CACHE_MIN_TTL')
+MX_CACHE_MAX_TTL = env('MX_CACHE_MAX_TTL')
+# Send requests stuck in 'queued' (e.g. the claiming worker crashed) are retried after this many seconds
+SEND_CLAIM_LEASE_SECONDS = env('SEND_CLAIM_LEASE_SECONDS')
+# Resident scheduler (cron.py run_scheduler): in-memory window of upcoming send requests
+SEND_SCHEDULER_WINDOW_SECONDS = env('SEND_SCHEDULER_WINDOW_SECONDS')
+SEND_SCHEDULER_WINDOW_LIMIT = env('SEND_SCHEDULER_WINDOW_LIMIT')
+SEND_SCHEDULER_REFRESH_SECONDS = env('SEND_SCHEDULER_REFRESH_SECONDS')
+SEND_SCHEDULER_NOTIFY = env('SEND_SCHEDULER_NOTIFY')
+# Outbound throttling (messages/second); over-limit sends are rescheduled, not failed
+SEND_RATE_GLOBAL = env('SEND_RATE_GLOBAL')
+SEND_RATE_PER_DOMAIN = env('SEND_RATE_PER_DOMAIN')
+SEND_RATE_DOMAINS = env('SEND_RATE_DOMAINS')
+SEND_RATE_BURST_SECONDS = env('SEND_RATE_BURST_SECONDS')
+# Sends outside a campaign's send window are spread over the window's slots of this many seconds
+SEND_WINDOW_SLOT_SECONDS = env('SEND_WINDOW_SLOT_SECONDS')
+# Transient SMTP failures (4xx, dropped connections) are retried with jittered exponential backoff
+SEND_RETRY_MAX_ATTEMPTS = env('SEND_RETRY_MAX_ATTEMPTS')
+SEND_RETRY_BASE_SECONDS = env('SEND_RETRY_BASE_SECONDS')
+SEND_RETRY_MAX_SECONDS = env('SEND_RETRY_MAX_SECONDS')
+# Rendered previews in the send requests list, keyed by the email, footer and profile updated_at (any cache backend works)
+EMAIL_PREVIEW_CACHE_SECONDS = env('EMAIL_PREVIEW_CACHE_SECONDS')
+# Open/click tracking writes events behind the request (campaigns.ingest); 'spool' needs cron.py flush_events
+EVENT_INGEST_MODE = env('EVENT_INGEST_MODE')
+EVENT_SPOOL_PATH = env('EVENT_SPOOL_PATH')
+EVENT_FLUSH_INTERVAL = env('EVENT_FLUSH_INTERVAL')
+EVENT_FLUSH_BATCH = env('EVENT_FLUSH_BATCH')
+EVENT_BUFFER_SIZE = env('EVENT_BUFFER_SIZE')
+# Repeat opens of the same message are dropped in-process before they are queued (campaigns.dedupe)
+OPEN_DEDUPE_LRU_SIZE = env('OPEN_DEDUPE_LRU_SIZE')
+# Campaign counters are only ever incremented with UPDATE ... = col + n (campaigns.counters)
+CAMPAIGN_COUNTER_FLUSH_INTERVAL = env('CAMPAIGN_COUNTER_FLUSH_INTERVAL')
+# Spread counter increments over CampaignCounterShard rows to avoid one hot Campaign row during big sends
+CAMPAIGN_COUNTER_SHARDS = env('CAMPAIGN_COUNTER_SHARDS')
+CAMPAIGN_COUNTER_CACHE_SECONDS = env('CAMPAIGN_COUNTER_CACHE_SECONDS')
 FOUNDERS_EMAIL = env('FOUNDERS_EMAIL', default='founders@dripemails.org')
 
 # For local development on Windows, make authentication optional
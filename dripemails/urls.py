@@ -83,6 +83,7 @@ non_prefixed_urlpatterns = [
     path('analytics/message_split.gif', analytics_views.message_split_gif, name='message-split'),
     path('analytics/track/open/<uuid:tracking_id>/<str:encoded_email>/', analytics_views.track_open, name='track-open'),
     path('analytics/track/click/<uuid:tracking_id>/', analytics_views.track_click, name='track-click'),
+    path('c/<str:tracking_id>/<int:link_id>/', analytics_views.track_link_click, name='track-link-click'),
 ]
 
 # URL patterns that SHOULD be prefixed with a language code
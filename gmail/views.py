@@ -11,6 +11,7 @@ from rest_framework.decorators import api_view, permission_classes
 from rest_framework.permissions import IsAuthenticated, AllowAny
 from rest_framework.response import Response
 from .models import EmailCredential, EmailMessage, EmailProvider
+from campaigns.counters import COUNTER_FIELDS, add_counts, fold_counter_shards
 from campaigns.models import Campaign, Email
 from subscribers.models import List, Subscriber
 import logging
@@ -242,12 +243,11 @@ def _create_gmail_resources(user, credential):
         if duplicate_campaigns.exists():
             for duplicate_campaign in duplicate_campaigns:
                 # Preserve aggregate counters
-                canonical_campaign.sent_count += duplicate_campaign.sent_count
-                canonical_campaign.open_count += duplicate_campaign.open_count
-                canonical_campaign.click_count += duplicate_campaign.click_count
-                canonical_campaign.bounce_count += duplicate_campaign.bounce_count
-                canonical_campaign.unsubscribe_count += duplicate_campaign.unsubscribe_count
-                canonical_campaign.complaint_count += duplicate_campaign.complaint_count
+                fold_counter_shards(duplicate_campaign.pk)
+                duplicate_campaign.refresh_from_db(fields=COUNTER_FIELDS)
+                add_counts({canonical_campaign.pk: {
+                    field: getattr(duplicate_campaign, field) for field in COUNTER_FIELDS
+                }})
 
                 # Preserve campaign-linked records
                 Email.objects.filter(campaign=duplicate_campaign).update(campaign=canonical_campaign)
@@ -260,12 +260,6 @@ def _create_gmail_resources(user, credential):
             canonical_campaign.save(update_fields=[
                 'subscriber_list',
                 'is_active',
-                'sent_count',
-                'open_count',
-                'click_count',
-                'bounce_count',
-                'unsubscribe_count',
-                'complaint_count',
                 'updated_at'
             ])
 
@@ -416,12 +410,11 @@ def _create_imap_resources(user, credential):
 
         if duplicate_campaigns.exists():
             for duplicate_campaign in duplicate_campaigns:
-                canonical_campaign.sent_count += duplicate_campaign.sent_count
-                canonical_campaign.open_count += duplicate_campaign.open_count
-                canonical_campaign.click_count += duplicate_campaign.click_count
-                canonical_campaign.bounce_count += duplicate_campaign.bounce_count
-                canonical_campaign.unsubscribe_count += duplicate_campaign.unsubscribe_count
-                canonical_campaign.complaint_count += duplicate_campaign.complaint_count
+                fold_counter_shards(duplicate_campaign.pk)
+                duplicate_campaign.refresh_from_db(fields=COUNTER_FIELDS)
+                add_counts({canonical_campaign.pk: {
+                    field: getattr(duplicate_campaign, field) for field in COUNTER_FIELDS
+                }})
 
                 Email.objects.filter(campaign=duplicate_campaign).update(campaign=canonical_campaign)
                 duplicate_campaign.email_send_requests.update(campaign=canonical_campaign)
@@ -433,12 +426,6 @@ def _create_imap_resources(user, credential):
             canonical_campaign.save(update_fields=[
                 'subscriber_list',
                 'is_active',
-                'sent_count',
-                'open_count',
-                'click_count',
-                'bounce_count',
-                'unsubscribe_count',
-                'complaint_count',
                 'updated_at'
             ])
     
@@ -151,8 +151,13 @@ class SubscriberAdmin(admin.ModelAdmin):
     activate_subscribers.short_description = 'Activate selected subscribers'
     
     def deactivate_subscribers(self, request, queryset):
-        """Deactivate selected subscribers."""
+        """Deactivate selected subscribers and cancel their queued sequence emails."""
+        from campaigns.tasks import cancel_materialized_requests
+
+        ids = list(queryset.values_list('pk', flat=True))
         updated = queryset.update(is_active=False)
+        # update() sends no post_save, so the signal handler won't do this
+        cancel_materialized_requests(subscriber_ids=ids)
         self.message_user(request, f'{updated} subscriber(s) deactivated.')
     deactivate_subscribers.short_description = 'Deactivate selected subscribers'
     
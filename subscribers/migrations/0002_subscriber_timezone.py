@@ -0,0 +1,18 @@
+# Generated by Django 5.2.7 on 2026-10-16 21:10
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('subscribers', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='subscriber',
+            name='timezone',
+            field=models.CharField(blank=True, help_text="Used by campaigns that deliver in the subscriber's time zone", max_length=64, verbose_name='Time Zone'),
+        ),
+    ]
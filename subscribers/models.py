@@ -46,6 +46,7 @@ class Subscriber(models.Model):
     uuid = models.UUIDField(default=uuid.uuid4, editable=False, unique=True)
     first_name = models.CharField(_('First Name'), max_length=100, blank=True)
     last_name = models.CharField(_('Last Name'), max_length=100, blank=True)
+    timezone = models.CharField(_('Time Zone'), max_length=64, blank=True, help_text=_("Used by campaigns that deliver in the subscriber's time zone"))
     is_active = models.BooleanField(_('Active'), default=True)
     confirmed = models.BooleanField(_('Confirmed'), default=False)
     confirmation_sent_at = models.DateTimeField(_('Confirmation Sent At'), null=True, blank=True)
@@ -49,10 +49,17 @@ class SubscriberSerializer(serializers.ModelSerializer):
     
     class Meta:
         model = Subscriber
-        fields = ['id', 'email', 'uuid', 'first_name', 'last_name', 
+        fields = ['id', 'email', 'uuid', 'first_name', 'last_name', 'timezone',
                  'is_active', 'confirmed', 'created_at', 'updated_at', 
                  'custom_values', 'lists']
         read_only_fields = ['id', 'uuid', 'created_at', 'updated_at']
+
+    def validate_timezone(self, value):
+        import pytz
+
+        if value and value not in pytz.all_timezones_set:
+            raise serializers.ValidationError("Unknown time zone.")
+        return value
         
     def create(self, validated_data):
         """Create subscriber and associate with the list(s)."""
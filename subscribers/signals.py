@@ -1,4 +1,4 @@
-from django.db.models.signals import m2m_changed
+from django.db.models.signals import m2m_changed, post_save
 from django.dispatch import receiver
 from .models import Subscriber
 from campaigns.models import Campaign, Email, EmailEvent
@@ -90,3 +90,18 @@ def send_first_campaign_email_on_list_add(sender, instance, action, pk_set, **kw
                 f"Error sending first campaign email to {instance.email} for campaign {campaign.name}: {str(e)}",
                 exc_info=True
             )
+
+
+@receiver(post_save, sender=Subscriber)
+def cancel_sequences_of_inactive_subscriber(sender, instance, created, **kwargs):
+    """
+    Cancel the materialized campaign sends still waiting for a subscriber who unsubscribed.
+    """
+    if created or instance.is_active:
+        return
+
+    from campaigns.tasks import cancel_materialized_requests
+
+    cancelled = cancel_materialized_requests(subscriber_id=instance.pk)
+    if cancelled:
+        logger.info(f"Cancelled {cancelled} queued sequence emails for unsubscribed {instance.email}")